@@ -8,7 +8,7 @@ Parisa Babaei
 David Schoen
 
 Created: 2024-11-27
-Last Modified: 2024-12-30
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -16,103 +16,104 @@ URL: https://git.chalmers.se/courses/dit826/2024/group4
 License: MIT License (see LICENSE file for details)
 """
 
-import shutil
 from django.contrib import admin
 from .models import Dataset, TrainingJob, TrainedModel
 from django.utils.html import format_html
 from django.urls import path
 from django.shortcuts import redirect
 from django.contrib import messages
-import zipfile
 import os
-import matplotlib.pyplot as plt
 import tempfile
-from threading import Thread
-from django.db import transaction
 from django.conf import settings
 from django.http import HttpResponse
-from app.shared_state import get_event, clear_event
-from .retrain import retrain
-import time
+from app.shared_state import request_stop
+from .training_queue import queue_job, unqueue_job
+from . import inference_backends
+from .dataset_ingestion import queue_ingestion, estimate_extraction_seconds
 
-#Global variables
-MAX_EXTRACT_SIZE = 10000000000
-current_training_thread = None
+
+# Function to format a duration in seconds for the messages of the admin UI
+def format_duration(seconds):
+    value, unit = (max(1, round(seconds)), 'second') if seconds < 59.5 else (round(seconds / 60), 'minute')
+    return f"{value} {unit}{'' if value == 1 else 's'}"
 
 
 # Admin panel for the Dataset model
 @admin.register(Dataset)
 class DatasetAdmin(admin.ModelAdmin):
-    list_display = ('name', 'uploaded_at')
-
-    # Customize the form for adding/editing Dataset to include the data_file field
+    list_display = ('name', 'kind', 'ingestion_status', 'num_videos', 'duplicate_videos', 'uploaded_at')
+    readonly_fields = ('status', 'ingest_progress', 'error_message', 'num_videos', 'duplicate_videos')
+    actions = ['ingest_datasets']
+
+    # Display the status of the ingestion, with the progress while it runs
+    def ingestion_status(self, obj):
+        if obj.status == 'INGESTING':
+            return f"Ingesting ({obj.ingest_progress}%)"
+        if obj.status == 'ERROR':
+            return f"Error: {obj.error_message}"
+        return obj.status.capitalize()
+    ingestion_status.short_description = 'Status'
+
+    # Customize the form for adding/editing Dataset to include the data_file field.
+    # The ZIP file is checked and ingested by the training worker, so the upload doesn't wait for it.
     def save_model(self, request, obj, form, change):
+        # Datasets registered by convert_to_shards have no ZIP file to ingest
+        ingest = bool(obj.data_file) and (not change or obj.status != 'READY' or 'data_file' in form.changed_data or 'kind' in form.changed_data)
+        if ingest and obj.status != 'INGESTING':
+            # Training jobs can't use the dataset until the ingestion has finished
+            obj.status, obj.ingest_progress, obj.error_message, obj.claimed_by, obj.heartbeat_at = 'PENDING', 0, '', '', None
         super().save_model(request, obj, form, change)
-        zip_path = obj.data_file.path
-        extract_to = os.path.join(settings.MEDIA_ROOT, 'datasets', obj.name)
-
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Security: Check for path traversal
-                for member in zip_ref.namelist():
-                    member_path = os.path.join(extract_to, member)
-                    abs_member_path = os.path.abspath(member_path)
-                    if not abs_member_path.startswith(os.path.abspath(extract_to)):
-                        raise Exception("Attempted Path Traversal in ZIP File")
-
-                # Security: Check for ZIP bombs
-                total_size = sum([zinfo.file_size for zinfo in zip_ref.infolist()])
-                if total_size > MAX_EXTRACT_SIZE:
-                    raise Exception("Extracted content exceeds the maximum allowed size. size:" + str(total_size))
-
-                zip_ref.extractall(extract_to)
-        except Exception as e:
-            messages.set_level(request, messages.ERROR)
-            self.message_user(request, str(e), level=messages.ERROR)
-            obj.delete()
-            shutil.rmtree(extract_to, ignore_errors=True)
-            return
-
-        # Validate the dataset structure
-        extracted_items = os.listdir(extract_to)
-    
-        # Filter directories
-        extracted_dirs = [item for item in extracted_items if os.path.isdir(os.path.join(extract_to, item))]
-
-        if len(extracted_dirs) != 1:
-            # Delete the uploaded ZIP file
-            obj.data_file.delete(save=False)
-            # Delete the Dataset object from the database
-            obj.delete()
-            # Remove the extracted files
-            shutil.rmtree(extract_to, ignore_errors=True)
-            # Display error message
-            messages.set_level(request, messages.ERROR)
-            self.message_user(request, "The ZIP file must contain a single root directory containing the dataset.", level=messages.ERROR)
+        if not ingest:
             return
-        
-        obj.root_directory = os.path.join(extract_to, extracted_dirs[0])
-        obj.save()
 
-        # If validation passes
         messages.set_level(request, messages.SUCCESS)
-        self.message_user(request, 'Dataset uploaded and extracted successfully.', level=messages.SUCCESS)
+        self.message_user(request, 'Dataset uploaded. It is checked by the training worker and can be trained on once its status is Ready.', level=messages.SUCCESS)
+
+    # Ingest the selected datasets again, e.g. after the ingestion failed
+    def ingest_datasets(self, request, queryset):
+        count = 0
+        for dataset in queryset:
+            if dataset.data_file and dataset.status != 'INGESTING':
+                queue_ingestion(dataset.id)
+                count += 1
+        self.message_user(request, f"Queued {count} datasets for the ingestion by the training worker.", level=messages.SUCCESS)
+    ingest_datasets.short_description = 'Ingest the selected datasets again'
 
 
 # Admin panel for the TrainingJob model
 @admin.register(TrainingJob)
 class TrainingJobAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'dataset', 'status', 'started_at', 'completed_at', 'button')
+    list_display = ('id', 'name', 'dataset', 'status', 'epochs_completed', 'peak_memory_mb', 'claimed_by', 'started_at', 'completed_at', 'button')
     list_filter = ('status',)
     search_fields = ('id', 'dataset__name')
-    readonly_fields = ('started_at', 'completed_at')
+    readonly_fields = ('started_at', 'completed_at', 'queued_at', 'claimed_by', 'heartbeat_at', 'attempts', 'epochs_completed', 'estimated_extraction', 'peak_memory_mb', 'error_message')
+
+    # Display the peak memory of the job in MB
+    def peak_memory_mb(self, obj):
+        if obj.peak_memory is None:
+            return "-"
+        return f"{obj.peak_memory / 1024 ** 2:.0f} MB"
+    peak_memory_mb.short_description = 'Peak memory'
+
+    # Display the rough estimate of the landmark extraction time that was made when the job was queued
+    def estimated_extraction(self, obj):
+        if obj.estimated_duration is None:
+            return "-"
+        return f"about {format_duration(obj.estimated_duration)}"
+    estimated_extraction.short_description = 'Estimated extraction time'
+
+    # Only datasets that are ready can be trained on
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'dataset':
+            kwargs['queryset'] = Dataset.objects.filter(status='READY')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     # Customize the form for adding/editing TrainingJob
     def get_readonly_fields(self, request, obj=None):
         # editing an existing object
         if obj:
             if obj.status != 'PENDING':
-                return  ('dataset', 'base_model',  'status', 'output_model' ) + self.readonly_fields
+                return  ('dataset', 'base_model',  'status', 'output_model', 'extraction_workers' ) + self.readonly_fields
         return self.readonly_fields
 
     # Add custom start and stop buttons to the admin panel
@@ -124,116 +125,51 @@ class TrainingJobAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
-    # Start the training job
+    # Queue the training job, a training worker picks it up
     def start_job(self, request, job_id):
-        try:
-            # Global variable to check if another training job is already running
-            global current_training_thread
-
-            # Here we get the TrainingJob object as a variable and change its status to 'IN_PROGRESS'
-            job = TrainingJob.objects.get(id=job_id)
-            job.status = 'IN_PROGRESS'
-            job.save()
-
-            if current_training_thread is None:
-                # Start the training job in a separate thread
-                get_event(job_id)
-                current_training_thread = Thread(target=self._train_model_in_background, args=(request, job_id,))
-                current_training_thread.start()
-                self.message_user(request, "Training job started in background.", level=messages.SUCCESS)
-            else:
-                self.message_user(request, "Another training job is currently running. Cannot start another.", level=messages.WARNING)
-                return redirect('/admin/app/trainingjob/')
-
-        except Exception as e:
-            job.status = 'ERROR'
-            job.save()
-            self.message_user(request, str("An error occured, error message: " + e), level=messages.ERROR)
+        if queue_job(job_id):
+            message = "Training job queued. It starts as soon as a training worker is free."
+            job = TrainingJob.objects.select_related('dataset', 'base_model').get(id=job_id)
+            estimate = estimate_extraction_seconds(job)
+            if estimate is not None:
+                TrainingJob.objects.filter(id=job_id).update(estimated_duration=estimate)
+                # A rough estimate, the times are measured on the predictions of the web server, not on the worker
+                message += f" As a rough estimate, extracting the landmarks takes about {format_duration(estimate)}."
+            self.message_user(request, message, level=messages.SUCCESS)
+        else:
+            self.message_user(request, "The job can't be started, it is already queued, running or completed.", level=messages.WARNING)
 
         # Redirect back to the change list
         return redirect('/admin/app/trainingjob/')
-    
+
     # Stop the training job
     def stop_job(self, request, job_id):
-        """Stop the job by setting the stop flag and returning to PENDING."""
-        try:
-            # Global variable to check if another training job is already running
-            global current_training_thread
-
-            job = TrainingJob.objects.get(id=job_id)
-
-            # Check if the job is currently running
-            if job.status != 'IN_PROGRESS':
-                self.message_user(request, "The job is not currently running.", level=messages.WARNING)
-                return redirect('/admin/app/trainingjob/')
-
-            # Wait for the training thread to stop
-            if current_training_thread is not None and current_training_thread.is_alive():
-                    # Set the stop event
-                    get_event(job_id).set()
-                    # Wait for the thread to stop, which should happen promptly because of the stop flag
-                    current_training_thread.join()
-            else:
-                self.message_user(request, "No training job is currently running.", level=messages.WARNING)
-                
-
-            # Reset job status to 'PENDING' after the job is stopped
-            job.status = 'PENDING'
-            job.save()  
-            # Clear the stop event
-            clear_event(job_id)
-            # Depending on the implementation, we may want to delete the output model file here
-            
-            # Display success message
-            self.message_user(request, "Training job stopped successfully.", level=messages.SUCCESS)
-
-        except Exception as e:
-            job.status = 'ERROR'
-            job.save()
-            self.message_user(request, f"An error occurred: {e}", level=messages.ERROR)
-
-        # Redirect back to the change list 
-        return redirect('/admin/app/trainingjob/')       
-    
-    # Function to train the model in the background
-    def _train_model_in_background(self, request, job_id):
-        """Function to ensure database integrity when a thread is opened. """
-        try:
-            # Ensure database integrity
-            with transaction.atomic():
-                retrain(job_id)
-                i = 0
-                while (i > 10):
-                    print(i)
-                    time.sleep(1) #this doesn't really work it seems, likely because _train_model_in_background is being executed by non-main thread
-                    i += 1
-                job = TrainingJob.objects.get(id=job_id)
-                job.status = 'COMPLETED'
-                job.save()
-                self.message_user(request, "The training has been completed", level=messages.SUCCESS)
-    
-        except Exception as e:
-            # Log error as status in the database
-            job = TrainingJob.objects.get(id=job_id)
-            job.status = 'ERROR'
-            job.save()
-
-            print(f"Error during training: {e}")
-        finally:
-            global current_training_thread
-            current_training_thread = None
-    
-    
+        """Take a queued job out of the queue, or ask the worker to stop a running job."""
+        if unqueue_job(job_id):
+            self.message_user(request, "Training job removed from the queue.", level=messages.SUCCESS)
+        elif request_stop(job_id):
+            # The worker sets the job back to PENDING once it has stopped
+            self.message_user(request, "Stop requested. The training worker stops the job shortly.", level=messages.SUCCESS)
+        else:
+            self.message_user(request, "The job is not currently running.", level=messages.WARNING)
+
+        # Redirect back to the change list
+        return redirect('/admin/app/trainingjob/')
+
     # Add a custom button to the admin panel to start or stop the training job
     def button(self, obj):
         if obj.status == 'PENDING':
             return format_html('<a class="button" href="{}">Start</a>', f'start/{obj.id}/')
+        elif obj.status == 'QUEUED':
+            return format_html('<a class="button" href="{}">Cancel</a>', f'stop/{obj.id}/')
+        elif obj.status == 'IN_PROGRESS' and obj.cancel_requested:
+            return format_html('<a class="button" href="{}" disabled>Stopping...</a>', f'')
         elif obj.status == 'IN_PROGRESS':
             return format_html('<a class="button" href="{}">Stop</a>', f'stop/{obj.id}/')
         elif obj.status == 'COMPLETED':
             return format_html('<a class="button" href="{}" disabled>Completed</a>', f'')
         else:
-            return format_html('<a class="button" href="{}" disabled>ERROR</a>', f'')
+            return format_html('<a class="button" href="{}">Retry</a>', f'start/{obj.id}/')
     
 
     button.allow_tags = True
@@ -242,16 +178,23 @@ class TrainingJobAdmin(admin.ModelAdmin):
 # Admin panel for the TrainedModel model
 @admin.register(TrainedModel)
 class TrainedModelAdmin(admin.ModelAdmin):
-    list_display = ('name', 'accuracy_percentage', 'uploaded_at')
-    readonly_fields = ('uploaded_at',)
+    list_display = ('name', 'accuracy_percentage', 'top_k_accuracy_percentage', 'backend', 'uploaded_at')
+    readonly_fields = ('uploaded_at', 'tflite_file')
     search_fields = ('name',)
-    actions = ['create_accuracy_graph']
+    actions = ['create_accuracy_graph', 'create_confusion_matrix', 'export_tflite']
 
     # Display accuracy as a percentage
     def accuracy_percentage(self, obj):
         return f"{obj.accuracy * 100:.2f}%"
     accuracy_percentage.short_description = 'Accuracy'
 
+    # Display the top-k accuracies as percentages
+    def top_k_accuracy_percentage(self, obj):
+        if not obj.top_k_accuracy:
+            return "-"
+        return ", ".join(f"top-{k}: {accuracy * 100:.2f}%" for k, accuracy in sorted(obj.top_k_accuracy.items(), key=lambda item: int(item[0])))
+    top_k_accuracy_percentage.short_description = 'Top-k accuracy'
+
     # Customize the form for adding/editing TrainedModel to include the model_file field
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
@@ -266,6 +209,8 @@ class TrainedModelAdmin(admin.ModelAdmin):
 
     # Create a graph of the accuracy by word for the selected models
     def create_accuracy_graph(self, request, queryset):
+        import matplotlib.pyplot as plt
+
         words = set()
         model_accuracies = {}
 
@@ -306,3 +251,54 @@ class TrainedModelAdmin(admin.ModelAdmin):
             return response
 
     create_accuracy_graph.short_description = 'Create accuracy graph for selected models'
+
+    # Create a plot of the stored confusion matrix of the selected model
+    def create_confusion_matrix(self, request, queryset):
+        import matplotlib.pyplot as plt
+
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one model to plot its confusion matrix", level=messages.ERROR)
+            return
+        model = queryset.first()
+        if not model.confusion_matrix:
+            self.message_user(request, f"Model '{model.name}' has no confusion matrix", level=messages.ERROR)
+            return
+
+        words = model.words.split(',')
+        size = max(5, len(words) * 0.5)
+        plt.figure(figsize=(size, size))
+        plt.imshow(model.confusion_matrix, cmap='Blues')
+        plt.colorbar()
+        plt.xticks(range(len(words)), words, rotation=45, ha='right')
+        plt.yticks(range(len(words)), words)
+        plt.xlabel('Predicted word')
+        plt.ylabel('True word')
+        plt.title(f'Confusion Matrix for {model.name}')
+        plt.tight_layout()
+
+        # Save the graph to a temporary file
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmpfile:
+            plt.savefig(tmpfile.name)
+            plt.close()
+            tmpfile.seek(0)
+            response = HttpResponse(tmpfile.read(), content_type="image/png")
+            response['Content-Disposition'] = 'inline; filename="confusion_matrix.png"'
+            return response
+
+    create_confusion_matrix.short_description = 'Create confusion matrix for selected model'
+
+    # Export the selected models to TFLite, the file is stored next to the .keras file
+    def export_tflite(self, request, queryset):
+        from keras.models import load_model
+
+        for model in queryset:
+            try:
+                inference_backends.export_tflite(load_model(model.model_file.path), os.path.splitext(model.model_file.path)[0] + '.tflite')
+            except Exception as e:
+                self.message_user(request, f"Failed to export '{model.name}': {e}", level=messages.ERROR)
+                continue
+            model.tflite_file.name = os.path.splitext(model.model_file.name)[0] + '.tflite'
+            model.save(update_fields=['tflite_file'])
+            self.message_user(request, f"Exported '{model.name}' to {model.tflite_file.name}", level=messages.SUCCESS)
+
+    export_tflite.short_description = 'Export selected models to TFLite'
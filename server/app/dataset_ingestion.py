@@ -0,0 +1,179 @@
+"""
+File: dataset_ingestion.py
+Description: Source code for ingesting uploaded datasets in the background.
+Uploaded datasets wait as PENDING until a training worker (see training_queue.py) claims and ingests them,
+so an ingestion isn't lost when the web server restarts. Datasets of a worker that stopped sending
+heartbeats are put back into the queue.
+The ZIP file of a video dataset isn't extracted, the training reads the videos from it
+(see model_training/dataset_archive.py). Landmark shards are extracted, as they are memory mapped.
+Video datasets get a manifest of their videos (see model_training/dataset_manifest.py).
+The status and progress of the ingestion are stored on the Dataset and shown in the admin UI.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import sys
+import shutil
+import logging
+import zipfile
+from threading import Thread
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from .models import Dataset
+
+sys.path.insert(1, 'model_training/')
+import dataset_archive
+import dataset_manifest
+
+logger = logging.getLogger('asl')
+
+DETECTOR_PATH = './models/hand_landmarker.task'
+
+
+# Function to extract every member of a ZIP file, and report the progress in percent
+def _extract(zip_ref, extract_to, on_progress):
+    members = zip_ref.infolist()
+    total_size = max(1, sum(member.file_size for member in members))
+    extracted_size = 0
+    for member in members:
+        zip_ref.extract(member, extract_to)
+        extracted_size += member.file_size
+        on_progress(int(100 * extracted_size / total_size))
+
+
+# Check the ZIP file of a dataset, and index its videos or extract its landmark shards.
+# Returns True if the dataset is ready to be trained on, otherwise the error is stored on the dataset.
+def ingest_dataset(dataset_id):
+    datasets = Dataset.objects.filter(id=dataset_id)
+    dataset = datasets.get()
+    datasets.update(status='INGESTING', ingest_progress=0, error_message='')
+    extract_to = os.path.join(settings.MEDIA_ROOT, 'datasets', dataset.name)
+    progress = [0]
+
+    def on_progress(percent):
+        # Only write to the database when the percentage changes
+        if percent != progress[0]:
+            progress[0] = percent
+            datasets.update(ingest_progress=percent)
+
+    try:
+        zip_path = dataset.data_file.path
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            root_dir = dataset_archive.check_archive(zip_ref, extract_to)
+            if dataset.kind == 'shards':
+                from landmark_shards import read_index
+                shutil.rmtree(extract_to, ignore_errors=True)
+                _extract(zip_ref, extract_to, on_progress)
+                root_directory = os.path.join(extract_to, root_dir)
+                read_index(root_directory)
+
+        manifest = None
+        if dataset.kind != 'shards':
+            # The videos are read from the ZIP file, so it only has to contain the folders of the words
+            root_directory = os.path.join(zip_path, root_dir)
+            if not any(dataset_archive.isdir(os.path.join(root_directory, item)) for item in dataset_archive.listdir(root_directory)):
+                raise ValueError("The root directory of the ZIP file doesn't contain a folder for any word.")
+            manifest = dataset_manifest.build_manifest(root_directory, lambda done, total: on_progress(int(100 * done / total)))
+            dataset_manifest.write_manifest(root_directory, manifest)
+    except Exception as e:
+        logger.error(f"Ingesting dataset {dataset.name} failed: {e}")
+        if dataset.kind == 'shards':
+            shutil.rmtree(extract_to, ignore_errors=True)
+        datasets.update(status='ERROR', error_message=str(e), claimed_by='')
+        return False
+
+    if manifest is not None:
+        duplicates = sum(len(group) - 1 for group in manifest['duplicates'])
+        if duplicates:
+            logger.warning(f"Dataset {dataset.name} contains {duplicates} duplicate videos, they are skipped in training")
+        datasets.update(num_videos=len(manifest['videos']), duplicate_videos=duplicates)
+    datasets.update(status='READY', ingest_progress=100, root_directory=root_directory, claimed_by='')
+    logger.info(f"Dataset {dataset.name} is ready")
+    return True
+
+
+# Roughly estimate how long (in seconds) a training job takes to extract the landmarks of its dataset,
+# from the dataset manifest and the decode and detection times measured in this process.
+# These are the times of the predictions of the web server, the worker's extraction can be faster or slower.
+# Returns None if the dataset has no manifest.
+def estimate_extraction_seconds(job):
+    from landmark_cache import LandmarkCache
+    from . import metrics
+
+    if job.dataset.kind != 'videos' or job.base_model is None:
+        return None
+    manifest = dataset_manifest.read_manifest(job.dataset.root_directory)
+    if manifest is None:
+        return None
+
+    seconds_per_frame = dataset_manifest.SECONDS_PER_FRAME
+    decode_count, decode_sum = metrics.frame_duration.get(stage='decode')
+    detection_count, detection_sum = metrics.frame_duration.get(stage='detection')
+    if decode_count and detection_count:
+        seconds_per_frame = decode_sum / decode_count + detection_sum / detection_count
+    try:
+        cache = LandmarkCache(DETECTOR_PATH)
+    except OSError:
+        cache = None
+    return dataset_manifest.estimate_extraction_seconds(manifest, job.base_model.words.split(','), cache,
+                                                        job.extraction_workers, seconds_per_frame)
+
+
+# Put a dataset into the ingestion queue, a training worker ingests it
+def queue_ingestion(dataset_id):
+    Dataset.objects.filter(id=dataset_id).exclude(status='INGESTING').update(
+        status='PENDING', ingest_progress=0, error_message='', claimed_by='', heartbeat_at=None
+    )
+
+# Claim the oldest dataset that waits for its ingestion. Returns the id of the dataset, or None if there is none.
+def claim_next_dataset(worker_id):
+    pending = Dataset.objects.filter(status='PENDING').exclude(data_file='').order_by('uploaded_at', 'id')
+    for dataset_id in pending.values_list('id', flat=True):
+        # Only one worker can change the status from PENDING, the others update no rows
+        if Dataset.objects.filter(id=dataset_id, status='PENDING').update(
+                status='INGESTING', ingest_progress=0, claimed_by=worker_id, heartbeat_at=timezone.now()):
+            return dataset_id
+    return None
+
+# Put the datasets of workers that stopped sending heartbeats, e.g. because they were restarted, back into the queue
+def requeue_stale_datasets(heartbeat_timeout):
+    deadline = timezone.now() - timedelta(seconds=heartbeat_timeout)
+    stale = Dataset.objects.filter(Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True), status='INGESTING')
+    for dataset in stale:
+        logger.warning(f"Requeuing the ingestion of dataset {dataset.name}, worker {dataset.claimed_by or 'unknown'} stopped responding")
+        release_dataset(dataset.id, dataset.claimed_by)
+
+# Put a dataset that a worker stopped ingesting back into the queue
+def release_dataset(dataset_id, worker_id):
+    Dataset.objects.filter(id=dataset_id, status='INGESTING', claimed_by=worker_id).update(
+        status='PENDING', ingest_progress=0, claimed_by='', heartbeat_at=None
+    )
+
+
+def _run_ingestion(dataset_id):
+    try:
+        ingest_dataset(dataset_id)
+    except Exception as e:
+        logger.error(f"Ingesting dataset {dataset_id} failed: {e}")
+        Dataset.objects.filter(id=dataset_id, status='INGESTING').update(status='ERROR', error_message=str(e), claimed_by='')
+    finally:
+        close_old_connections()
+
+# Ingest a claimed dataset in a background thread of the worker
+def start_ingestion(dataset_id):
+    thread = Thread(target=_run_ingestion, args=(dataset_id,), name=f'asl-ingest-{dataset_id}', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,162 @@
+"""
+File: inference_backends.py
+Description: Source code for the backends that run the forward pass of a model.
+- keras: Keras `model.predict`, works with every model
+- tf_function: the model compiled once into a tf.function with a fixed input signature
+- tflite: the model exported to TensorFlow Lite, by far the fastest for the small LSTM models
+The backend is chosen per TrainedModel. A faster backend is only used after its outputs were
+compared against Keras, otherwise the registry falls back to Keras.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import logging
+from threading import Lock
+import numpy as np
+
+# Largest difference between the probabilities of Keras and another backend that is still accepted
+PARITY_TOLERANCE = float(os.getenv('INFERENCE_PARITY_TOLERANCE', '1e-4'))
+# Number of random clips per sequence length that are compared
+PARITY_SAMPLES = int(os.getenv('INFERENCE_PARITY_SAMPLES', '4'))
+
+logger = logging.getLogger('asl')
+
+
+# Raised when a backend doesn't give the same outputs as Keras
+class BackendParityError(ValueError):
+    pass
+
+
+# Keras model.predict, the reference for the other backends
+class KerasBackend:
+    name = 'keras'
+
+    def __init__(self, model):
+        self.model = model
+
+    # Predict a (batch, frames, features) array, returns (batch, words) probabilities
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+# The model called in a tf.function. The signature allows any batch size and length,
+# so the function is traced once instead of once per batch shape, without the overhead of predict.
+class TFFunctionBackend:
+    name = 'tf_function'
+
+    def __init__(self, model, num_features):
+        import tensorflow as tf
+        self.model = model
+        self._function = tf.function(
+            lambda landmarks: model(landmarks, training=False),
+            input_signature=[tf.TensorSpec([None, None, num_features], tf.float32)],
+            autograph=False,
+        )
+
+    def predict(self, batch):
+        return self._function(batch).numpy()
+
+
+# A model exported with export_tflite. The interpreter is resized once per sequence length.
+class TFLiteBackend:
+    name = 'tflite'
+
+    def __init__(self, path):
+        self.path = path
+        self._interpreters = {}
+        self._lock = Lock()
+
+    def _get_interpreter(self, length):
+        interpreter = self._interpreters.get(length)
+        if interpreter is None:
+            interpreter = load_tflite_interpreter(self.path)
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, [1, length, interpreter.get_input_details()[0]['shape'][2]])
+            interpreter.allocate_tensors()
+            self._interpreters[length] = interpreter
+        return interpreter
+
+    def predict(self, batch):
+        # The exported model has a batch size of 1, the clips are small enough to run one by one
+        with self._lock:
+            interpreter = self._get_interpreter(batch.shape[1])
+            input_index = interpreter.get_input_details()[0]['index']
+            output_index = interpreter.get_output_details()[0]['index']
+            outputs = []
+            for landmarks in batch:
+                interpreter.set_tensor(input_index, landmarks[np.newaxis].astype(np.float32, copy=False))
+                interpreter.invoke()
+                outputs.append(interpreter.get_tensor(output_index)[0].copy())
+        return np.stack(outputs)
+
+
+# Function to create a TFLite interpreter, with the standalone LiteRT package if it is installed
+def load_tflite_interpreter(path):
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=path)
+
+
+# Function to export a Keras model to TFLite. The input is (1, frames, features) with a variable number of frames.
+def export_tflite(model, output_path):
+    import tensorflow as tf
+    # The LSTM reads its weights inside a while loop, which TFLite can only run if the weights are constants
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    num_features = model.input_shape[-1]
+    function = tf.function(
+        lambda landmarks: model(landmarks, training=False),
+        input_signature=[tf.TensorSpec([1, None, num_features], tf.float32)],
+        autograph=False,
+    )
+    frozen = convert_variables_to_constants_v2(function.get_concrete_function())
+    tflite_model = tf.lite.TFLiteConverter.from_concrete_functions([frozen]).convert()
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(tflite_model)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+# Function to create the backend for a model
+def create_backend(name, model, num_features, tflite_path=None):
+    if name == KerasBackend.name:
+        return KerasBackend(model)
+    if name == TFFunctionBackend.name:
+        return TFFunctionBackend(model, num_features)
+    if name == TFLiteBackend.name:
+        if not tflite_path or not os.path.exists(tflite_path):
+            raise ValueError("The model has not been exported to TFLite")
+        return TFLiteBackend(tflite_path)
+    raise ValueError(f"Unknown inference backend: {name}")
+
+
+# Function to compare a backend with Keras on random clips of every length.
+# The clips are zero padded like real requests. Returns the largest difference, raises BackendParityError if it is too large.
+def check_parity(model, backend, num_features, lengths, samples=PARITY_SAMPLES, tolerance=PARITY_TOLERANCE):
+    rng = np.random.default_rng(0)
+    max_difference = 0.0
+    for length in lengths:
+        batch = rng.random((samples, length, num_features), dtype=np.float32)
+        for i, frames in enumerate(rng.integers(1, length + 1, size=samples)):
+            batch[i, frames:] = 0
+        expected = model.predict(batch, verbose=0)
+        max_difference = max(max_difference, float(np.abs(backend.predict(batch) - expected).max()))
+
+    if max_difference > tolerance:
+        raise BackendParityError(f"The {backend.name} backend differs from Keras by {max_difference:.2e} (tolerance {tolerance:.0e})")
+    return max_difference
@@ -0,0 +1,147 @@
+"""
+File: convert_to_shards.py
+Description: Management command which converts a video dataset or the recordings of the end-users
+into a landmark shard dataset, so training jobs on it don't have to decode the videos again.
+Recordings that were saved with their landmarks (<hash>.npy) aren't run through the detector.
+
+Usage: python manage.py convert_to_shards <output directory> (--dataset <name> | --recordings [<directory>])
+       [--words eat,no] [--dtype float16] [--workers 4] [--detect] [--fps 20] [--register <dataset name>]
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from app.models import Dataset, TrainedModel
+from app.recording_archiver import RECORDINGS_DIR
+import numpy as np
+import os
+import sys
+
+sys.path.insert(1, 'model_training/')
+import data_prep as prep
+import dataset_archive
+from landmark_shards import ShardWriter, DTYPES, SHARD_FRAMES
+
+DETECTOR_PATH = './models/hand_landmarker.task'
+
+
+# Function to list the recordings of every word as (word, video file, video path), and the ones
+# with saved landmarks as (word, video file, landmarks path). Landmarks without a video are always saved ones.
+def list_recordings(words, path, detect=False):
+    videos = []
+    saved = []
+    for word in words:
+        word_path = os.path.join(path, word)
+        files = sorted(os.listdir(word_path))
+        video_names = {os.path.splitext(file)[0] for file in files if not file.endswith('.npy')}
+        for video_file in files:
+            if video_file.endswith('.npy'):
+                # Recordings of landmarks that were detected by the client have no video
+                if os.path.splitext(video_file)[0] not in video_names:
+                    saved.append((word, video_file, os.path.join(word_path, video_file)))
+                continue
+            landmarks_path = os.path.join(word_path, os.path.splitext(video_file)[0] + '.npy')
+            if not detect and os.path.exists(landmarks_path):
+                saved.append((word, video_file, landmarks_path))
+            else:
+                videos.append((word, video_file, os.path.join(word_path, video_file)))
+    return videos, saved
+
+
+class Command(BaseCommand):
+    help = "Convert a video dataset or the recordings into a landmark shard dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Directory to write the shards to")
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--dataset', help="Name of the video dataset to convert")
+        source.add_argument('--recordings', nargs='?', const=RECORDINGS_DIR, help=f"Recordings directory to convert (default: {RECORDINGS_DIR})")
+        parser.add_argument('--words', help="Comma separated words to convert (default: all words)")
+        parser.add_argument('--dtype', choices=DTYPES, default='float32', help="float16 halves the size of the shards")
+        parser.add_argument('--shard-frames', type=int, default=SHARD_FRAMES, help="Number of frames in a shard")
+        parser.add_argument('--workers', type=int, default=1, help="Number of processes that extract landmarks from the videos")
+        parser.add_argument('--detect', action='store_true', help="Detect the landmarks of recordings again instead of using the saved ones")
+        parser.add_argument('--fps', type=float, help=(
+            "Sample the videos to this fps before detecting the landmarks "
+            "(default: the fps of the active model for recordings, every frame for datasets)"
+        ))
+        parser.add_argument('--register', metavar='NAME', help="Add the shards as a dataset with this name")
+
+    def handle(self, *args, **options):
+        if options['register'] and Dataset.objects.filter(name=options['register']).exists():
+            raise CommandError(f"Dataset '{options['register']}' already exists")
+
+        if options['dataset']:
+            try:
+                dataset = Dataset.objects.get(name=options['dataset'])
+            except Dataset.DoesNotExist:
+                raise CommandError(f"Dataset '{options['dataset']}' does not exist")
+            if dataset.kind != 'videos':
+                raise CommandError(f"Dataset '{dataset.name}' doesn't contain videos")
+            path = dataset.root_directory
+        else:
+            path = options['recordings']
+        if not dataset_archive.isdir(path):
+            raise CommandError(f"{path} is not a directory")
+
+        if options['words']:
+            words = options['words'].split(',')
+        else:
+            words = sorted(item for item in dataset_archive.listdir(path) if dataset_archive.isdir(os.path.join(path, item)))
+
+        if options['dataset']:
+            videos, saved = prep.list_videos(words, path), []
+        else:
+            videos, saved = list_recordings(words, path, options['detect'])
+
+        # The saved landmarks of recordings are sampled at the fps of the model that predicted them,
+        # so the recordings that are detected here have to be sampled the same way
+        target_fps = options['fps']
+        if target_fps is None and not options['dataset']:
+            active_model = TrainedModel.objects.filter(is_active=True).first()
+            target_fps = active_model.fps if active_model is not None and active_model.fps else None
+            if target_fps is None and videos:
+                raise CommandError("There is no active model with an fps, set the fps of the recordings with --fps")
+
+        try:
+            writer = ShardWriter(options['output'], dtype=options['dtype'], shard_frames=options['shard_frames'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        with writer:
+            # Recordings that were saved with their landmarks, at the fps of the model that predicted them
+            for word, video_file, landmarks_path in saved:
+                landmarks = np.load(landmarks_path)
+                if len(landmarks) == 0:
+                    writer.skip(word, os.path.join(word, video_file), "No landmarks detected")
+                else:
+                    writer.add(landmarks, word, source=os.path.join(word, video_file))
+
+            # The detector is only loaded if there are videos to detect
+            results = prep.iter_landmarks(videos, DETECTOR_PATH, workers=options['workers'], target_fps=target_fps) if videos else []
+            for (word, video_file, _), (result, error) in zip(videos, results):
+                source = os.path.join(word, video_file)
+                if error is not None:
+                    writer.skip(word, source, error)
+                elif len(result[0]) == 0:
+                    writer.skip(word, source, "No landmarks detected")
+                else:
+                    landmarks, _, num_frames = result
+                    writer.add(landmarks, word, source=source, num_frames=int(num_frames), fps=target_fps)
+
+        if options['register']:
+            Dataset.objects.create(name=options['register'], kind='shards', root_directory=os.path.abspath(options['output']))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(writer.samples)} samples in {len(writer.shards)} shards to {options['output']} "
+            f"({len(writer.skipped)} skipped)"
+        ))
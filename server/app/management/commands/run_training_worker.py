@@ -0,0 +1,57 @@
+"""
+File: run_training_worker.py
+Description: Management command which runs a training worker.
+The worker claims the TrainingJobs queued in the admin UI and runs each of them in its own process.
+Several workers can run at the same time, also on different machines that share the database.
+
+Usage: python manage.py run_training_worker [--concurrency 1] [--cpu-threads 4] [--niceness 10] [--once]
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from django.core.management.base import BaseCommand
+from app import training_queue
+import signal
+
+
+class Command(BaseCommand):
+    help = "Run queued training jobs in separate processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=training_queue.WORKER_CONCURRENCY,
+                            help="Number of jobs that run at the same time")
+        parser.add_argument('--cpu-threads', type=int, default=training_queue.WORKER_CPU_THREADS,
+                            help="Number of CPU threads every job may use (0 = no limit)")
+        parser.add_argument('--niceness', type=int, default=training_queue.WORKER_NICENESS,
+                            help="Niceness of the job processes, so they don't slow down the web server")
+        parser.add_argument('--poll-interval', type=float, default=training_queue.POLL_INTERVAL,
+                            help="Seconds between two checks of the queue")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty and all claimed jobs are done")
+
+    def handle(self, *args, **options):
+        worker = training_queue.TrainingWorker(
+            concurrency=options['concurrency'],
+            cpu_threads=options['cpu_threads'],
+            niceness=options['niceness'],
+            poll_interval=options['poll_interval'],
+        )
+
+        # Put the running jobs back into the queue when the worker is stopped
+        def stop(signum, frame):
+            self.stdout.write("Stopping the training worker...")
+            worker.stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(self.style.SUCCESS(f"Training worker {worker.worker_id} is waiting for jobs"))
+        worker.run(once=options['once'])
@@ -0,0 +1,68 @@
+"""
+File: warm_landmark_cache.py
+Description: Management command which fills the landmark cache for a dataset,
+so the next training job on it doesn't have to run the landmark detector.
+
+Usage: python manage.py warm_landmark_cache <dataset name> [--words eat,no]
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from app.models import Dataset
+import os
+import sys
+
+sys.path.insert(1, 'model_training/')
+import data_prep as prep
+import dataset_archive
+
+DETECTOR_PATH = './models/hand_landmarker.task'
+
+
+class Command(BaseCommand):
+    help = "Detect the landmarks of every video in a dataset and store them in the landmark cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', help="Name of the dataset")
+        parser.add_argument('--words', help="Comma separated words to warm (default: all words in the dataset)")
+
+    def handle(self, *args, **options):
+        try:
+            dataset = Dataset.objects.get(name=options['dataset'])
+        except Dataset.DoesNotExist:
+            raise CommandError(f"Dataset '{options['dataset']}' does not exist")
+        if dataset.kind == 'shards':
+            raise CommandError(f"Dataset '{dataset.name}' holds landmark shards, there are no videos to detect")
+
+        path = dataset.root_directory
+        if options['words']:
+            words = options['words'].split(',')
+        else:
+            words = sorted(item for item in dataset_archive.listdir(path) if dataset_archive.isdir(os.path.join(path, item)))
+
+        # The landmarks are only written to the cache, so every result is dropped as soon as it is cached
+        videos = prep.list_videos(words, path)
+        num_videos = 0
+        bad_videos = 0
+        for (_, video_file, _), (result, error) in zip(videos, prep.iter_landmarks(videos, DETECTOR_PATH)):
+            if error is not None:
+                self.stderr.write(f"Error processing video {video_file}: {error}")
+                continue
+            landmarks, _, _ = result
+            if len(landmarks) == 0:
+                bad_videos += 1
+            num_videos += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Cached landmarks of {num_videos} videos in '{dataset.name}' ({bad_videos} without landmarks)"
+        ))
@@ -0,0 +1,36 @@
+"""
+File: warm_up.py
+Description: Management command which loads the active model and a hand detector and runs a dummy inference.
+The server does the same in the background when it starts, the command checks that a container
+can serve predictions (it fails if there is no active model or no detector) and shows how long each step takes.
+
+Usage: python manage.py warm_up
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from app.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "Load the active model and a hand detector and run a dummy inference"
+
+    def handle(self, *args, **options):
+        try:
+            durations = warm_up.run()
+        except Exception as e:
+            raise CommandError(f"Warm-up failed: {e}")
+
+        for name, duration in durations.items():
+            self.stdout.write(f"{name}: {duration:.2f} seconds")
+        self.stdout.write(self.style.SUCCESS(f"Warm-up done in {sum(durations.values()):.2f} seconds"))
@@ -0,0 +1,241 @@
+"""
+File: metrics.py
+Description: Source code for the metrics of the prediction pipeline.
+The metrics are kept in memory per server process and exposed at /metrics in the Prometheus text format.
+Stages that run for a request can also be sent back in a Server-Timing header (set SERVER_TIMING=True).
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+# Add a Server-Timing header with the stage durations to the prediction responses
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False') == 'True'
+
+# Default histogram buckets in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FRAME_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+# Stage durations of the current request, None if the request doesn't collect them
+_request_timings = ContextVar('request_timings', default=None)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+# Base class of the metrics. A metric has one value (or set of values) per combination of label values.
+class Metric:
+    type = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} needs the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    # Get the lines of the metric in the Prometheus text format
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            values = {key: self._copy(value) for key, value in self._values.items()}
+        for key, value in sorted(values.items()):
+            lines.extend(self._collect_value(dict(zip(self.labelnames, key)), value))
+        return lines
+
+    def _copy(self, value):
+        return value
+
+    def _collect_value(self, labels, value):
+        return [f'{self.name}{_format_labels(labels)} {_format_value(value)}']
+
+
+# A value that only goes up, e.g. the number of predictions
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+# A value that goes up and down, e.g. the number of requests in flight.
+# A gauge can also read its value from a function when the metrics are collected.
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, description, labelnames=()):
+        super().__init__(name, description, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function):
+        self._function = function
+
+    def collect(self):
+        if self._function is not None:
+            with self._lock:
+                self._values[()] = self._function()
+        return super().collect()
+
+
+# Distribution of observed values, e.g. durations, counted in cumulative buckets
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    # Get (count, sum) of the observed values
+    def get(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return (0, 0.0) if entry is None else (entry[2], entry[1])
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def _collect_value(self, labels, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {repr(float(total))}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+# Collection of the metrics of this process
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    # Get all metrics in the Prometheus text format
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+upload_size = metrics_registry.register(Histogram(
+    'asl_upload_size_bytes', 'Size of the uploaded recordings and landmark payloads', ['kind'], SIZE_BUCKETS))
+stage_duration = metrics_registry.register(Histogram(
+    'asl_prediction_stage_seconds', 'Duration of the stages of a prediction', ['stage']))
+frame_duration = metrics_registry.register(Histogram(
+    'asl_frame_stage_seconds', 'Duration of decoding and detecting the landmarks of one video frame', ['stage'], FRAME_BUCKETS))
+inference_batch_size = metrics_registry.register(Histogram(
+    'asl_inference_batch_size', 'Number of requests in one forward pass of the model', buckets=BATCH_BUCKETS))
+predictions = metrics_registry.register(Counter(
+    'asl_predictions_total', 'Number of predictions by outcome (no_hands, low_confidence, correct, wrong)', ['outcome']))
+rejected_requests = metrics_registry.register(Counter(
+    'asl_rejected_requests_total', 'Number of prediction requests turned away because the server was busy'))
+requests_in_flight = metrics_registry.register(Gauge(
+    'asl_requests_in_flight', 'Number of predictions that are running or waiting for a worker thread'))
+inference_wait = metrics_registry.register(Histogram(
+    'asl_inference_wait_seconds', 'Time an input waits in the inference scheduler before its batch runs'))
+inference_queue_depth = metrics_registry.register(Gauge(
+    'asl_inference_queue_depth', 'Number of inputs waiting for the inference scheduler'))
+
+
+# Start collecting the stage durations of the current request. Returns the dict they are collected in.
+def start_request_timings():
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+# Record the duration of a stage, in the histogram and in the timings of the current request
+def observe_stage(stage, duration):
+    stage_duration.observe(duration, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + duration
+
+# Measure the duration of the code in the with block as a stage
+@contextmanager
+def stage(name):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start_time)
+
+# Function to format the stage durations for the Server-Timing header (in milliseconds)
+def format_server_timing(timings):
+    return ', '.join(f'{name};dur={duration * 1000:.1f}' for name, duration in timings.items())
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='extraction_workers',
+            field=models.PositiveIntegerField(default=1, help_text='Number of processes that extract landmarks from the dataset videos'),
+        ),
+    ]
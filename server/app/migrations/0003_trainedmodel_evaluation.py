@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_trainingjob_extraction_workers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainedmodel',
+            name='confusion_matrix',
+            field=models.JSONField(blank=True, default=list, help_text='Confusion matrix on the test set (rows are the true words, columns the predicted words)'),
+        ),
+        migrations.AddField(
+            model_name='trainedmodel',
+            name='top_k_accuracy',
+            field=models.JSONField(blank=True, default=dict, help_text='Accuracy on the test set when the true word is in the top k predictions'),
+        ),
+    ]
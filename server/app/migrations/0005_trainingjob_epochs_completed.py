@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_trainingjob_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='epochs_completed',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of epochs in the last checkpoint of the job'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_trainingjob_epochs_completed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainedmodel',
+            name='backend',
+            field=models.CharField(choices=[('keras', 'Keras'), ('tf_function', 'Compiled tf.function'), ('tflite', 'TensorFlow Lite')], default='keras', help_text='How the model is run. Faster backends are checked against Keras before they are used', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='trainedmodel',
+            name='tflite_file',
+            field=models.FileField(blank=True, editable=False, help_text='The model exported to TFLite with the admin action', null=True, upload_to='models/'),
+        ),
+    ]
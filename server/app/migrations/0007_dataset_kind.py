@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+import app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_trainedmodel_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='kind',
+            field=models.CharField(choices=[('videos', 'Videos'), ('shards', 'Landmark shards')], default='videos', help_text='Videos are run through the landmark detector for every training job. Landmark shards (made with the convert_to_shards command) hold the landmarks already, the ZIP file then contains a single root directory with the index.json and shard files.', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dataset',
+            name='data_file',
+            field=models.FileField(blank=True, help_text='Upload a ZIP file containing your dataset. The ZIP file must contain a single root directory, which includes folders for each word. <br/><br/>dataset_name.zip/ <br/>└── dataset_name/ <br/>....├── apple/ <br/>....├── hello/ <br/>....└── love/<br/><br/>(this may take a moment to validate)', upload_to='datasets/', validators=[app.models.validate_zip_file]),
+        ),
+    ]
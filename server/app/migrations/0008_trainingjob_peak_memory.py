@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_dataset_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='peak_memory',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text='Peak resident memory of the job process in bytes', null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+import app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_trainingjob_peak_memory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='error_message',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='ingest_progress',
+            field=models.PositiveIntegerField(default=100, editable=False, help_text='Progress of the ingestion in percent'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='status',
+            field=models.CharField(default='READY', editable=False, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dataset',
+            name='data_file',
+            field=models.FileField(blank=True, help_text='Upload a ZIP file containing your dataset. The ZIP file must contain a single root directory, which includes folders for each word. <br/><br/>dataset_name.zip/ <br/>└── dataset_name/ <br/>....├── apple/ <br/>....├── hello/ <br/>....└── love/<br/><br/>(the ZIP file is checked in the background, see the status of the dataset)', upload_to='datasets/', validators=[app.models.validate_zip_file]),
+        ),
+    ]
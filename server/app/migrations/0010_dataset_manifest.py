@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_dataset_ingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='duplicate_videos',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of videos with the same content as another video, they are skipped in training'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='num_videos',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Number of videos in the dataset manifest', null=True),
+        ),
+        migrations.AddField(
+            model_name='trainingjob',
+            name='estimated_duration',
+            field=models.FloatField(blank=True, editable=False, help_text='Estimated time in seconds to extract the landmarks of the dataset, when the job was queued', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_dataset_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Training worker that ingests the dataset', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,219 @@
+"""
+File: model_registry.py
+Description: Source code which keeps the active model loaded in memory.
+The model is only reloaded when a different model is activated, and the new model
+is loaded and warmed up in the background before it is swapped in.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import time
+import hashlib
+import logging
+from threading import Lock, Thread
+import numpy as np
+from django.db import connections
+from .inference_backends import KerasBackend, create_backend, check_parity
+
+logger = logging.getLogger('asl')
+
+# How often (in seconds) to check the database for a newly activated model
+REFRESH_INTERVAL = float(os.getenv('MODEL_REFRESH_INTERVAL', '10'))
+# Sequence lengths the model runs on besides max_frames. A request is padded to the smallest length that fits it,
+# so short clips don't pay for a max_frames long pass, and the model is only traced for a few lengths.
+INFERENCE_BUCKETS = [int(bucket) for bucket in os.getenv('INFERENCE_BUCKETS', '32,64,128').split(',') if bucket]
+
+
+# Function to get the sequence lengths a model runs on, the longest is always max_frames
+def get_buckets(max_frames, buckets=None):
+    return sorted(set(bucket for bucket in (buckets or INFERENCE_BUCKETS) if bucket < max_frames)) + [max_frames]
+
+
+# A loaded model together with the metadata it was trained with.
+# Instances are never changed after creation, so they can be shared between threads.
+class LoadedModel:
+    def __init__(self, model, version, key, name, max_frames, num_features, words, fps, buckets=None, backend=None):
+        self.model = model
+        # Runs the forward pass, Keras model.predict unless the model uses a faster backend
+        self.backend = backend or KerasBackend(model)
+        self.version = version
+        self.key = key
+        self.name = name
+        self.max_frames = max_frames
+        self.num_features = num_features
+        self.words = words
+        self.fps = fps
+        # The sequence lengths the model runs on, the longest is always max_frames
+        self.buckets = get_buckets(max_frames, buckets)
+
+    # Get the sequence length a clip with num_frames frames is padded to (at most max_frames)
+    def get_bucket_length(self, num_frames):
+        for bucket in self.buckets:
+            if num_frames <= bucket:
+                return bucket
+        return self.max_frames
+
+    def __str__(self):
+        return f"{self.name} ({self.version[:12]})"
+
+
+# Function to get the cheap version key of a model row (changes when the row or file changes)
+def get_model_key(trained_model):
+    path = trained_model.model_file.path
+    stat = os.stat(path)
+    key = f"{trained_model.pk}:{trained_model.model_file.name}:{stat.st_mtime_ns}:{stat.st_size}:{trained_model.backend}"
+    if trained_model.backend == 'tflite' and trained_model.tflite_file:
+        # Exporting the model again changes the key. A missing export is loaded with the Keras fallback.
+        try:
+            key += f":{os.stat(trained_model.tflite_file.path).st_mtime_ns}"
+        except FileNotFoundError:
+            key += ":missing"
+    return key
+
+
+# Function to get the content hash of a model file
+def get_file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# Process-wide registry that caches the active model
+class ModelRegistry:
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._current = None
+        self._last_check = 0.0
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self._refresh_thread = None
+
+    # Get the active model. Only blocks if no model has been loaded yet.
+    def get(self):
+        current = self._current
+        if current is None:
+            self.refresh()
+            current = self._current
+            if current is None:
+                raise ValueError("No active model found")
+        elif time.monotonic() - self._last_check > self.refresh_interval:
+            self.refresh_in_background()
+        return current
+
+    # Tell the registry that the active model may have changed
+    def invalidate(self):
+        self._last_check = 0.0
+        # Only reload eagerly if this process is actually serving a model
+        if self._current is not None:
+            self.refresh_in_background()
+
+    # Check for a new active model in a background thread, at most one at a time
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._last_check = time.monotonic()
+            self._refresh_thread = Thread(target=self._refresh_and_close, daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_and_close(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Failed to refresh the active model: {e}")
+        finally:
+            # Background threads get their own database connection, which has to be closed
+            connections.close_all()
+
+    # Check the database and load the active model if it has changed
+    def refresh(self):
+        # Only one thread loads at a time, the others get the result once it is done
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        from .models import TrainedModel
+
+        self._last_check = time.monotonic()
+        active_model = TrainedModel.objects.filter(is_active=True).first()
+        if active_model is None:
+            logger.error("No active model found")
+            return self._current
+
+        key = get_model_key(active_model)
+        current = self._current
+        if current is not None and current.key == key:
+            return current
+
+        version = get_file_hash(active_model.model_file.path)
+        metadata = self._get_metadata(active_model)
+        if (current is not None and current.version == version and self._same_metadata(current, metadata)
+                and current.backend.name == active_model.backend and active_model.backend != 'tflite'):
+            # Same file, metadata and backend, e.g. the row was only saved again
+            self._current = LoadedModel(current.model, version, key, active_model.name, *metadata, backend=current.backend)
+            return self._current
+
+        loaded = self._load(active_model, version, key, metadata)
+        # Swapping the reference is atomic, requests that already hold the old model keep using it
+        self._current = loaded
+        logger.info(f"Model '{loaded}' is now active")
+        return loaded
+
+    def _get_metadata(self, trained_model):
+        if not trained_model.words:
+            raise ValueError(f"Model '{trained_model.name}' has no words set")
+        words = trained_model.words.split(',')
+        fps = trained_model.fps if trained_model.fps is not None else 0.0
+        return trained_model.max_frames, trained_model.num_features, words, fps
+
+    def _same_metadata(self, loaded, metadata):
+        return (loaded.max_frames, loaded.num_features, loaded.words, loaded.fps) == metadata
+
+    def _load(self, trained_model, version, key, metadata):
+        from keras.models import load_model
+
+        max_frames, num_features, words, fps = metadata
+        model = load_model(trained_model.model_file.path)
+
+        # Fall back to the model input shape if the row has no shape information
+        _, input_frames, input_features = model.input_shape
+        max_frames = max_frames or input_frames
+        num_features = num_features or input_features
+
+        backend = self._load_backend(trained_model, model, num_features, get_buckets(max_frames))
+        loaded = LoadedModel(model, version, key, trained_model.name, max_frames, num_features, words, fps, backend=backend)
+
+        # Warm up the model for every length, so the first requests don't pay for graph tracing
+        for length in loaded.buckets:
+            loaded.backend.predict(np.zeros((1, length, num_features), dtype=np.float32))
+
+        return loaded
+
+    # Create the backend of the model. Falls back to Keras if the backend can't be created or gives different outputs.
+    def _load_backend(self, trained_model, model, num_features, buckets):
+        if trained_model.backend == KerasBackend.name:
+            return KerasBackend(model)
+        try:
+            tflite_path = trained_model.tflite_file.path if trained_model.tflite_file else None
+            backend = create_backend(trained_model.backend, model, num_features, tflite_path)
+            difference = check_parity(model, backend, num_features, buckets)
+        except Exception as e:
+            logger.error(f"Can't use the {trained_model.backend} backend for '{trained_model.name}', using Keras: {e}")
+            return KerasBackend(model)
+        logger.info(f"Using the {backend.name} backend for '{trained_model.name}' (largest difference to Keras {difference:.2e})")
+        return backend
+
+
+registry = ModelRegistry()
@@ -9,7 +9,7 @@ Parisa Babaei
 David Schoen
 
 Created: 2024-11-27
-Last Modified: 2025-01-01
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -19,7 +19,6 @@ License: MIT License (see LICENSE file for details)
 
 from django.db import models
 from django.core.exceptions import ValidationError
-from keras.models import load_model
 import logging
 
 logger = logging.getLogger('asl')
@@ -34,12 +33,31 @@ def validate_keras_file(value):
     if not value.name.endswith('.keras'):
         raise ValidationError('Only keras files are allowed.')
     
+# Backends that can run a TrainedModel, see inference_backends.py
+INFERENCE_BACKENDS = [
+    ('keras', 'Keras'),
+    ('tf_function', 'Compiled tf.function'),
+    ('tflite', 'TensorFlow Lite'),
+]
+
+# Kinds of datasets, see model_training/landmark_shards.py for the landmark shards
+DATASET_KINDS = [
+    ('videos', 'Videos'),
+    ('shards', 'Landmark shards'),
+]
+
 # Dataset model to store the uploaded dataset
 class Dataset(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    kind = models.CharField(max_length=20, choices=DATASET_KINDS, default='videos', help_text=(
+        "Videos are run through the landmark detector for every training job. "
+        "Landmark shards (made with the convert_to_shards command) hold the landmarks already, "
+        "the ZIP file then contains a single root directory with the index.json and shard files."
+    ))
     data_file = models.FileField(
         upload_to='datasets/',
         validators=[validate_zip_file],
+        blank=True,
         help_text=(
             "Upload a ZIP file containing your dataset. "
             "The ZIP file must contain a single root directory, "
@@ -49,15 +67,29 @@ class Dataset(models.Model):
             "....├── apple/ <br/>"
             "....├── hello/ <br/>"
             "....└── love/<br/><br/>"
-            "(this may take a moment to validate)"
+            "(the ZIP file is checked in the background, see the status of the dataset)"
         )
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
     root_directory = models.CharField(max_length=255, editable=False)
+    # Uploaded ZIP files are checked and indexed by the training worker, see dataset_ingestion.py
+    status = models.CharField(max_length=20, default='READY', editable=False)
+    ingest_progress = models.PositiveIntegerField(default=100, editable=False, help_text='Progress of the ingestion in percent')
+    error_message = models.TextField(blank=True, default='', editable=False)
+    num_videos = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text='Number of videos in the dataset manifest')
+    duplicate_videos = models.PositiveIntegerField(default=0, editable=False, help_text='Number of videos with the same content as another video, they are skipped in training')
+    claimed_by = models.CharField(max_length=255, blank=True, default='', editable=False, help_text='Training worker that ingests the dataset')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    # Datasets registered by convert_to_shards have a directory instead of a ZIP file
+    def clean(self):
+        super().clean()
+        if not self.data_file and not self.root_directory:
+            raise ValidationError({'data_file': 'Upload a ZIP file containing your dataset.'})
+
 # TrainedModel model to store the trained models
 class TrainedModel(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -68,15 +100,22 @@ class TrainedModel(models.Model):
     words = models.TextField(null=True, blank=True, help_text='List of words in the model  (comma separated)')
     fps = models.FloatField(null=True, blank=True)
     word_accuracy = models.JSONField(default=dict, blank=True, help_text='Word accuracy in the model')
+    confusion_matrix = models.JSONField(default=list, blank=True, help_text='Confusion matrix on the test set (rows are the true words, columns the predicted words)')
+    top_k_accuracy = models.JSONField(default=dict, blank=True, help_text='Accuracy on the test set when the true word is in the top k predictions')
+    backend = models.CharField(max_length=20, choices=INFERENCE_BACKENDS, default='keras', help_text='How the model is run. Faster backends are checked against Keras before they are used')
+    tflite_file = models.FileField(upload_to='models/', null=True, blank=True, editable=False, help_text='The model exported to TFLite with the admin action')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=False, help_text="Set this model as the one in use")
     model = None
 
     @classmethod
     def change_model(cls):
-        active_model = cls.get_active_model_path()
-        cls.model = load_model(active_model)
-        print(f"Model '{active_model}' loaded")
+        from .model_registry import registry
+        loaded = registry.refresh()
+        if loaded is None:
+            raise ValueError("No active model found")
+        cls.model = loaded.model
+        logger.info(f"Model '{loaded}' loaded")
         return cls.model
 
     @classmethod
@@ -89,12 +128,36 @@ class TrainedModel(models.Model):
     def __str__(self):
         return self.name
 
+    # Only activate a model on a faster backend if it gives the same outputs as Keras
+    def clean(self):
+        super().clean()
+        if not self.is_active or self.backend == 'keras':
+            return
+        if self.backend == 'tflite' and not self.tflite_file:
+            raise ValidationError({'backend': 'Export the model to TFLite before using the TFLite backend.'})
+        # A newly uploaded file is only checked when the registry loads it
+        if not self.model_file or not self.model_file._committed:
+            return
+
+        from keras.models import load_model
+        from .inference_backends import create_backend, check_parity
+        model = load_model(self.model_file.path)
+        max_frames = self.max_frames or model.input_shape[1]
+        num_features = self.num_features or model.input_shape[2]
+        try:
+            backend = create_backend(self.backend, model, num_features, self.tflite_file.path if self.tflite_file else None)
+            check_parity(model, backend, num_features, [max_frames])
+        except ValueError as e:
+            raise ValidationError({'backend': str(e)})
+
     def save(self, *args, **kwargs):
         # disable other models
         if self.is_active:
             TrainedModel.objects.filter(is_active=True).update(is_active=False)
         super().save(*args, **kwargs)
-        self.change_model()
+        # The registry reloads in the background if the active model changed
+        from .model_registry import registry
+        registry.invalidate()
 
 # TrainingJob model to store the training jobs
 class TrainingJob(models.Model):
@@ -105,6 +168,17 @@ class TrainingJob(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, default='PENDING', editable=False)
     output_model = models.OneToOneField(TrainedModel, on_delete=models.SET_NULL, null=True, blank=True, related_name='output_from_job',editable=False)
+    extraction_workers = models.PositiveIntegerField(default=1, help_text='Number of processes that extract landmarks from the dataset videos')
+    # Queue state, the jobs are run by the run_training_worker command
+    queued_at = models.DateTimeField(null=True, blank=True, editable=False)
+    claimed_by = models.CharField(max_length=255, blank=True, default='', editable=False, help_text='Training worker that runs the job')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, editable=False)
+    cancel_requested = models.BooleanField(default=False, editable=False)
+    attempts = models.PositiveIntegerField(default=0, editable=False)
+    error_message = models.TextField(blank=True, default='', editable=False)
+    epochs_completed = models.PositiveIntegerField(default=0, editable=False, help_text='Number of epochs in the last checkpoint of the job')
+    estimated_duration = models.FloatField(null=True, blank=True, editable=False, help_text='Estimated time in seconds to extract the landmarks of the dataset, when the job was queued')
+    peak_memory = models.PositiveBigIntegerField(null=True, blank=True, editable=False, help_text='Peak resident memory of the job process in bytes')
     # TODO: Ensure that a trainingJob can't be deleted if it is 'IN_PROGRESS'
 
     def __str__(self):
@@ -8,7 +8,7 @@ Michael Koenig
 Teo Portase
 
 Created: 2024-12-08
-Last Modified: 2025-01-01
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -17,128 +17,326 @@ License: MIT License (see LICENSE file for details)
 """
 
 import os
-from stopwatch import Stopwatch
-import subprocess
-import hashlib
-import shutil
-from keras.models import load_model
+import sys
+import time
+import queue
+import struct
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock, Thread
+from django.db import close_old_connections
+sys.path.insert(1, 'model_training/')
 import landmark_detector as ld
 import numpy as np
 import logging
-from .models import TrainedModel
-from dotenv import load_dotenv
+from .model_registry import registry
+from . import metrics
+from .recording_archiver import recording_archiver, save_recording, generate_random_hash
 
-# Set the paths to the model, the landmark detector, and the model settings
+# Set the path to the landmark detector
 DETECTOR_PATH = './models/hand_landmarker.task'
-# Load the model settings
 
-load_dotenv(TrainedModel.get_active_model_path().rstrip(".keras") + ".env")
-
-# Get the number of features from the environment variables from the model settings
-NUM_FEATURES = os.getenv('NUM_FEATURES')
-if NUM_FEATURES is None:
-    raise ValueError("Environment variable 'NUM_FEATURES' is not set.")
-num_features = int(NUM_FEATURES)
-
-# Get the maximum number of frames from the environment variables from the model settings
-MAX_FRAMES = os.getenv('MAX_FRAMES')
-if MAX_FRAMES is None:
-    raise ValueError("Environment variable 'MAX_FRAMES' is not set.")
-max_frames = int(MAX_FRAMES)
-
-# Get the words from the environment variables from the model settings
-WORDS = os.getenv('WORDS')
-if WORDS is None:
-    raise ValueError("Environment variable 'WORDS' is not set.")
-words = WORDS.split(',')
-
-# Get the FPS from the environment variables from the model settings
-FPS = os.getenv('FPS')
-if FPS is None:
-    raise ValueError("Environment variable 'FPS' is not set.")
-fps = float(FPS)
-
-detector = ld.get_detector(DETECTOR_PATH)
+# Number of hand detectors that can run at the same time, and how long (in seconds)
+# a request waits for a free detector before giving up
+DETECTOR_POOL_SIZE = int(os.getenv('DETECTOR_POOL_SIZE', str(os.cpu_count() or 1)))
+DETECTOR_POOL_TIMEOUT = float(os.getenv('DETECTOR_POOL_TIMEOUT', '30'))
+# Track hands between frames instead of running the palm detection on every frame
+DETECTOR_VIDEO_MODE = os.getenv('DETECTOR_VIDEO_MODE', 'True') == 'True'
+
+# Settings for grouping concurrent predictions into one batch
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+
+# What to do with clips that have more landmark frames than the model was trained on:
+# 'window' averages the predictions of overlapping max_frames long windows, 'truncate' only uses the first max_frames frames
+OVERLONG_POLICY = os.getenv('OVERLONG_POLICY', 'window')
+# Distance between two windows, as a fraction of max_frames
+WINDOW_STRIDE = float(os.getenv('WINDOW_STRIDE', '0.5'))
+
+# Number of threads that run detection and inference for the async views, and how many
+# predictions may be running or waiting before new requests are turned away
+PREDICTION_WORKERS = int(os.getenv('PREDICTION_WORKERS', str(DETECTOR_POOL_SIZE)))
+PREDICTION_MAX_PENDING = int(os.getenv('PREDICTION_MAX_PENDING', str(PREDICTION_WORKERS * 4)))
+
+# Binary landmark payload sent by clients that run the hand detection themselves.
+# Little endian header: magic, format version, reserved byte, number of frames, number of features,
+# fps of the frames and the first 16 characters of the model version (all zeros to accept any model),
+# followed by frames x features float16 values.
+LANDMARK_PAYLOAD_MAGIC = b'ASLL'
+LANDMARK_PAYLOAD_VERSION = 1
+LANDMARK_PAYLOAD_HEADER = struct.Struct('<4sBxHHf16s')
+LANDMARK_PAYLOAD_MAX_FRAMES = int(os.getenv('LANDMARK_PAYLOAD_MAX_FRAMES', '1000'))
+# How far (in frames per second) the payload fps may be from the fps the model was trained on
+LANDMARK_PAYLOAD_FPS_TOLERANCE = 0.5
+
+detector_pool = ld.DetectorPool(DETECTOR_PATH, DETECTOR_POOL_SIZE, DETECTOR_POOL_TIMEOUT, DETECTOR_VIDEO_MODE)
 
 # Set up logging
 logger = logging.getLogger('asl')
 
 
-# Function to preprocess the video to a different frame rate
-def preprocess_video(video_path, target_fps=5):
-    file_name,  _ = os.path.splitext(video_path)
-    output_path = f"{file_name}_reencoded.mp4"
-    sw = Stopwatch(2)
-    subprocess.run(
-        ["ffmpeg", "-i", video_path, "-c:v", "mjpeg", "-q:v", "5", "-r", str(target_fps), output_path],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    sw.stop()
-    logger.info(f"FFmpeg reencoding completed in {sw.duration} seconds")
-
-    return output_path
-
-# Function to generate a random hash for the video name
-def generate_random_hash(length=10):
-    return hashlib.sha256(os.urandom(16)).hexdigest()[:length]
-
-# Function to save the recording to the /recordings directory
-def save_recording(video_path, correct_class):
-    destination_dir = f'/recordings/{correct_class}'
-    os.makedirs(destination_dir, exist_ok=True)
-
-    file_extension = os.path.splitext(video_path)[1]
-    random_filename = f"{generate_random_hash()}{file_extension}"
-    destination = os.path.join(destination_dir, random_filename)
-
-    shutil.copy(video_path, destination)
-    logger.info(f"Saved recording to {destination}")
-    return destination
+# Scheduler which collects pending predictions and runs them as one batched forward pass.
+# A batch is run when it is full, or when its oldest request has waited max_wait_ms.
+class InferenceScheduler:
+    def __init__(self, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = Lock()
+        self._thread = None
+
+    # Predict the probabilities for one padded landmark tensor of shape (frames, features)
+    def predict(self, active_model, features):
+        return self.submit(active_model, features).result()
+
+    # Queue a padded landmark tensor, returns a Future with its probabilities
+    def submit(self, active_model, features):
+        self._ensure_running()
+        future = Future()
+        self._queue.put((active_model, features, future, time.monotonic()))
+        return future
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='asl-inference', daemon=True)
+                self._thread.start()
+
+    # Collect requests until the batch is full or the oldest request has waited long enough
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][3] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.monotonic()
+            waits = [started - item[3] for item in batch]
+            for wait in waits:
+                metrics.inference_wait.observe(wait)
+
+            # Requests can only share a forward pass if they use the same model and have the same length
+            groups = {}
+            for item in batch:
+                groups.setdefault((id(item[0]), item[1].shape), []).append(item)
+
+            for items in groups.values():
+                active_model = items[0][0]
+                metrics.inference_batch_size.observe(len(items))
+                try:
+                    with metrics.stage('forward'):
+                        predictions = active_model.backend.predict(np.stack([item[1] for item in items]))
+                except Exception as e:
+                    for item in items:
+                        item[2].set_exception(e)
+                    continue
+                for item, prediction in zip(items, predictions):
+                    item[2].set_result(prediction)
+
+            logger.debug(f"Ran batch of {len(batch)} predictions, longest wait {max(waits):.4f} seconds")
+
+
+scheduler = InferenceScheduler()
+metrics.inference_queue_depth.set_function(scheduler._queue.qsize)
+
+
+# Bounded executor which runs the blocking detection and inference for async views,
+# so the event loop only buffers uploads and sends responses
+class PredictionExecutor:
+    def __init__(self, workers=PREDICTION_WORKERS, max_pending=PREDICTION_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='asl-predict')
+        self._pending = BoundedSemaphore(max(1, max_pending))
+
+    # Run a blocking function in the executor.
+    # Raises TimeoutError right away if too many predictions are already pending.
+    async def run(self, function, *args):
+        if not self._pending.acquire(blocking=False):
+            metrics.rejected_requests.inc()
+            raise TimeoutError("Too many predictions are pending")
+        metrics.requests_in_flight.inc()
+        try:
+            # The function runs in the context of the request, so it records the request's stage timings
+            future = self._executor.submit(contextvars.copy_context().run, self._run, function, args)
+        except Exception:
+            self._release()
+            raise
+        # Only release the slot when the work is really done, even if the request was cancelled
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        metrics.requests_in_flight.dec()
+        self._pending.release()
+
+    def _run(self, function, args):
+        try:
+            return function(*args)
+        finally:
+            # Worker threads get their own database connections
+            close_old_connections()
+
+
+prediction_executor = PredictionExecutor()
+
+
+# Raised when a landmark payload was made for a different model than the active one
+class ModelVersionMismatch(ValueError):
+    pass
+
+
+# Function to build a binary landmark payload from a (frames, features) array
+def build_landmark_payload(features, fps, model_version=''):
+    features = np.asarray(features, dtype='<f2')
+    if features.ndim != 2:
+        raise ValueError("The landmarks must have the shape (frames, features)")
+    header = LANDMARK_PAYLOAD_HEADER.pack(LANDMARK_PAYLOAD_MAGIC, LANDMARK_PAYLOAD_VERSION, features.shape[0],
+                                          features.shape[1], fps, model_version[:16].encode('ascii'))
+    return header + features.tobytes()
+
+# Function to parse and validate a binary landmark payload against the active model.
+# Returns the landmarks as a float32 (frames, features) array.
+def parse_landmark_payload(data, active_model):
+    if len(data) < LANDMARK_PAYLOAD_HEADER.size:
+        raise ValueError("The landmark payload is too short")
+
+    magic, version, num_frames, num_features, fps, model_version = LANDMARK_PAYLOAD_HEADER.unpack_from(data)
+    if magic != LANDMARK_PAYLOAD_MAGIC:
+        raise ValueError("The data is not a landmark payload")
+    if version != LANDMARK_PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported landmark payload version {version}")
+
+    model_version = model_version.rstrip(b'\0').decode('ascii', errors='replace')
+    if model_version and not active_model.version.startswith(model_version):
+        raise ModelVersionMismatch(f"The landmarks were made for model version {model_version}, "
+                                   f"but the active model is {active_model.version[:16]}")
+    if num_features != active_model.num_features:
+        raise ValueError(f"Expected {active_model.num_features} features per frame, got {num_features}")
+    if num_frames == 0:
+        raise ValueError("The landmark payload has no frames")
+    if num_frames > LANDMARK_PAYLOAD_MAX_FRAMES:
+        raise ValueError(f"The landmark payload has more than {LANDMARK_PAYLOAD_MAX_FRAMES} frames")
+    if active_model.fps and abs(fps - active_model.fps) > LANDMARK_PAYLOAD_FPS_TOLERANCE:
+        raise ValueError(f"The landmarks must be sampled at {active_model.fps} fps, got {fps:g} fps")
+
+    expected_size = LANDMARK_PAYLOAD_HEADER.size + num_frames * num_features * 2
+    if len(data) != expected_size:
+        raise ValueError(f"Expected {expected_size} bytes for {num_frames} frames, got {len(data)}")
+
+    features = np.frombuffer(data, dtype='<f2', offset=LANDMARK_PAYLOAD_HEADER.size).reshape(num_frames, num_features)
+    if not np.all(np.isfinite(features)):
+        raise ValueError("The landmark payload contains invalid values")
+    return features.astype(np.float32)
+
 
 # Function to predict the sign from a video using landmark detector and the model
 def predict(video_path, correct_class, preprocess=True):
-    TrainedModel.change_model()
-    model = TrainedModel.model
-    video_X = []
-    if preprocess:
-        video_path = preprocess_video(video_path)
-    sw = Stopwatch(2)
-    landmarks, _ = ld.get_landmarks(video_path, detector)
-    sw.stop()
-    logger.info(f"Landmark detection completed in {sw.duration} seconds")
-
-    prediction_X = []
+    # The registry only reloads the model when a different one has been activated
+    active_model = registry.get()
+    # The video is sampled to the model's frame rate while it is decoded
+    target_fps = active_model.fps if preprocess else None
+
+    # Total decode and detection time over all frames
+    totals = [0.0, 0.0]
+    def on_frame(decode_duration, detection_duration):
+        metrics.frame_duration.observe(decode_duration, stage='decode')
+        metrics.frame_duration.observe(detection_duration, stage='detection')
+        totals[0] += decode_duration
+        totals[1] += detection_duration
+
+    # Every request gets its own detector from the pool
+    wait_start = time.perf_counter()
+    with detector_pool.detector() as detector:
+        metrics.observe_stage('detector_wait', time.perf_counter() - wait_start)
+        landmarks, _, _ = ld.get_landmark_array(video_path, detector, target_fps=target_fps, on_frame=on_frame)
+    metrics.observe_stage('decode', totals[0])
+    metrics.observe_stage('detection', totals[1])
+    logger.info(f"Landmark detection completed in {sum(totals):.2f} seconds")
 
     if len(landmarks) == 0:
         logger.info("No landmarks detected")
         if os.getenv("SAVE_RECORDINGS") != "True":
             logger.info("Not saving video because no landmarks were detected")
         return None
-    else:
-        for frame in range(len(landmarks)):
-            features = np.array(landmarks[frame]).flatten()
-            features = np.pad(
-                features, (0, num_features - len(features)), 'constant')
-            video_X.append(features)
-        for i in range(max_frames-len(video_X)):
-            temp = np.zeros((num_features))
-            video_X.append(temp)
-
-    prediction_X.append(video_X)
-
-    # copy video to /recordings
-    if os.getenv("SAVE_RECORDINGS") == "True":
-        save_recording(video_path, correct_class)
-        logger.info(f"Saved video to /recordings/{correct_class}/")
-
-    sw.reset()
-    sw.start()
-    predictions = model.predict(np.array(prediction_X), verbose=0)
-    sw.stop()
-    logger.info(f"Prediction completed in {sw.duration} seconds")
+
+    # The original video is archived together with its landmarks
+    return predict_landmarks(active_model, landmarks.reshape(len(landmarks), -1), correct_class, video=video_path)
+
+# Function to predict the sign from a landmark payload that was detected by the client
+def predict_payload(data, correct_class):
+    active_model = registry.get()
+    with metrics.stage('payload_parse'):
+        features = parse_landmark_payload(data, active_model)
+    return predict_landmarks(active_model, features, correct_class)
+
+# Function to split a (frames, features) array into the parts the model runs on.
+# Clips up to max_frames are used as they are, longer clips are handled according to the policy.
+def get_windows(features, max_frames, policy=OVERLONG_POLICY, stride=WINDOW_STRIDE):
+    if len(features) <= max_frames:
+        return [features]
+    if policy == 'truncate':
+        return [features[:max_frames]]
+    if policy != 'window':
+        raise ValueError(f"Unknown policy for overlong clips: {policy}")
+
+    step = max(1, int(max_frames * stride))
+    starts = list(range(0, len(features) - max_frames + 1, step))
+    # The last window always ends with the last frame
+    if starts[-1] != len(features) - max_frames:
+        starts.append(len(features) - max_frames)
+    return [features[start:start + max_frames] for start in starts]
+
+# Function to get the probabilities of every word for a (frames, features) landmark array.
+# Every window is zero padded to the nearest length bucket instead of max_frames, the Masking layer skips the padding.
+def get_probabilities(active_model, features):
+    with metrics.stage('padding'):
+        inputs = []
+        for window in get_windows(features, active_model.max_frames):
+            prediction_X = np.zeros((active_model.get_bucket_length(len(window)), active_model.num_features), dtype=np.float32)
+            prediction_X[:len(window), :window.shape[1]] = window
+            inputs.append(prediction_X)
+
+    # Concurrent requests are grouped into one forward pass by the scheduler
+    with metrics.stage('inference'):
+        futures = [scheduler.submit(active_model, prediction_X) for prediction_X in inputs]
+        return np.mean([future.result() for future in futures], axis=0)
+
+# Function to check if the recordings of a word are archived: with SAVE_RECORDINGS=True, and only for words the model knows
+def should_archive(active_model, correct_class):
+    if os.getenv("SAVE_RECORDINGS") != "True":
+        return False
+    if correct_class not in active_model.words:
+        logger.warning(f"Not saving the recording of the unknown word {correct_class!r}")
+        return False
+    return True
+
+# Function to queue a recording for the archiver. The video is a video path, the StreamRecording of a stream,
+# or None for landmarks without a video. Returns True if the recording was queued.
+def archive_recording(active_model, correct_class, landmarks, video=None):
+    if not should_archive(active_model, correct_class):
+        return False
+    return recording_archiver.submit(video, correct_class, landmarks)
+
+# Function to predict the sign from a (frames, features) landmark array.
+# Every final prediction (uploads, landmark payloads and streams) is archived here with its landmarks
+# and the video if there is one. `landmarks` are archived instead of the features if they differ,
+# e.g. all frames of a stream. Provisional predictions of a stream pass archive=False.
+def predict_landmarks(active_model, features, correct_class, video=None, landmarks=None, archive=True):
+    if archive:
+        archive_recording(active_model, correct_class, features if landmarks is None else landmarks, video)
+
+    words = active_model.words
+
+    start_time = time.perf_counter()
+    predictions = get_probabilities(active_model, features)[np.newaxis, :]
+    logger.info(f"Prediction completed in {time.perf_counter() - start_time:.2f} seconds")
 
     predicted_class = np.argmax(predictions)
     # Returns the maximum probability
@@ -0,0 +1,225 @@
+"""
+File: recording_archiver.py
+Description: Source code for archiving the recordings of the end-users in the background.
+With SAVE_RECORDINGS=True the original upload and its (frames, features) landmark array are stored under
+/recordings/<word>/ as <hash><extension> and <hash>.npy, so they can be used for training later on.
+Landmarks that were detected by the client have no video, only <hash>.npy is stored for them.
+The frames of a stream are stored as <hash>.mp4.
+The request only hard links the uploaded file into a staging directory and queues it,
+a writer thread moves it to the recordings directory, so saving never slows down a prediction.
+The writer also encodes the frames of streams into videos.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import queue
+import shutil
+import hashlib
+import logging
+import tempfile
+from threading import Lock, Thread
+import numpy as np
+import cv2 as cv
+from . import metrics
+
+# Directory the recordings are archived in
+RECORDINGS_DIR = os.getenv('RECORDINGS_DIR', '/recordings')
+# Number of recordings that may wait for the writer. Recordings are dropped when the queue is full.
+RECORDING_QUEUE_SIZE = int(os.getenv('RECORDING_QUEUE_SIZE', '32'))
+# Directory for the files that wait in the queue, one subdirectory per server process
+STAGING_DIR = os.getenv('RECORDING_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'asl-recordings'))
+
+logger = logging.getLogger('asl')
+
+recordings_saved = metrics.metrics_registry.register(metrics.Counter(
+    'asl_recordings_total', 'Number of recordings by result (saved, dropped, failed)', ['result']))
+recording_queue_depth = metrics.metrics_registry.register(metrics.Gauge(
+    'asl_recording_queue_depth', 'Number of recordings waiting for the archiver'))
+
+
+# Function to generate a random hash for the video name
+def generate_random_hash(length=10):
+    return hashlib.sha256(os.urandom(16)).hexdigest()[:length]
+
+# Function to save a recording and its landmarks to <recordings_dir>/<word>/.
+# Raises ValueError if the word isn't a plain folder name. With move=True the video is moved instead of copied.
+# Without a video only the landmarks are saved. Returns the path of the saved video, or of the landmarks if there is no video.
+def save_recording(video_path, correct_class, landmarks=None, recordings_dir=RECORDINGS_DIR, move=False):
+    # The word is the name of a folder, it can't point outside of recordings_dir
+    if not correct_class or correct_class in ('.', '..') or os.path.basename(correct_class) != correct_class:
+        raise ValueError(f"Invalid word for a recording: {correct_class!r}")
+    if video_path is None and landmarks is None:
+        raise ValueError("A recording needs a video or landmarks")
+    destination_dir = os.path.join(recordings_dir, correct_class)
+    os.makedirs(destination_dir, exist_ok=True)
+
+    random_hash = generate_random_hash()
+    landmarks_path = os.path.join(destination_dir, f"{random_hash}.npy")
+    if landmarks is not None:
+        np.save(landmarks_path, landmarks)
+    if video_path is None:
+        logger.info(f"Saved landmarks to {landmarks_path}")
+        return landmarks_path
+
+    destination = os.path.join(destination_dir, f"{random_hash}{os.path.splitext(video_path)[1]}")
+    if move:
+        shutil.move(video_path, destination)
+    else:
+        shutil.copy(video_path, destination)
+    logger.info(f"Saved recording to {destination}")
+    return destination
+
+
+# Frames of a stream, which the writer saves as a video. Only the encoded images are kept in memory.
+class StreamRecording:
+    def __init__(self, fps, max_frames):
+        self.fps = fps
+        self.max_frames = max_frames
+        self.frames = []
+        self.timestamps = []
+
+    # Add an encoded image (JPEG, PNG or WebP) with its timestamp in ms. Frames after the first max_frames aren't kept.
+    def add(self, timestamp_ms, image_data):
+        if len(self.frames) < self.max_frames:
+            self.frames.append(bytes(image_data))
+            self.timestamps.append(timestamp_ms)
+
+    # Get the fps of the video, the fps of the model or else the rate the frames arrived at
+    def get_fps(self):
+        if self.fps:
+            return self.fps
+        duration = self.timestamps[-1] - self.timestamps[0] if self.timestamps else 0
+        return (len(self.timestamps) - 1) * 1000 / duration if duration > 0 else 20.0
+
+    # Write the frames as an MP4 video. Every frame is scaled to the size of the first one.
+    def write(self, path):
+        writer = None
+        try:
+            for data in self.frames:
+                image = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+                if image is None:
+                    continue
+                if writer is None:
+                    size = (image.shape[1], image.shape[0])
+                    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*'mp4v'), self.get_fps(), size)
+                elif (image.shape[1], image.shape[0]) != size:
+                    image = cv.resize(image, size)
+                writer.write(image)
+        finally:
+            if writer is not None:
+                writer.release()
+        if writer is None:
+            raise ValueError("The stream has no frames to save")
+
+
+# Background writer for the recordings of one server process
+class RecordingArchiver:
+    def __init__(self, recordings_dir=RECORDINGS_DIR, queue_size=RECORDING_QUEUE_SIZE, staging_dir=STAGING_DIR):
+        self.recordings_dir = recordings_dir
+        self.staging_dir = os.path.join(staging_dir, str(os.getpid()))
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = Lock()
+        self._thread = None
+
+    # Queue a recording. The video is the path of a video file, the StreamRecording of a stream,
+    # or None for landmarks without a video. The file at the video path isn't needed anymore once this returns,
+    # so the caller can delete it. Returns False if the recording was dropped.
+    def submit(self, video, correct_class, landmarks=None):
+        self._ensure_running()
+        source = video
+        if isinstance(video, str):
+            source = self._stage(video)
+            if source is None:
+                return False
+
+        try:
+            self._queue.put_nowait((source, correct_class, landmarks))
+        except queue.Full:
+            logger.warning("Recording queue is full, dropping the recording")
+            if isinstance(source, str):
+                os.remove(source)
+            recordings_saved.inc(result='dropped')
+            return False
+        return True
+
+    # Link or copy a video into the staging directory. Returns the staged path, or None if it failed.
+    def _stage(self, video_path):
+        staged_path = os.path.join(self.staging_dir, f"{generate_random_hash()}{os.path.splitext(video_path)[1]}")
+        try:
+            # A hard link doesn't copy the data, the copy is done by the writer
+            try:
+                os.link(video_path, staged_path)
+            except OSError:
+                shutil.copy(video_path, staged_path)
+        except OSError as e:
+            logger.error(f"Can't stage recording {video_path}: {e}")
+            recordings_saved.inc(result='failed')
+            return None
+        return staged_path
+
+    # Wait until all queued recordings are saved, e.g. before the server stops
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._clean_staging()
+                self._thread = Thread(target=self._run, name='asl-recordings', daemon=True)
+                self._thread.start()
+
+    # Delete the staging directories of server processes that aren't running anymore
+    def _clean_staging(self):
+        parent = os.path.dirname(self.staging_dir)
+        if os.path.isdir(parent):
+            for name in os.listdir(parent):
+                path = os.path.join(parent, name)
+                if name.isdigit() and (path == self.staging_dir or not _is_running(int(name))):
+                    shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def _run(self):
+        while True:
+            source, correct_class, landmarks = self._queue.get()
+            staged_path = source
+            try:
+                with metrics.stage('recording_save'):
+                    # The frames of a stream are encoded into a video in the staging directory first
+                    if isinstance(source, StreamRecording):
+                        staged_path = os.path.join(self.staging_dir, f"{generate_random_hash()}.mp4")
+                        source.write(staged_path)
+                    save_recording(staged_path, correct_class, landmarks, self.recordings_dir, move=True)
+                recordings_saved.inc(result='saved')
+            except Exception as e:
+                logger.error(f"Failed to save recording: {e}")
+                recordings_saved.inc(result='failed')
+                if staged_path is not None and os.path.exists(staged_path):
+                    os.remove(staged_path)
+            finally:
+                self._queue.task_done()
+
+
+# Function to check if a process is running
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+recording_archiver = RecordingArchiver()
+recording_queue_depth.set_function(recording_archiver._queue.qsize)
@@ -6,7 +6,7 @@ Contributors:
 Parisa Babaei
 
 Created: 2024-12-26
-Last Modified: 2025-01-02
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -15,9 +15,8 @@ License: MIT License (see LICENSE file for details)
 """
 
 from sklearn.model_selection import train_test_split
-from tensorflow.keras.callbacks import EarlyStopping
 from app.models import TrainingJob, TrainedModel
-from dotenv import load_dotenv
+from app.training_checkpoint import JobCheckpoint, ResumableEarlyStopping, TrainingCancelled
 from django.core.files import File
 import keras
 import numpy as np
@@ -27,77 +26,126 @@ import sys
 
 sys.path.insert(1, 'model_training/')
 import data_prep as prep
+import dataset_manifest
 
+# Directory for the landmarks extracted by a job, which are memory mapped during training (default: the temp directory).
+# It should be on a disk and not a tmpfs, so datasets larger than the memory fit into it.
+TRAINING_DATA_DIR = os.getenv('TRAINING_DATA_DIR') or None
 
-# Retrain a model based on a training job
-def retrain(job_id):
+
+# Retrain a model based on a training job.
+# `should_stop` is checked between batches; when it returns True, the job stops and raises TrainingCancelled.
+# A job that was stopped or failed continues from the checkpoint of its last epoch.
+def retrain(job_id, should_stop=None):
     # Constants
     DETECTOR_PATH = './models/hand_landmarker.task'
+    BATCH_SIZE = int(os.getenv('TRAINING_BATCH_SIZE', '32'))
     JOB = TrainingJob.objects.get(id=job_id)
     NEW_NAME = JOB.name
     DATASET = JOB.dataset
     BASE_MODEL = JOB.base_model
 
-    # Get base model info
+    # Get base model info from its row, the job process has no model settings in its environment
     MODEL_PATH = BASE_MODEL.model_file.path
     BASE_MODEL_NAME = BASE_MODEL.name
-    MODEL_SETTING = f'../models/{BASE_MODEL_NAME}.env'
-    load_dotenv(MODEL_SETTING)
-    NUM_FEATURES = int(os.getenv('NUM_FEATURES'))
-    SELECT_WORDS = os.getenv('WORDS').split(',')
-    FPS = float(os.getenv('FPS'))
+    if not BASE_MODEL.words:
+        raise ValueError(f"Base model '{BASE_MODEL_NAME}' has no words set")
+    SELECT_WORDS = BASE_MODEL.words.split(',')
+    FPS = BASE_MODEL.fps
+    # Fall back to the model input shape if the row has no shape information
+    NUM_FEATURES = BASE_MODEL.num_features or keras.models.load_model(MODEL_PATH).input_shape[2]
 
     # Get dataset info
+    if DATASET.status != 'READY':
+        raise ValueError(f"Dataset '{DATASET.name}' is not ready to be trained on (status {DATASET.status})")
     DATASET_PATH = DATASET.root_directory
 
-    # Load the base model
-    model = keras.models.load_model(MODEL_PATH)
-
-    # Load, pad, and split the dataset
-    print("Loading dataset...")
-    print(f"Selected words: {SELECT_WORDS}")
-    print(f"Dataset path: {DATASET_PATH}")
-    print(f"Detector path: {DETECTOR_PATH}")
-    print(f"Base model: {BASE_MODEL_NAME}")
-    X, y, num_videos, highest_frame, bad_videos = prep.get_data(SELECT_WORDS, DATASET_PATH, DETECTOR_PATH)
-    padded_X, mask = prep.padX(X, num_videos, highest_frame, NUM_FEATURES)
-    if num_videos < 2:
-        X_train, y_train = padded_X, y
-        X_test, y_test = [[[]]], []
-    else:
-        X_train, X_test, y_train, y_test = train_test_split(padded_X, y, test_size=0.2, random_state=42)
-    X_train = np.array(X_train)
-    X_test = np.array(X_test)
-    y_train = np.array(y_train)
-    y_test = np.array(y_test)
-
-    # Retrain the model
-    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
-    early_stopping = EarlyStopping(monitor='loss', patience=3, restore_best_weights=True)
-    model.fit(X_train, y_train, epochs=100, callbacks=[early_stopping])
-
-    # Evaluate the model
-    if num_videos < 2:
-        test_loss, test_accuracy = 0.0,0.0
-        word_accuracy = {}
-    else:
-        test_loss, test_accuracy = model.evaluate(X_test, y_test)
-        word_accuracy = prep.get_word_accuracy(SELECT_WORDS, model, X_test, y_test)
-
-    # Save the model
-    with tempfile.TemporaryDirectory() as temp_dir:
-        model.save(f"{temp_dir}/{NEW_NAME}.keras")
-        trained_model = TrainedModel(name=NEW_NAME, max_frames=highest_frame, num_features=NUM_FEATURES, accuracy=test_accuracy, words=','.join(SELECT_WORDS), fps=FPS, word_accuracy=word_accuracy)
-        trained_model.model_file.save(f"{NEW_NAME}.keras", File(open(f"{temp_dir}/{NEW_NAME}.keras", 'rb')))
-        trained_model.save()
-
-    # Save the model settings
-    with open(f"./models/{NEW_NAME}.env", "w") as file:
-        file.write(f"MAX_FRAMES={highest_frame}\n")
-        file.write(f"NUM_FEATURES={NUM_FEATURES}\n")
-        file.write(f"WORDS={','.join(SELECT_WORDS)}\n")
-        file.write(f"FPS={FPS}\n")
-        file.write(f"TEST_ACC={test_accuracy}\n")
-        file.write(f'WORD_ACC="{word_accuracy}"\n')
+    # Load and split the dataset
+    data_dir = None
+    # The extracted landmarks are deleted when the job ends, also when it is stopped or fails
+    try:
+        print("Loading dataset...")
+        print(f"Selected words: {SELECT_WORDS}")
+        print(f"Dataset path: {DATASET_PATH}")
+        print(f"Detector path: {DETECTOR_PATH}")
+        print(f"Base model: {BASE_MODEL_NAME}")
+        if DATASET.kind == 'shards':
+            # The landmarks are in the shards already, they are memory mapped instead of extracted from videos
+            X, y, num_videos, highest_frame, bad_videos = prep.get_shard_data(SELECT_WORDS, DATASET_PATH)
+        else:
+            # The landmarks are written to memory mapped shards, deleted when the job ends
+            print(f"Extraction workers: {JOB.extraction_workers}")
+            # The manifest of the dataset lets the extraction skip duplicates and read cached videos by their hash
+            manifest = dataset_manifest.read_manifest(DATASET_PATH)
+            if manifest is not None:
+                print(f"Dataset manifest: {len(manifest['videos'])} videos, {len(manifest['duplicates'])} groups of duplicates")
+            data_dir = tempfile.TemporaryDirectory(prefix=f'job_{job_id}_', dir=TRAINING_DATA_DIR)
+            X, y, num_videos, highest_frame, bad_videos = prep.get_data(SELECT_WORDS, DATASET_PATH, DETECTOR_PATH, workers=JOB.extraction_workers,
+                                                                        output_dir=os.path.join(data_dir.name, 'landmarks'), manifest=manifest)
+        # Split the video indices, so only the test set is ever padded
+        if num_videos < 2:
+            train_indices, test_indices = np.arange(num_videos), np.array([], dtype=int)
+        else:
+            train_indices, test_indices = train_test_split(np.arange(num_videos), test_size=0.2, random_state=42)
+
+        # The training videos are streamed in batches of similar length instead of padding all of them to highest_frame
+        train_dataset = prep.make_dataset([X[i] for i in train_indices], [y[i] for i in train_indices], NUM_FEATURES, batch_size=BATCH_SIZE)
+
+        # Continue from the last checkpoint of the job, or start with the base model
+        early_stopping = ResumableEarlyStopping(monitor='loss', patience=3, restore_best_weights=True)
+        fingerprint = {'base_model': BASE_MODEL.id, 'dataset': DATASET.id, 'words': SELECT_WORDS,
+                       'num_videos': num_videos, 'highest_frame': highest_frame}
+        checkpoint = JobCheckpoint(job_id, fingerprint, early_stopping, should_stop,
+                                   on_save=lambda epochs: TrainingJob.objects.filter(id=job_id).update(epochs_completed=epochs))
+        resumed = checkpoint.load()
+        if resumed is not None:
+            model, initial_epoch = resumed
+        else:
+            model = prep.make_length_agnostic(keras.models.load_model(MODEL_PATH))
+            model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+            initial_epoch = 0
+
+        # Retrain the model, the early stopping has to run before the checkpoint to save its current state
+        model.fit(train_dataset, epochs=100, initial_epoch=initial_epoch, callbacks=[early_stopping, checkpoint])
+        if checkpoint.cancelled:
+            raise TrainingCancelled(f"Training job {job_id} was stopped")
+
+        # Evaluate the model on the whole test set, streamed in batches of similar length like the training set
+        if num_videos < 2:
+            test_accuracy = 0.0
+            word_accuracy = {}
+            confusion_matrix = []
+            top_k_accuracy = {}
+        else:
+            test_dataset = prep.make_dataset([X[i] for i in test_indices], [y[i] for i in test_indices], NUM_FEATURES, batch_size=256, shuffle=False)
+            evaluation = prep.evaluate_dataset(model, test_dataset, SELECT_WORDS)
+            test_accuracy = evaluation['accuracy']
+            word_accuracy = evaluation['word_accuracy']
+            confusion_matrix = evaluation['confusion_matrix']
+            top_k_accuracy = evaluation['top_k_accuracy']
+            print(f"Test accuracy: {test_accuracy}, top-k accuracy: {top_k_accuracy}")
+
+        # Save the model
+        with tempfile.TemporaryDirectory() as temp_dir:
+            model.save(f"{temp_dir}/{NEW_NAME}.keras")
+            trained_model = TrainedModel(name=NEW_NAME, max_frames=highest_frame, num_features=NUM_FEATURES, accuracy=test_accuracy, words=','.join(SELECT_WORDS), fps=FPS,
+                                         word_accuracy=word_accuracy, confusion_matrix=confusion_matrix, top_k_accuracy=top_k_accuracy)
+            trained_model.model_file.save(f"{NEW_NAME}.keras", File(open(f"{temp_dir}/{NEW_NAME}.keras", 'rb')))
+            trained_model.save()
+
+        # Save the model settings
+        with open(f"./models/{NEW_NAME}.env", "w") as file:
+            file.write(f"MAX_FRAMES={highest_frame}\n")
+            file.write(f"NUM_FEATURES={NUM_FEATURES}\n")
+            file.write(f"WORDS={','.join(SELECT_WORDS)}\n")
+            file.write(f"FPS={FPS}\n")
+            file.write(f"TEST_ACC={test_accuracy}\n")
+            file.write(f'WORD_ACC="{word_accuracy}"\n')
+
+        # The checkpoint is only needed until the job has completed
+        checkpoint.clear()
+    finally:
+        if data_dir is not None:
+            data_dir.cleanup()
 
     return trained_model
@@ -1,12 +1,14 @@
 """
 File: shared_state.py
-Description: Source code which allows the different threads in the admin UI to communicate.
+Description: Source code which allows the admin UI and the training workers to communicate.
+The state is kept in the database, so it works across processes and survives restarts.
 
 Contributors:
 David Schoen
+Michael Koenig
 
 Created: 2024-12-15
-Last Modified: 2024-12-15
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -14,19 +16,17 @@ URL: https://git.chalmers.se/courses/dit826/2024/group4
 License: MIT License (see LICENSE file for details)
 """
 
-# shared_state.py
-from threading import Event
-
-# Dictionary to store stop events for different jobs
-job_events = {}
-
-def get_event(job_id):
-    """Get or create an event for a specific job ID."""
-    if job_id not in job_events:
-        job_events[job_id] = Event()
-    return job_events[job_id]
-    
-def clear_event(job_id):
-    """Clear the stop event for a job."""
-    if job_id in job_events:
-        del job_events[job_id]
+from .models import TrainingJob
+
+
+def request_stop(job_id):
+    """Ask the worker running a job to stop it. Returns False if the job isn't running."""
+    return TrainingJob.objects.filter(id=job_id, status='IN_PROGRESS').update(cancel_requested=True) > 0
+
+def is_stop_requested(job_id):
+    """Check if a stop was requested for a job."""
+    return TrainingJob.objects.filter(id=job_id, cancel_requested=True).exists()
+
+def clear_stop(job_id):
+    """Clear the stop request of a job."""
+    TrainingJob.objects.filter(id=job_id).update(cancel_requested=False)
@@ -0,0 +1,257 @@
+"""
+File: streaming.py
+Description: Source code for live recognition over a WebSocket.
+The study page streams camera frames (or landmarks) while it records. The landmarks are
+detected frame by frame into a rolling buffer, a provisional prediction is sent as soon as
+enough frames have arrived, and the final prediction is sent when the recording stops.
+
+Protocol (WebSocket /ws/recognize/?word=<word>):
+- binary message starting with the landmark payload magic: landmarks in the format of
+  prediction.build_landmark_payload
+- other binary messages: 8 byte little endian float64 timestamp in ms, followed by an encoded image (JPEG, PNG or WebP)
+- text message {"type": "stop"}: end of the recording, the server answers with the final result and closes
+
+A stream that sends nothing for STREAM_IDLE_TIMEOUT seconds is closed, so it doesn't keep a detector from the pool.
+At most STREAM_MAX_DETECTORS streams hold a detector at the same time, so streams can't take every detector
+from the uploads. A stream that can't get one is closed with code 1013, and the study page uploads the video instead.
+With SAVE_RECORDINGS=True the frames and landmarks of a stream are archived at the end, like an upload.
+
+The server sends {"type": "provisional", "word": ..., "probability": ...} while frames arrive,
+and {"type": "final", "result": ...} or {"type": "final", "error": ...} at the end.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import json
+import asyncio
+import time
+import struct
+import logging
+from contextlib import ExitStack
+from threading import BoundedSemaphore
+from urllib.parse import parse_qs
+import sys
+import numpy as np
+import cv2 as cv
+sys.path.insert(1, 'model_training/')
+import landmark_detector as ld
+from .model_registry import registry
+from .prediction import (detector_pool, prediction_executor, parse_landmark_payload, predict_landmarks, should_archive,
+                         DETECTOR_POOL_SIZE, LANDMARK_PAYLOAD_MAGIC)
+from .recording_archiver import StreamRecording
+from .views import prediction_result
+from . import metrics
+
+# Number of frames with hands needed for the first provisional prediction,
+# and how many new frames with hands arrive between two provisional predictions
+STREAM_MIN_FRAMES = int(os.getenv('STREAM_MIN_FRAMES', '10'))
+STREAM_PREDICT_EVERY = int(os.getenv('STREAM_PREDICT_EVERY', '5'))
+# Seconds a stream can be idle before it is closed and its detector goes back to the pool
+STREAM_IDLE_TIMEOUT = float(os.getenv('STREAM_IDLE_TIMEOUT', '30'))
+# Number of streams that may hold a detector from the pool at the same time, the rest of the pool is left for uploads
+STREAM_MAX_DETECTORS = int(os.getenv('STREAM_MAX_DETECTORS', str(DETECTOR_POOL_SIZE // 2)))
+# Number of frames of a stream that are kept for its recording, later frames aren't saved
+STREAM_MAX_SAVED_FRAMES = int(os.getenv('STREAM_MAX_SAVED_FRAMES', '600'))
+
+FRAME_HEADER = struct.Struct('<d')
+
+logger = logging.getLogger('asl')
+
+stream_detector_slots = BoundedSemaphore(max(0, STREAM_MAX_DETECTORS))
+
+
+# Recognition state of one stream. The methods are blocking and have to run outside of the event loop.
+class StreamSession:
+    def __init__(self, correct_class):
+        self.correct_class = correct_class
+        self.active_model = registry.get()
+        # Rolling buffer with the landmarks of the last max_frames frames with hands
+        self.buffer = np.zeros((self.active_model.max_frames, self.active_model.num_features), dtype=np.float32)
+        self.count = 0
+        self.new_frames = 0
+        self.detector = None
+        self._frame = np.zeros((ld.MAX_HANDS, ld.NUM_LANDMARKS, 3), dtype=np.float32)
+        self._next_timestamp = 0.0
+        self._exit_stack = ExitStack()
+        # The frames and all landmarks are only kept if the stream is archived at the end
+        self.recording = None
+        self.landmarks = None
+        if should_archive(self.active_model, correct_class):
+            self.recording = StreamRecording(self.active_model.fps, STREAM_MAX_SAVED_FRAMES)
+            self.landmarks = []
+
+    # Add a binary message to the stream. Returns a provisional prediction or None.
+    def add_message(self, data):
+        if data[:len(LANDMARK_PAYLOAD_MAGIC)] == LANDMARK_PAYLOAD_MAGIC:
+            return self.add_landmarks(parse_landmark_payload(data, self.active_model))
+
+        if len(data) <= FRAME_HEADER.size:
+            raise ValueError("The frame message is too short")
+        timestamp, = FRAME_HEADER.unpack_from(data)
+        # Frames that arrive faster than the model fps are skipped before they are decoded
+        if not self._take_frame(timestamp):
+            return None
+        start_time = time.perf_counter()
+        image = cv.imdecode(np.frombuffer(data, dtype=np.uint8, offset=FRAME_HEADER.size), cv.IMREAD_COLOR)
+        metrics.frame_duration.observe(time.perf_counter() - start_time, stage='decode')
+        if image is None:
+            raise ValueError("The frame could not be decoded")
+        if self.recording is not None:
+            self.recording.add(timestamp, memoryview(data)[FRAME_HEADER.size:])
+        return self._detect(timestamp, image)
+
+    # Run the detector on one frame. Frames that arrive faster than the model fps are skipped.
+    def add_frame(self, timestamp_ms, frame):
+        if not self._take_frame(timestamp_ms):
+            return None
+        return self._detect(timestamp_ms, frame)
+
+    # Check if a frame is sampled at the model fps
+    def _take_frame(self, timestamp_ms):
+        fps = self.active_model.fps
+        if fps:
+            if timestamp_ms < self._next_timestamp:
+                return False
+            self._next_timestamp = (np.floor(timestamp_ms * fps / 1000 + 0.5) + 0.5) * 1000 / fps
+        return True
+
+    # Run the detector on a sampled frame. Returns a provisional prediction or None.
+    def _detect(self, timestamp_ms, frame):
+        if self.detector is None:
+            # Streams only get their share of the pool, raises TimeoutError if it is used up
+            if not stream_detector_slots.acquire(blocking=False):
+                raise TimeoutError("Too many streams are running, upload the video instead")
+            self._exit_stack.callback(stream_detector_slots.release)
+            # The detector is kept for the whole stream, so VIDEO mode can track the hands between frames
+            self.detector = self._exit_stack.enter_context(detector_pool.detector())
+            if isinstance(self.detector, ld.VideoDetector):
+                self.detector.start_video()
+
+        start_time = time.perf_counter()
+        mp_image = ld.to_mp_image(frame)
+        if isinstance(self.detector, ld.VideoDetector):
+            detection_result = self.detector.detect(mp_image, timestamp_ms)
+        else:
+            detection_result = self.detector.detect(mp_image)
+        metrics.frame_duration.observe(time.perf_counter() - start_time, stage='detection')
+
+        if not detection_result.hand_landmarks:
+            return None
+        self._frame[:] = 0
+        ld.fill_landmark_frame(self._frame, detection_result.hand_landmarks)
+        self._append(self._frame.reshape(-1))
+        return self._get_provisional()
+
+    # Add landmarks that were detected by the client, as a (frames, features) array
+    def add_landmarks(self, features):
+        for row in features:
+            self._append(row)
+        return self._get_provisional()
+
+    def _append(self, row):
+        # Drop the oldest frame when the buffer is full
+        if self.count == len(self.buffer):
+            self.buffer[:-1] = self.buffer[1:]
+            self.count -= 1
+        self.buffer[self.count] = 0
+        self.buffer[self.count, :len(row)] = row
+        if self.landmarks is not None and len(self.landmarks) < STREAM_MAX_SAVED_FRAMES:
+            self.landmarks.append(self.buffer[self.count].copy())
+        self.count += 1
+        self.new_frames += 1
+
+    def _get_provisional(self):
+        if self.count < STREAM_MIN_FRAMES or self.new_frames < STREAM_PREDICT_EVERY:
+            return None
+        self.new_frames = 0
+        return predict_landmarks(self.active_model, self.buffer[:self.count], self.correct_class, archive=False)
+
+    # Get the final prediction over the buffered frames, or None if no hands were detected.
+    # The recording is archived with the landmarks of every frame, not only the buffered ones.
+    def finish(self):
+        if self.count == 0:
+            return None
+        if self.landmarks is None:
+            return predict_landmarks(self.active_model, self.buffer[:self.count], self.correct_class, archive=False)
+        video = self.recording if self.recording.frames else None
+        return predict_landmarks(self.active_model, self.buffer[:self.count], self.correct_class,
+                                 video=video, landmarks=np.stack(self.landmarks))
+
+    # Give the detector back to the pool. Doesn't block, so it can run on the event loop.
+    def close(self):
+        self._exit_stack.close()
+
+
+# Function to run a blocking function outside of the event loop
+async def run_blocking(function, *args):
+    return await prediction_executor.run(function, *args)
+
+async def send_json(send, data):
+    await send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+# Function to wait for the next message of a stream, raises ValueError if the client is idle for too long
+async def receive_message(receive):
+    try:
+        return await asyncio.wait_for(receive(), STREAM_IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ValueError(f"No message received for {STREAM_IDLE_TIMEOUT:g} seconds")
+
+# Function to parse a text message of a stream, which has to be a JSON object
+def parse_command(text):
+    command = json.loads(text)
+    if not isinstance(command, dict):
+        raise ValueError("A text message must be a JSON object")
+    return command
+
+# ASGI application for the /ws/recognize/ WebSocket
+async def recognize_stream(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    word = parse_qs(scope.get('query_string', b'').decode()).get('word', [None])[0]
+    try:
+        session = await run_blocking(StreamSession, word)
+    except (ValueError, TimeoutError) as e:
+        logger.error(f"Can't start a recognition stream: {e}")
+        await send({'type': 'websocket.close', 'code': 1011})
+        return
+
+    await send({'type': 'websocket.accept'})
+    try:
+        while True:
+            message = await receive_message(receive)
+            if message['type'] == 'websocket.disconnect':
+                break
+
+            if message.get('bytes') is not None:
+                prediction = await run_blocking(session.add_message, message['bytes'])
+                if prediction is not None:
+                    await send_json(send, {'type': 'provisional', 'word': prediction[0], 'probability': float(prediction[1])})
+            elif message.get('text') is not None:
+                if parse_command(message['text']).get('type') != 'stop':
+                    raise ValueError("Unknown message type")
+                prediction = await run_blocking(session.finish)
+                result, _ = prediction_result(prediction, word)
+                await send_json(send, {'type': 'final', **result})
+                await send({'type': 'websocket.close', 'code': 1000})
+                break
+    except TimeoutError as e:
+        # The server is busy, the client can upload the video instead
+        logger.warning(f"Closing a recognition stream: {e}")
+        await send({'type': 'websocket.close', 'code': 1013, 'reason': str(e)})
+    except ValueError as e:
+        await send_json(send, {'type': 'final', 'error': str(e)})
+        await send({'type': 'websocket.close', 'code': 1008})
+    finally:
+        session.close()
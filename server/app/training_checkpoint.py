@@ -0,0 +1,158 @@
+"""
+File: training_checkpoint.py
+Description: Source code for checkpointing training jobs.
+After every epoch the model (with the optimizer state) and the early stopping state are saved
+under the job's directory, so a stopped or failed job continues from its last epoch.
+The callback also checks between batches if the job should stop.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import keras
+from keras.callbacks import EarlyStopping
+
+# Directory with one checkpoint directory per training job
+CHECKPOINT_DIR = os.getenv('TRAINING_CHECKPOINT_DIR', './models/jobs')
+# How often (in seconds) the job's stop signal is checked during training
+CANCEL_CHECK_INTERVAL = float(os.getenv('TRAINING_CANCEL_CHECK_INTERVAL', '2'))
+
+logger = logging.getLogger('asl')
+
+
+# Raised when a training job was stopped before it finished
+class TrainingCancelled(Exception):
+    pass
+
+
+def get_checkpoint_dir(job_id, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f'job_{job_id}')
+
+
+# EarlyStopping that can continue with the state of an earlier run instead of starting over
+class ResumableEarlyStopping(EarlyStopping):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.resume_state = None
+        self.resume_best_weights = None
+
+    def on_train_begin(self, logs=None):
+        super().on_train_begin(logs)
+        if self.resume_state is not None:
+            self.wait = self.resume_state['wait']
+            self.best = self.resume_state['best']
+            self.best_epoch = self.resume_state['best_epoch']
+            self.best_weights = self.resume_best_weights
+
+    def get_state(self):
+        return {
+            'wait': self.wait,
+            'best': None if self.best is None else float(self.best),
+            'best_epoch': self.best_epoch,
+        }
+
+
+# Keras callback which checkpoints a training job after every epoch.
+# `fingerprint` describes the training data, a checkpoint is only used if the data is still the same.
+# `should_stop` is called between batches, and `on_save` gets the number of completed epochs.
+class JobCheckpoint(keras.callbacks.Callback):
+    def __init__(self, job_id, fingerprint, early_stopping=None, should_stop=None, on_save=None, checkpoint_dir=CHECKPOINT_DIR):
+        super().__init__()
+        self.directory = get_checkpoint_dir(job_id, checkpoint_dir)
+        self.fingerprint = json.loads(json.dumps(fingerprint))
+        self.early_stopping = early_stopping
+        self.should_stop = should_stop
+        self.on_save = on_save
+        self.cancelled = False
+        self._last_check = 0.0
+
+    @property
+    def model_path(self):
+        return os.path.join(self.directory, 'checkpoint.keras')
+
+    @property
+    def best_weights_path(self):
+        return os.path.join(self.directory, 'best.weights.h5')
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, 'state.json')
+
+    # Load the last checkpoint. Returns (model, initial epoch), or None if there is no usable checkpoint.
+    def load(self):
+        try:
+            with open(self.state_path) as file:
+                state = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get('fingerprint') != self.fingerprint or not os.path.exists(self.model_path):
+            logger.info(f"Ignoring checkpoint in {self.directory}, the training data has changed")
+            return None
+
+        # The .keras file contains the optimizer state, so the model must not be compiled again
+        model = keras.models.load_model(self.model_path)
+
+        if self.early_stopping is not None and state.get('early_stopping') is not None:
+            self.early_stopping.resume_state = state['early_stopping']
+            if os.path.exists(self.best_weights_path):
+                current_weights = model.get_weights()
+                model.load_weights(self.best_weights_path)
+                self.early_stopping.resume_best_weights = model.get_weights()
+                model.set_weights(current_weights)
+
+        logger.info(f"Resuming from the checkpoint of epoch {state['epoch'] + 1} in {self.directory}")
+        return model, state['epoch'] + 1
+
+    # Delete the checkpoint, e.g. after the job completed
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.should_stop is None or time.monotonic() - self._last_check < CANCEL_CHECK_INTERVAL:
+            return
+        self._last_check = time.monotonic()
+        if self.should_stop():
+            logger.info("Stopping the training")
+            self.cancelled = True
+            self.model.stop_training = True
+
+    def on_epoch_end(self, epoch, logs=None):
+        # An epoch that was stopped in the middle isn't saved, the job repeats it when it continues
+        if self.cancelled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to temporary files first, so a crash never leaves a half-written checkpoint
+        tmp_model_path = os.path.join(self.directory, 'checkpoint.tmp.keras')
+        self.model.save(tmp_model_path)
+        os.replace(tmp_model_path, self.model_path)
+
+        state = {'epoch': epoch, 'fingerprint': self.fingerprint, 'early_stopping': None}
+        if self.early_stopping is not None:
+            state['early_stopping'] = self.early_stopping.get_state()
+            # The weights of this epoch are the best weights so far
+            if self.early_stopping.best_weights is not None and self.early_stopping.best_epoch == epoch:
+                tmp_weights_path = os.path.join(self.directory, 'best.tmp.weights.h5')
+                self.model.save_weights(tmp_weights_path)
+                os.replace(tmp_weights_path, self.best_weights_path)
+
+        tmp_state_path = os.path.join(self.directory, 'state.tmp.json')
+        with open(tmp_state_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_state_path, self.state_path)
+
+        if self.on_save is not None:
+            self.on_save(epoch + 1)
@@ -0,0 +1,284 @@
+"""
+File: training_queue.py
+Description: Source code for the database backed training job queue.
+The admin UI queues TrainingJobs, and workers started with `python manage.py run_training_worker`
+claim them and run every job in its own process, so training never competes with the web server.
+The workers also ingest the uploaded datasets (see dataset_ingestion.py), one at a time in a thread.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import traceback
+import multiprocessing
+from datetime import timedelta
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+# Default worker settings
+WORKER_CONCURRENCY = int(os.getenv('TRAINING_WORKER_CONCURRENCY', '1'))
+# Number of CPU threads per job (0 = no limit) and the niceness of the job processes
+WORKER_CPU_THREADS = int(os.getenv('TRAINING_WORKER_CPU_THREADS', '0'))
+WORKER_NICENESS = int(os.getenv('TRAINING_WORKER_NICENESS', '10'))
+POLL_INTERVAL = float(os.getenv('TRAINING_POLL_INTERVAL', '5'))
+# A running job whose worker hasn't sent a heartbeat for this many seconds is requeued
+HEARTBEAT_TIMEOUT = float(os.getenv('TRAINING_HEARTBEAT_TIMEOUT', '120'))
+# How often a job is started before it is marked as failed
+MAX_ATTEMPTS = int(os.getenv('TRAINING_MAX_ATTEMPTS', '3'))
+# How long (in seconds) a job may take to stop by itself after a stop request before it is killed
+CANCEL_GRACE_PERIOD = float(os.getenv('TRAINING_CANCEL_GRACE_PERIOD', '60'))
+
+logger = logging.getLogger('asl')
+
+
+# Put a job into the queue. Returns False if the job is already queued, running or completed.
+def queue_job(job_id):
+    from .models import TrainingJob
+    return TrainingJob.objects.filter(id=job_id, status__in=['PENDING', 'ERROR']).update(
+        status='QUEUED', queued_at=timezone.now(), claimed_by='', cancel_requested=False, error_message=''
+    ) > 0
+
+# Take a job out of the queue before a worker claims it. Returns False if the job isn't queued.
+def unqueue_job(job_id):
+    from .models import TrainingJob
+    return TrainingJob.objects.filter(id=job_id, status='QUEUED').update(status='PENDING', queued_at=None) > 0
+
+# Claim the oldest queued job for a worker. Returns the id of the job, or None if the queue is empty.
+def claim_next_job(worker_id):
+    from .models import TrainingJob
+    for job_id in TrainingJob.objects.filter(status='QUEUED').order_by('queued_at', 'id').values_list('id', flat=True):
+        # Only one worker can change the status from QUEUED, the others update no rows
+        claimed = TrainingJob.objects.filter(id=job_id, status='QUEUED').update(
+            status='IN_PROGRESS', claimed_by=worker_id, heartbeat_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            return job_id
+    return None
+
+# Requeue the running jobs of workers that stopped sending heartbeats, e.g. because they crashed.
+# Jobs that have already been started max_attempts times are marked as failed instead.
+def requeue_stale_jobs(heartbeat_timeout=HEARTBEAT_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+    from .models import TrainingJob
+    deadline = timezone.now() - timedelta(seconds=heartbeat_timeout)
+    stale = TrainingJob.objects.filter(Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True), status='IN_PROGRESS')
+    for job in stale:
+        release_job(job.id, job.claimed_by, max_attempts, f"Worker {job.claimed_by or 'unknown'} stopped responding")
+
+# Release a job that a worker stopped running without a result.
+# A stopped job goes back to PENDING, any other job is requeued until it has used up its attempts.
+# With count_attempt=False the run doesn't count as an attempt, e.g. when the worker is shut down.
+def release_job(job_id, worker_id, max_attempts=MAX_ATTEMPTS, reason='', count_attempt=True):
+    from .models import TrainingJob
+    jobs = TrainingJob.objects.filter(id=job_id, status='IN_PROGRESS', claimed_by=worker_id)
+    job = jobs.first()
+    if job is None:
+        return
+    if job.cancel_requested:
+        jobs.update(status='PENDING', claimed_by='', cancel_requested=False, queued_at=None)
+    elif not count_attempt:
+        jobs.update(status='QUEUED', claimed_by='', attempts=F('attempts') - 1)
+    elif job.attempts < max_attempts:
+        logger.warning(f"Requeuing training job {job_id}: {reason}")
+        jobs.update(status='QUEUED', claimed_by='', error_message=reason)
+    else:
+        logger.error(f"Training job {job_id} failed: {reason}")
+        jobs.update(status='ERROR', claimed_by='', error_message=reason, completed_at=timezone.now())
+
+# Function to get the peak resident memory of this process in bytes, None where it isn't available
+def get_peak_memory():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Run a claimed job and record the result and the peak memory of the job. Runs inside the job process.
+def run_job(job_id):
+    from .models import TrainingJob
+    from .retrain import retrain
+    from .shared_state import is_stop_requested
+    from .training_checkpoint import TrainingCancelled
+
+    jobs = TrainingJob.objects.filter(id=job_id)
+    try:
+        trained_model = retrain(job_id, should_stop=lambda: is_stop_requested(job_id))
+    except TrainingCancelled:
+        # The checkpoint is kept, so the job continues from its last epoch when it is started again
+        logger.info(f"Training job {job_id} was stopped")
+        jobs.update(status='PENDING', claimed_by='', cancel_requested=False, queued_at=None, peak_memory=get_peak_memory())
+        return
+    except Exception as e:
+        logger.error(f"Error during training job {job_id}: {e}")
+        if jobs.filter(cancel_requested=True).exists():
+            jobs.update(status='PENDING', claimed_by='', cancel_requested=False, queued_at=None, peak_memory=get_peak_memory())
+        else:
+            jobs.update(status='ERROR', claimed_by='', error_message=traceback.format_exc(), completed_at=timezone.now(),
+                        peak_memory=get_peak_memory())
+        return
+
+    peak_memory = get_peak_memory()
+    if peak_memory is not None:
+        logger.info(f"Training job {job_id} completed, peak memory {peak_memory / 1024 ** 2:.0f} MB")
+    jobs.update(status='COMPLETED', claimed_by='', cancel_requested=False, output_model=trained_model,
+                error_message='', completed_at=timezone.now(), peak_memory=peak_memory)
+
+# Entry point of a job process. Limits the CPU usage before TensorFlow is loaded.
+def _job_process(job_id, cpu_threads, niceness):
+    if niceness:
+        os.nice(niceness)
+    if cpu_threads:
+        for variable in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+            os.environ[variable] = str(cpu_threads)
+
+    import django
+    django.setup()
+
+    if cpu_threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(cpu_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(cpu_threads)
+
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+# Worker which claims queued jobs and runs up to `concurrency` of them at the same time
+class TrainingWorker:
+    def __init__(self, concurrency=WORKER_CONCURRENCY, cpu_threads=WORKER_CPU_THREADS, niceness=WORKER_NICENESS,
+                 poll_interval=POLL_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                 cancel_grace_period=CANCEL_GRACE_PERIOD):
+        self.concurrency = max(1, concurrency)
+        self.cpu_threads = cpu_threads
+        self.niceness = niceness
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.cancel_grace_period = cancel_grace_period
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # Job id -> [process, time the stop request was first seen]
+        self.running = {}
+        # Dataset id -> ingestion thread
+        self.ingesting = {}
+        self._stopping = False
+        # The job processes start with a fresh interpreter, so they don't inherit the worker's threads and connections
+        self._context = multiprocessing.get_context('spawn')
+
+    # Run until stop() is called. With once=True, return as soon as the queue is empty and all jobs are done.
+    def run(self, once=False):
+        logger.info(f"Training worker {self.worker_id} started")
+        try:
+            while not self._stopping:
+                claimed = self.poll()
+                if once and not claimed and not self.running and not self.ingesting:
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            self.shutdown()
+            close_old_connections()
+
+    # Ask the worker to stop after the current poll
+    def stop(self):
+        self._stopping = True
+
+    # Check the running jobs, recover stale jobs and claim new ones, and the same for the datasets to ingest.
+    # Returns the number of claimed jobs and datasets.
+    def poll(self):
+        from .models import TrainingJob
+
+        self._check_running()
+        requeue_stale_jobs(self.heartbeat_timeout, self.max_attempts)
+
+        claimed = 0
+        while len(self.running) < self.concurrency and not self._stopping:
+            job_id = claim_next_job(self.worker_id)
+            if job_id is None:
+                break
+            self._start(job_id)
+            claimed += 1
+
+        if self.running:
+            TrainingJob.objects.filter(id__in=list(self.running), claimed_by=self.worker_id).update(heartbeat_at=timezone.now())
+        return claimed + self.poll_ingestion()
+
+    # Check the running ingestion, recover stale ones and claim a new dataset. Returns the number of claimed datasets.
+    def poll_ingestion(self):
+        from .models import Dataset
+        from .dataset_ingestion import claim_next_dataset, requeue_stale_datasets, start_ingestion
+
+        for dataset_id, thread in list(self.ingesting.items()):
+            if not thread.is_alive():
+                del self.ingesting[dataset_id]
+        requeue_stale_datasets(self.heartbeat_timeout)
+
+        claimed = 0
+        if not self.ingesting and not self._stopping:
+            dataset_id = claim_next_dataset(self.worker_id)
+            if dataset_id is not None:
+                logger.info(f"Ingesting dataset {dataset_id}")
+                self.ingesting[dataset_id] = start_ingestion(dataset_id)
+                claimed += 1
+
+        if self.ingesting:
+            Dataset.objects.filter(id__in=list(self.ingesting), claimed_by=self.worker_id).update(heartbeat_at=timezone.now())
+        return claimed
+
+    def _start(self, job_id):
+        logger.info(f"Starting training job {job_id}")
+        # Not a daemon, so the job can start its own landmark extraction processes
+        process = self._context.Process(target=_job_process, args=(job_id, self.cpu_threads, self.niceness),
+                                        name=f'asl-training-{job_id}')
+        process.start()
+        self.running[job_id] = [process, None]
+
+    def _check_running(self):
+        from .models import TrainingJob
+
+        cancelled = set(TrainingJob.objects.filter(id__in=list(self.running), cancel_requested=True).values_list('id', flat=True))
+        for job_id, entry in list(self.running.items()):
+            process = entry[0]
+            if not process.is_alive():
+                process.join()
+                del self.running[job_id]
+                # The job process records the result itself, unless it crashed
+                release_job(job_id, self.worker_id, self.max_attempts, f"Training process exited with code {process.exitcode}")
+                logger.info(f"Training job {job_id} finished")
+            elif job_id in cancelled:
+                if entry[1] is None:
+                    entry[1] = time.monotonic()
+                    logger.info(f"Stop requested for training job {job_id}")
+                elif time.monotonic() - entry[1] > self.cancel_grace_period:
+                    logger.warning(f"Training job {job_id} didn't stop by itself, killing it")
+                    process.terminate()
+
+    # Stop the running job processes and put their jobs back into the queue
+    def shutdown(self):
+        for job_id, (process, _) in list(self.running.items()):
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            release_job(job_id, self.worker_id, self.max_attempts, "Training worker was shut down", count_attempt=False)
+        self.running = {}
+
+        # The ingestion threads end with the worker, their datasets are ingested again by the next worker
+        from .dataset_ingestion import release_dataset
+        for dataset_id in self.ingesting:
+            release_dataset(dataset_id, self.worker_id)
+        self.ingesting = {}
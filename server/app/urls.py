@@ -7,7 +7,7 @@ Michael Koenig
 Sofia Serbina
 
 Created: 2024-11-27
-Last Modified: 2024-12-29
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -24,5 +24,10 @@ urlpatterns = [
     path("", views.index, name="index"),
     path("browse/", views.browse, name="browse"),
     path("study/", views.study, name="study"),
-    path("upload-video/", views.upload_video, name="upload_video")
+    path("upload-video/", views.upload_video, name="upload_video"),
+    path("upload-landmarks/", views.upload_landmarks, name="upload_landmarks"),
+    path("model-info/", views.model_info, name="model_info"),
+    path("ready/", views.ready, name="ready"),
+    # Prometheus scrapes /metrics without a trailing slash by default
+    path("metrics", views.metrics_view, name="metrics")
 ]
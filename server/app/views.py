@@ -7,7 +7,7 @@ Michael Koenig
 Sofia Serbina
 
 Created: 2024-11-27
-Last Modified: 2024-12-29
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -15,14 +15,18 @@ URL: https://git.chalmers.se/courses/dit826/2024/group4
 License: MIT License (see LICENSE file for details)
 """
 
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 import mimetypes
 from django.shortcuts import render
 import os
 from django.conf import settings
 import random
 from django.views.decorators.csrf import csrf_exempt
-from .prediction import predict
+from .prediction import predict, predict_payload, prediction_executor, ModelVersionMismatch
+from .model_registry import registry
+from .warmup import warm_up
+from . import metrics
+import time
 import tempfile
 
 # View function for the index page
@@ -43,10 +47,9 @@ def browse(request):
 
 # View function for the study page
 def study(request):
-    WORDS = os.getenv('WORDS')
-    if WORDS is None:
-        raise ValueError("Environment variable 'WORDS' is not set.")
-    words = WORDS.split(',')
+    active_model = registry.get()
+    # Copy the words, so the list of the active model isn't changed
+    words = list(active_model.words)
 
     # don't show same word two times in a row
     last_word = request.GET.get('last_word')
@@ -56,14 +59,77 @@ def study(request):
     word = random.choice(words)
     instruction_video = f"videos/{word}.mp4"
 
-    return render(request, 'app/study.html', {'word': word, 'instruction_video': instruction_video})
-
-# View function for uploading a video
+    return render(request, 'app/study.html', {'word': word, 'instruction_video': instruction_video, 'fps': active_model.fps})
+
+# Function to turn a prediction into the result shown to the user and its status code.
+# Also counts the outcome of the prediction.
+def prediction_result(prediction, word):
+    if prediction is None:
+        metrics.predictions.inc(outcome='no_hands')
+        return {'error': "Couldn't detect any hand movement"}, 400
+    elif prediction[0] is None:
+        metrics.predictions.inc(outcome='low_confidence')
+        return {'error': "Couldn't detect any sign"}, 400
+    elif prediction[0] == word:
+        metrics.predictions.inc(outcome='correct')
+        return {'result': "Correctly signed!"}, 200
+    else:
+        metrics.predictions.inc(outcome='wrong')
+        return {'result': f"Wrong sign! We thought you signed {prediction[0]}."}, 200
+
+# Function to turn a prediction into the response shown to the user
+def prediction_response(prediction, word):
+    result, status = prediction_result(prediction, word)
+    return JsonResponse(result, status=status)
+
+# Function to add the stage durations of the request as Server-Timing header, if enabled
+def add_server_timing(response, timings, start_time):
+    timings['total'] = time.perf_counter() - start_time
+    if metrics.SERVER_TIMING:
+        response['Server-Timing'] = metrics.format_server_timing(timings)
+    return response
+
+# View function for the metrics of this server process in the Prometheus text format
+def metrics_view(request):
+    return HttpResponse(metrics.metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# View function for getting the information a client needs to send landmarks instead of a video
+def model_info(request):
+    active_model = registry.get()
+    return JsonResponse({
+        'version': active_model.version[:16],
+        'fps': active_model.fps,
+        'num_features': active_model.num_features,
+        'max_frames': active_model.max_frames,
+        'words': active_model.words,
+    })
+
+# View function for the readiness check of the load balancer.
+# Returns 503 until the model and the detector are loaded, and starts the warm-up if it hasn't run yet.
+def ready(request):
+    if not warm_up.ready:
+        warm_up.start()
+    status = warm_up.get_status()
+    return JsonResponse(status, status=200 if status['status'] == 'ready' else 503)
+
+# Function to save an uploaded video to a temporary file and predict the sign in it
+def predict_upload(video_file, word, file_ext):
+    with tempfile.NamedTemporaryFile(delete=True, suffix=file_ext) as tmp_file:
+        for chunk in video_file.chunks():
+            tmp_file.write(chunk)
+        tmp_file.flush()
+        return predict(tmp_file.name, word)
+
+# View function for uploading a video.
+# The detection and inference run in the prediction executor, so the view doesn't block a server worker.
 @csrf_exempt
-def upload_video(request):
+async def upload_video(request):
     if request.method == 'POST' and request.FILES.get('video'):
+        start_time = time.perf_counter()
+        timings = metrics.start_request_timings()
         video_file = request.FILES['video']
         word = request.POST.get('word')
+        metrics.upload_size.observe(video_file.size, kind='video')
 
         # Check if the uploaded file is a valid video
         mime_type, _ = mimetypes.guess_type(video_file.name)
@@ -74,22 +140,34 @@ def upload_video(request):
         if file_ext is None:
             return JsonResponse({'error': "Can't detect file extension for recording"}, status=400)
 
-        # Save the uploaded video to a temporary file
-        with tempfile.NamedTemporaryFile(delete=True, suffix=file_ext) as tmp_file:
-            tmp_file.write(video_file.read())
-            tmp_file_path = tmp_file.name
-            prediction = predict(tmp_file_path, word)
-
-        # Check the prediction result
-        if prediction is None:
-            return JsonResponse({'error': "Couldn't detect any hand movement"}, status=400)
-        elif prediction[0] is None:
-            return JsonResponse({'error': "Couldn't detect any sign"}, status=400)
-        elif prediction[0] == word:
-            result = "Correctly signed!"
-        else:
-            result = f"Wrong sign! We thought you signed {prediction[0]}."
+        try:
+            prediction = await prediction_executor.run(predict_upload, video_file, word, file_ext)
+        except TimeoutError:
+            return JsonResponse({'error': 'The server is busy, please try again'}, status=503)
 
-        return JsonResponse({'result': result})
+        return add_server_timing(prediction_response(prediction, word), timings, start_time)
 
     return JsonResponse({'error': 'Invalid request, no video found'}, status=400)
+
+# View function for uploading landmarks that were already detected by the client
+@csrf_exempt
+async def upload_landmarks(request):
+    if request.method == 'POST' and request.FILES.get('landmarks'):
+        start_time = time.perf_counter()
+        timings = metrics.start_request_timings()
+        landmarks_file = request.FILES['landmarks']
+        word = request.POST.get('word')
+        metrics.upload_size.observe(landmarks_file.size, kind='landmarks')
+
+        try:
+            prediction = await prediction_executor.run(predict_payload, landmarks_file.read(), word)
+        except TimeoutError:
+            return JsonResponse({'error': 'The server is busy, please try again'}, status=503)
+        except ModelVersionMismatch as e:
+            return JsonResponse({'error': str(e)}, status=409)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return add_server_timing(prediction_response(prediction, word), timings, start_time)
+
+    return JsonResponse({'error': 'Invalid request, no landmarks found'}, status=400)
@@ -0,0 +1,129 @@
+"""
+File: warmup.py
+Description: Source code for warming up a server process before it receives traffic.
+The heavy dependencies (TensorFlow, MediaPipe) are only imported when they are first needed,
+so the warm-up loads the active model, creates a hand detector and runs one dummy inference.
+It runs in the background when the ASGI server starts, and /ready/ reports when it is done.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import os
+import time
+import logging
+from threading import Lock, Thread
+import numpy as np
+from django.db import close_old_connections
+
+# Start the warm-up when the ASGI server starts
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'True') == 'True'
+# Number of hand detectors that are created during the warm-up (the others are created on demand)
+WARMUP_DETECTORS = int(os.getenv('WARMUP_DETECTORS', '1'))
+
+logger = logging.getLogger('asl')
+
+
+# Function to load the active model into the registry
+def warm_model():
+    from .model_registry import registry
+    active_model = registry.refresh()
+    if active_model is None:
+        raise ValueError("No active model found")
+    return active_model
+
+# Function to create hand detectors and run each of them on a blank frame
+def warm_detectors(count=WARMUP_DETECTORS):
+    from contextlib import ExitStack
+    from .prediction import detector_pool, ld
+
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    with ExitStack() as stack:
+        # The detectors are checked out at the same time, so the pool has to create new ones
+        for _ in range(min(count, detector_pool.size)):
+            detector = stack.enter_context(detector_pool.detector())
+            if isinstance(detector, ld.VideoDetector):
+                detector.start_video()
+                detector.detect(ld.to_mp_image(frame), 0)
+            else:
+                detector.detect(ld.to_mp_image(frame))
+
+# Function to run a dummy prediction through the scheduler, which also starts its thread
+def warm_inference(active_model):
+    from .prediction import get_probabilities
+    get_probabilities(active_model, np.zeros((1, active_model.num_features), dtype=np.float32))
+
+
+# Warm-up state of this process
+class WarmUp:
+    def __init__(self):
+        self.started = False
+        self.ready = False
+        self.error = None
+        # Step name -> duration in seconds
+        self.durations = {}
+        self._lock = Lock()
+
+    # Run the warm-up and wait for it. Returns the durations of the steps.
+    def run(self):
+        with self._lock:
+            self.started = True
+            self.error = None
+        try:
+            active_model = self._step('model', warm_model)
+            self._step('detector', warm_detectors)
+            self._step('inference', warm_inference, active_model)
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            self.error = str(e)
+            raise
+        self.ready = True
+        logger.info(f"Warm-up done in {sum(self.durations.values()):.2f} seconds")
+        return dict(self.durations)
+
+    # Run the warm-up in a background thread, unless it is already running or done
+    def start(self):
+        with self._lock:
+            if self.started and self.error is None:
+                return
+            self.started = True
+            self.error = None
+        Thread(target=self._run_in_background, name='asl-warmup', daemon=True).start()
+
+    def _run_in_background(self):
+        try:
+            self.run()
+        except Exception:
+            pass
+        finally:
+            # The thread has its own database connection, which has to be closed
+            close_old_connections()
+
+    def _step(self, name, function, *args):
+        start_time = time.perf_counter()
+        result = function(*args)
+        self.durations[name] = time.perf_counter() - start_time
+        return result
+
+    # Get the state for the readiness endpoint
+    def get_status(self):
+        if self.ready:
+            status = 'ready'
+        elif self.error is not None:
+            status = 'error'
+        elif self.started:
+            status = 'warming up'
+        else:
+            status = 'not started'
+        return {'status': status, 'error': self.error, 'durations': {name: round(duration, 3) for name, duration in self.durations.items()}}
+
+
+warm_up = WarmUp()
@@ -2,12 +2,14 @@
 File: asgi.py
 Description: ASGI config for aslproject project.
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django, WebSocket connections to /ws/recognize/ go to the live recognition.
 
 Contributors:
 Sofia Serbina
+Michael Koenig
 
 Created: 2024-11-27
-Last Modified: 2024-11-27
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -19,9 +21,51 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
+import asyncio
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aslproject.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, because it uses the models
+from app.streaming import recognize_stream
+from app.warmup import warm_up, WARMUP_ON_STARTUP
+from app.recording_archiver import recording_archiver
+
+# WebSocket routes, the paths are matched exactly
+websocket_routes = {
+    '/ws/recognize/': recognize_stream,
+}
+
+
+# Start the warm-up when the server starts. It runs in the background, so the server
+# accepts connections right away and /ready/ tells the load balancer when to send traffic.
+# When the server stops, the recordings that are still queued are saved first.
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if WARMUP_ON_STARTUP:
+                warm_up.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.to_thread(recording_archiver.flush)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'websocket':
+        route = websocket_routes.get(scope['path'])
+        if route is None:
+            # Reject the connection
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1000})
+            return
+        await route(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
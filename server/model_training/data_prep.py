@@ -7,7 +7,7 @@ Parisa Babaei
 Adam Faundez Laurokari
 
 Created: 2024-12-26
-Last Modified: 2025-01-02
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -16,14 +16,108 @@ License: MIT License (see LICENSE file for details)
 """
 
 import landmark_detector as ld
+import dataset_archive
+import dataset_manifest
+from landmark_cache import LandmarkCache
+from landmark_shards import LandmarkShards, ShardWriter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import multiprocessing
 import os
 import numpy as np
-from tqdm.notebook import tqdm
+from tqdm.auto import tqdm
 
-# Function that processes videos and extracts landmarks using the landmark detector
-def get_data(words, path, detector_path):
-    detector = ld.get_detector(detector_path)
+# Detector and landmark cache of a worker process, see _init_worker
+_worker_detector = None
+_worker_cache = None
+_worker_target_fps = None
 
+
+# Function that gets the landmark array of a video, through the landmark cache if there is one.
+# Videos inside a ZIP file are extracted to a temporary file first, unless their hash is known and they are cached.
+# The cache samples the video at its own target fps, which is part of the cache key.
+def _get_video_landmarks(video_path, detector, cache, video_hash=None, target_fps=None):
+    if cache is not None and video_hash is not None:
+        cached = cache.get(video_hash)
+        if cached is not None:
+            return cached
+    with dataset_archive.local_file(video_path) as local_path:
+        if cache is not None:
+            return cache.get_landmark_array(local_path, detector, video_hash)
+        return ld.get_landmark_array(local_path, detector, target_fps=target_fps)
+
+
+# Function that runs once in every worker process, so each worker owns its own detector
+def _init_worker(detector_path, video_mode, use_cache, target_fps=None):
+    global _worker_detector, _worker_cache, _worker_target_fps
+    _worker_detector = ld.get_detector(detector_path, video_mode)
+    _worker_cache = LandmarkCache(detector_path, target_fps, video_mode) if use_cache else None
+    _worker_target_fps = target_fps
+
+
+# Function that processes one video, with the detector of the worker process if none is given.
+# Errors are returned instead of raised, so one bad video doesn't stop the other videos.
+def _process_video(video_path, detector=None, cache=None, video_hash=None, target_fps=None):
+    if detector is None:
+        detector, cache, target_fps = _worker_detector, _worker_cache, _worker_target_fps
+    try:
+        return _get_video_landmarks(video_path, detector, cache, video_hash, target_fps), None
+    except Exception as e:
+        return None, str(e)
+
+
+# Function that lists the videos of every word as (word, video file, video path).
+# The path can be a directory inside a ZIP file, see dataset_archive.py.
+def list_videos(words, path):
+    videos = []
+    for word in words:
+        word_path = os.path.join(path, word)
+        video_files = [f for f in dataset_archive.listdir(word_path) if f.endswith('.mp4')]
+        videos += [(word, video_file, os.path.join(word_path, video_file)) for video_file in video_files]
+    return videos
+
+
+# Function that extracts the landmarks of the videos from list_videos using the landmark detector.
+# Yields the ((landmarks, hands, current_frames), error) of every video, in the order of the videos.
+# With video_mode, the detector tracks hands between frames, which is a lot faster.
+# With use_cache, landmarks of videos that were processed before are read from the landmark cache.
+# With more than one worker, the videos are processed in that many processes, each with its own detector.
+# The content hashes of the videos (e.g. from the dataset manifest) let cached videos skip reading the video.
+# With target_fps, the videos are sampled to that fps instead of using every frame.
+def iter_landmarks(videos, detector_path, video_mode=True, use_cache=True, workers=1, hashes=None, target_fps=None):
+    video_paths = [video_path for _, _, video_path in videos]
+    hashes = repeat(None) if hashes is None else hashes
+    if workers > 1:
+        # Spawn the workers, forking a process that has TensorFlow or MediaPipe loaded isn't safe
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(detector_path, video_mode, use_cache, target_fps)
+        )
+        chunksize = max(1, len(videos) // (workers * 4))
+        results = executor.map(_process_video, video_paths, repeat(None), repeat(None), hashes, chunksize=chunksize)
+    else:
+        executor = None
+        detector = ld.get_detector(detector_path, video_mode)
+        cache = LandmarkCache(detector_path, target_fps, video_mode) if use_cache else None
+        results = (_process_video(video_path, detector, cache, video_hash, target_fps) for video_path, video_hash in zip(video_paths, hashes))
+
+    try:
+        yield from results
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+# Function that processes videos and extracts landmarks using the landmark detector, see iter_landmarks.
+# The results are always in the same order as when processing the videos one after another.
+# With output_dir, the landmarks are written to landmark shards in that directory instead of being kept in memory,
+# and X holds memory mapped views of them, so the dataset doesn't have to fit into memory.
+# With the manifest of the dataset (see dataset_manifest.py), the videos aren't listed, duplicate videos and videos
+# that can't be opened are skipped, cached videos aren't read, and the frames are stored in arrays that are
+# allocated once for the frame count of the dataset.
+def get_data(words, path, detector_path, video_mode=True, use_cache=True, workers=1, output_dir=None, manifest=None):
     X = []
     y = []
 
@@ -33,76 +127,236 @@ def get_data(words, path, detector_path):
     bad_videos = 0
     print("data prep")
 
-    # Loop through each word using tqdm to show progress bar
-    for word in tqdm(words):
-        print(word)
-        word_path = os.path.join(path, word)
-        
-        video_files = [f for f in os.listdir(word_path) if f.endswith('.mp4')]
-        
-        for video_file in tqdm(video_files, desc=word):
-            video_path = os.path.join(word_path, video_file)
-            
-            try:
-                video_X = []
-                # Use the landmark detector function to get the landmarks and current frames
-                landmarks, current_frames = ld.get_landmarks(video_path, detector)
-                
-                if len(landmarks) == 0:
-                    bad_videos+=1
-                    continue
-                
-                if current_frames > highest_frame:
-                    highest_frame = current_frames
-                
-                for frame in range(len(landmarks)):
-                    features = np.array(landmarks[frame]).flatten()
-                    video_X.append(features)
-                
-                X.append(video_X)
-                y.append(words.index(word))
-                num_videos += 1
-
-            except Exception as e:
-                print(f"Error processing video {video_file}: {e}")
-                continue 
+    # List the videos of every word first, so they can be split between the workers
+    if manifest is not None:
+        entries = dataset_manifest.get_videos(manifest, words)
+        for word, video_file, info in entries:
+            if 'error' in info:
+                print(f"Error processing video {video_file}: {info['error']}")
+        entries = [entry for entry in entries if 'error' not in entry[2]]
+        videos = [(word, video_file, os.path.join(path, word, video_file)) for word, video_file, _ in entries]
+        hashes = [info['hash'] for _, _, info in entries]
+        expected_frames = sum(info['frames'] for _, _, info in entries)
+    else:
+        videos = list_videos(words, path)
+        hashes = None
+        expected_frames = None
+    results = iter_landmarks(videos, detector_path, video_mode, use_cache, workers, hashes)
+
+    # The frames are written to shards, or into one array for the frames of every video
+    writer = ShardWriter(output_dir, expected_frames=expected_frames) if output_dir is not None else None
+    frames = None
+    offset = 0
+
+    try:
+        # Loop through each video using tqdm to show progress bar
+        for (word, video_file, _), (result, error) in tqdm(zip(videos, results), total=len(videos)):
+            if error is not None:
+                print(f"Error processing video {video_file}: {error}")
+                continue
+
+            # The landmarks and current frames from the landmark detector function
+            landmarks, _, current_frames = result
+
+            if len(landmarks) == 0:
+                bad_videos+=1
+                if writer is not None:
+                    writer.skip(word, os.path.join(word, video_file), "No landmarks detected")
+                continue
+
+            if current_frames > highest_frame:
+                highest_frame = current_frames
+
+            # Every frame is a float32 row with the features of both hands
+            features = landmarks.reshape(len(landmarks), -1)
+            if writer is not None:
+                writer.add(features, word, source=os.path.join(word, video_file), num_frames=int(current_frames))
+            else:
+                if frames is None and expected_frames:
+                    # Only the pages that are written to take up memory
+                    frames = np.empty((expected_frames, features.shape[1]), dtype=np.float32)
+                if frames is not None and offset + len(features) <= len(frames) and features.shape[1] == frames.shape[1]:
+                    frames[offset:offset + len(features)] = features
+                    features = frames[offset:offset + len(features)]
+                    offset += len(features)
+                X.append(features)
+            y.append(words.index(word))
+            num_videos += 1
+    finally:
+        results.close()
+
+    if writer is not None:
+        writer.close()
+        shards = LandmarkShards(output_dir)
+        X = [shards[i] for i in range(len(shards))]
     return X, y, num_videos, highest_frame, bad_videos
 
 
-# Function that pads the data to the highest frame and feature length
-def padX(X, num_videos, highest_frame, num_features):
-    padded_X = np.zeros((num_videos, highest_frame, num_features))
-    mask = np.ones((num_videos, highest_frame, num_features)) 
+# Function that gets the samples of the words from a landmark shard dataset, with the same results as get_data.
+# The samples are memory mapped views, their frames are only read when the training needs them.
+def get_shard_data(words, path):
+    shards = LandmarkShards(path)
+    X = []
+    y = []
+    highest_frame = 0
+    for i, sample in enumerate(shards.samples):
+        if sample['word'] in words:
+            X.append(shards[i])
+            y.append(words.index(sample['word']))
+            # Like get_data, the highest frame count is the one of the videos if it is known
+            highest_frame = max(highest_frame, sample.get('num_frames', sample['length']))
+    bad_videos = sum(1 for sample in shards.skipped if sample['word'] in words)
+    print(f"Loaded {len(X)} samples from the landmark shards in {path}")
+    return X, y, len(X), highest_frame, bad_videos
+
+
+# Function that converts a video to a float32 (frames, features) array, and gets the
+# number of features in every frame. Frames with fewer features are padded with zeros.
+def _get_video_array(video, num_features):
+    if isinstance(video, np.ndarray) and video.ndim == 2:
+        # float16 shards are converted here, batch by batch
+        return np.asarray(video, dtype=np.float32), None
+    try:
+        return np.asarray(video, dtype=np.float32).reshape(len(video), -1), None
+    except ValueError:
+        # The frames don't all have the same number of features
+        widths = np.array([len(frame) for frame in video])
+        array = np.zeros((len(video), max(widths.max(), num_features)), dtype=np.float32)
+        for j, frame in enumerate(video):
+            array[j, :len(frame)] = frame
+        return array, widths
+
+
+# Function that pads the data to the highest frame and feature length.
+# Every video is copied into one preallocated float32 array as a single block.
+# The mask (1 for real values, 0 for padding) is only built if it is requested.
+def padX(X, num_videos, highest_frame, num_features, mask=True):
+    padded_X = np.zeros((num_videos, highest_frame, num_features), dtype=np.float32)
+    padding_mask = np.zeros((num_videos, highest_frame, num_features), dtype=np.float32) if mask else None
 
     for i in range(num_videos):
-        video = X[i]
-        for j in range(len(video)):
-            frame = video[j]
-            if len(frame) < num_features:
-                # Pad the frame with zeros if it is less than the number of features
-                padded_X[i, j, :] = np.pad(frame, (0, num_features - len(frame)), 'constant')
-                mask[i, j, len(frame):] = 0
+        if len(X[i]) == 0:
+            continue
+        video, widths = _get_video_array(X[i], num_features)
+        num_frames = min(len(video), highest_frame)
+        width = video.shape[1] if widths is None else num_features
+        padded_X[i, :num_frames, :width] = video[:num_frames, :width]
+
+        if mask:
+            if widths is None:
+                padding_mask[i, :num_frames, :width] = 1
             else:
-                padded_X[i, j, :] = frame
-        if len(video) < highest_frame:
-            mask[i, len(video):, :] = 0
-    return padded_X, mask
+                padding_mask[i, :num_frames] = np.arange(num_features) < widths[:num_frames, np.newaxis]
+    return padded_X, padding_mask
 
 
-# Function that gets the word accuracy of the model on the test set
-def get_word_accuracy(select_words, model, X_test, y_test):
-    dic = {}
-    for word in select_words:
-        dic[word] = [0,0]
+# Function that chooses bucket boundaries from the sequence lengths, so every bucket gets about the same number of videos.
+# The last boundary is larger than the longest sequence, as tf.data requires.
+def get_bucket_boundaries(lengths, num_buckets=8):
+    lengths = np.asarray(lengths)
+    if len(lengths) == 0:
+        return [1]
+    quantiles = np.quantile(lengths, np.linspace(0, 1, num_buckets + 1)[1:-1])
+    boundaries = sorted(set(int(np.ceil(q)) + 1 for q in quantiles))
+    if not boundaries or boundaries[-1] <= lengths.max():
+        boundaries.append(int(lengths.max()) + 1)
+    return boundaries
+
+
+# Function that makes a tf.data pipeline which streams the videos in X and groups them into batches of similar length.
+# X can be any sequence of (frames, features) arrays, items are only read when a batch needs them.
+# Every batch is padded with zeros to its bucket boundary - 1, so the model only runs a few different lengths
+# and a Masking layer skips the padding. The order is shuffled every epoch, and batches are prefetched.
+def make_dataset(X, y, num_features, batch_size=32, bucket_boundaries=None, shuffle=True, seed=42):
+    # Imported here, so the landmark extraction processes don't load TensorFlow
+    import tensorflow as tf
+
+    lengths = np.array([len(video) for video in X])
+    if bucket_boundaries is None:
+        bucket_boundaries = get_bucket_boundaries(lengths)
+    labels = np.asarray(y, dtype=np.int32)
+    rng = np.random.default_rng(seed)
+
+    def generator():
+        order = rng.permutation(len(labels)) if shuffle else range(len(labels))
+        for i in order:
+            video, _ = _get_video_array(X[i], num_features)
+            yield video[:, :num_features], labels[i]
+
+    dataset = tf.data.Dataset.from_generator(generator, output_signature=(
+        tf.TensorSpec(shape=(None, num_features), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.int32),
+    ))
+    dataset = dataset.bucket_by_sequence_length(
+        element_length_func=lambda video, label: tf.shape(video)[0],
+        bucket_boundaries=bucket_boundaries,
+        bucket_batch_sizes=[batch_size] * (len(bucket_boundaries) + 1),
+        pad_to_bucket_boundary=True,
+    )
+    # Tell Keras how many batches an epoch has
+    bucket_sizes = np.bincount(np.searchsorted(bucket_boundaries, lengths, side='right'), minlength=len(bucket_boundaries) + 1)
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(int(np.sum(-(-bucket_sizes // batch_size)))))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
 
-    for i in range(X_test.shape[0]):
-        X_prediction = X_test[i,:,:]
-        y_prediction = select_words[y_test[i]]
+# Function that makes a copy of a model which accepts sequences of any length.
+# The copy shares no state with the original, but has the same weights.
+def make_length_agnostic(model):
+    import keras
 
-        # Get the prediction of the model and get the word with the highest probability
-        prediction = select_words[np.argmax(model.predict(np.array([X_prediction]), verbose=0))]
-        if y_prediction == prediction:
-            dic[y_prediction][0] += 1
-        dic[y_prediction][1] += 1
+    if model.input_shape[1] is None:
+        return model
+    length_agnostic = keras.models.clone_model(model, input_tensors=keras.Input(shape=(None,) + tuple(model.input_shape[2:])))
+    length_agnostic.set_weights(model.get_weights())
+    return length_agnostic
 
-    return dic
\ No newline at end of file
+
+# Function that evaluates the model on the test set in batched forward passes.
+# Returns the accuracy, the [correct, total] count of every word, the confusion matrix
+# (rows are the true words, columns the predicted words) and the top-k accuracy for k = 1..top_k.
+def evaluate(model, X_test, y_test, select_words, batch_size=256, top_k=3):
+    y_true = np.asarray(y_test, dtype=int)
+    probabilities = model.predict(np.asarray(X_test), batch_size=batch_size, verbose=0) if len(y_true) > 0 else None
+    return _get_evaluation(probabilities, y_true, select_words, top_k)
+
+
+# Function that evaluates the model on a dataset from make_dataset, one batch at a time, see evaluate.
+# Only one batch of the test set is padded and in memory at a time.
+def evaluate_dataset(model, dataset, select_words, top_k=3):
+    probabilities = []
+    labels = []
+    for videos, batch_labels in dataset:
+        probabilities.append(np.asarray(model.predict_on_batch(videos)))
+        labels.append(batch_labels.numpy())
+    y_true = np.concatenate(labels).astype(int) if labels else np.array([], dtype=int)
+    return _get_evaluation(np.concatenate(probabilities) if probabilities else None, y_true, select_words, top_k)
+
+
+def _get_evaluation(probabilities, y_true, select_words, top_k):
+    num_words = len(select_words)
+    confusion = np.zeros((num_words, num_words), dtype=int)
+    top_k_accuracy = {}
+
+    if len(y_true) > 0:
+        y_pred = np.argmax(probabilities, axis=1)
+        np.add.at(confusion, (y_true, y_pred), 1)
+
+        # Rank of the true word among the predictions, 0 is the best
+        true_probabilities = probabilities[np.arange(len(y_true)), y_true]
+        ranks = np.sum(probabilities > true_probabilities[:, np.newaxis], axis=1)
+        for k in range(1, min(top_k, num_words) + 1):
+            top_k_accuracy[str(k)] = float(np.mean(ranks < k))
+
+    correct = np.diag(confusion)
+    totals = confusion.sum(axis=1)
+    return {
+        'accuracy': float(correct.sum() / totals.sum()) if totals.sum() else 0.0,
+        'word_accuracy': {word: [int(correct[i]), int(totals[i])] for i, word in enumerate(select_words)},
+        'confusion_matrix': confusion.tolist(),
+        'top_k_accuracy': top_k_accuracy,
+    }
+
+
+# Function that gets the word accuracy of the model on the test set
+def get_word_accuracy(select_words, model, X_test, y_test):
+    return evaluate(model, X_test, y_test, select_words)['word_accuracy']
@@ -0,0 +1,135 @@
+"""
+File: dataset_archive.py
+Description: Source code for datasets that stay in their uploaded ZIP file.
+A path like /media/datasets/words.zip/words/eat/video.mp4 points to a member of the ZIP file,
+so the videos of a dataset can be listed and read without extracting the whole ZIP file first.
+A video is only extracted to a temporary file while the landmark detector reads it.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from contextlib import contextmanager
+from collections import OrderedDict
+from threading import RLock
+import tempfile
+import zipfile
+import shutil
+import os
+
+# Maximum total size (in bytes) of the files in an uploaded ZIP file
+MAX_EXTRACT_SIZE = int(os.getenv('MAX_EXTRACT_SIZE', '10000000000'))
+# Number of ZIP files that are kept open to be read again
+MAX_OPEN_ARCHIVES = 8
+
+
+# Function to check an uploaded ZIP file before it is used, and get the name of its single root directory.
+# Raises ValueError if a member would be written outside of extract_to, if the content is too large,
+# or if there isn't exactly one root directory.
+def check_archive(zip_ref, extract_to):
+    # Security: Check for path traversal
+    for member in zip_ref.namelist():
+        abs_member_path = os.path.abspath(os.path.join(extract_to, member))
+        if not abs_member_path.startswith(os.path.abspath(extract_to) + os.sep):
+            raise ValueError("Attempted Path Traversal in ZIP File")
+
+    # Security: Check for ZIP bombs
+    total_size = sum(zinfo.file_size for zinfo in zip_ref.infolist())
+    if total_size > MAX_EXTRACT_SIZE:
+        raise ValueError("Extracted content exceeds the maximum allowed size. size:" + str(total_size))
+
+    # A root entry is a directory if it has members below it or ends with a slash
+    root_dirs = set(name.split('/')[0] for name in zip_ref.namelist() if '/' in name.rstrip('/') or name.endswith('/'))
+    if len(root_dirs) != 1:
+        raise ValueError("The ZIP file must contain a single root directory containing the dataset.")
+    return root_dirs.pop()
+
+
+# Function to split a path into the ZIP file and the path inside of it, (None, path) if it isn't inside a ZIP file
+def split_path(path):
+    head = path
+    while head and head != os.path.dirname(head):
+        if head.endswith('.zip') and os.path.isfile(head):
+            inner = os.path.relpath(path, head)
+            return head, '' if inner == '.' else inner.replace(os.sep, '/')
+        head = os.path.dirname(head)
+    return None, path
+
+
+# Open ZIP files by path, as (modification time, ZipFile) with the least recently used first
+_archives = OrderedDict()
+_archives_lock = RLock()
+
+# Open ZIP files are reused, the modification time makes sure a replaced file is opened again.
+# ZIP files that are replaced or not among the MAX_OPEN_ARCHIVES most recently used ones are closed,
+# members that are still being read stay readable until they are closed.
+def _get_archive(zip_path):
+    mtime = os.path.getmtime(zip_path)
+    with _archives_lock:
+        entry = _archives.pop(zip_path, None)
+        if entry is not None and entry[0] != mtime:
+            entry[1].close()
+            entry = None
+        if entry is None:
+            entry = (mtime, zipfile.ZipFile(zip_path, 'r'))
+        _archives[zip_path] = entry
+        while len(_archives) > MAX_OPEN_ARCHIVES:
+            _, (_, archive) = _archives.popitem(last=False)
+            archive.close()
+        return entry[1]
+
+
+# Function to list the names in a directory, which can be inside a ZIP file
+def listdir(path):
+    zip_path, inner = split_path(path)
+    if zip_path is None:
+        return os.listdir(path)
+
+    prefix = inner + '/' if inner else ''
+    names = set()
+    for name in _get_archive(zip_path).namelist():
+        if name.startswith(prefix) and len(name) > len(prefix):
+            names.add(name[len(prefix):].split('/')[0])
+    if not names and prefix not in _get_archive(zip_path).namelist():
+        raise FileNotFoundError(f"No such directory: '{path}'")
+    return sorted(names)
+
+# Function to check if a path is a directory, which can be inside a ZIP file
+def isdir(path):
+    zip_path, inner = split_path(path)
+    if zip_path is None:
+        return os.path.isdir(path)
+    if not inner:
+        return True
+    return any(name.startswith(inner + '/') for name in _get_archive(zip_path).namelist())
+
+
+# Get a path on disk for a file, which can be inside a ZIP file.
+# A file inside a ZIP file is extracted to a temporary file, which is deleted afterwards.
+@contextmanager
+def local_file(path):
+    zip_path, inner = split_path(path)
+    if zip_path is None:
+        yield path
+        return
+
+    # The member is opened before another thread can close the ZIP file
+    with _archives_lock:
+        try:
+            member = _get_archive(zip_path).open(inner)
+        except KeyError:
+            raise FileNotFoundError(f"No such file: '{path}'")
+    with member, tempfile.NamedTemporaryFile(suffix=os.path.splitext(inner)[1], delete=False) as tmp_file:
+        shutil.copyfileobj(member, tmp_file, 1024 * 1024)
+    try:
+        yield tmp_file.name
+    finally:
+        os.remove(tmp_file.name)
@@ -0,0 +1,110 @@
+"""
+File: dataset_manifest.py
+Description: Source code for the manifest of a video dataset, which is built once when the dataset is ingested.
+The manifest holds the content hash, size, frame count, fps, resolution and duration of every video,
+and lists the videos that have the same content. It is stored as a sidecar JSON file next to the dataset,
+so a training job knows the dataset before it decodes any video.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import dataset_archive
+from landmark_cache import get_file_hash
+import cv2 as cv
+import tempfile
+import json
+import os
+
+MANIFEST_VERSION = 1
+# Time (in seconds) to decode a video frame and detect its landmarks, when it hasn't been measured
+SECONDS_PER_FRAME = float(os.getenv('DETECTION_SECONDS_PER_FRAME', '0.01'))
+
+
+# Function to get the path of the manifest of a dataset, next to the ZIP file or the root directory
+def get_manifest_path(path):
+    zip_path, _ = dataset_archive.split_path(path)
+    return f"{zip_path or os.path.normpath(path)}.manifest.json"
+
+
+# Function to get the content hash, size, frame count, fps, resolution and duration of a video.
+# The frame count and fps are read from the container, so the video isn't decoded.
+def get_video_info(video_path):
+    with dataset_archive.local_file(video_path) as local_path:
+        info = {'hash': get_file_hash(local_path), 'size': os.path.getsize(local_path)}
+        cap = cv.VideoCapture(local_path)
+        try:
+            if not cap.isOpened():
+                return {**info, 'frames': 0, 'fps': 0.0, 'width': 0, 'height': 0, 'duration': 0.0, 'error': "The video can't be opened"}
+            frames = max(0, int(cap.get(cv.CAP_PROP_FRAME_COUNT)))
+            fps = float(cap.get(cv.CAP_PROP_FPS) or 0.0)
+            width = int(cap.get(cv.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+        finally:
+            cap.release()
+    return {**info, 'frames': frames, 'fps': fps, 'width': width, 'height': height, 'duration': frames / fps if fps else 0.0}
+
+
+# Function to build the manifest of the videos (.mp4) in the word folders of a dataset.
+# on_progress is called with the number of videos done and the number of videos.
+def build_manifest(path, on_progress=None):
+    words = sorted(item for item in dataset_archive.listdir(path) if dataset_archive.isdir(os.path.join(path, item)))
+    names = [f"{word}/{video_file}" for word in words
+             for video_file in sorted(dataset_archive.listdir(os.path.join(path, word))) if video_file.endswith('.mp4')]
+
+    videos = {}
+    for i, name in enumerate(names):
+        videos[name] = get_video_info(os.path.join(path, name))
+        if on_progress is not None:
+            on_progress(i + 1, len(names))
+
+    # Videos with the same content, the first one is the one that is used for training
+    by_hash = {}
+    for name, info in videos.items():
+        by_hash.setdefault(info['hash'], []).append(name)
+    duplicates = [group for group in by_hash.values() if len(group) > 1]
+    return {'version': MANIFEST_VERSION, 'videos': videos, 'duplicates': duplicates}
+
+
+def write_manifest(path, manifest):
+    manifest_path = get_manifest_path(path)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(manifest_path), suffix='.tmp', delete=False) as tmp_file:
+        json.dump(manifest, tmp_file)
+    os.replace(tmp_file.name, manifest_path)
+    return manifest_path
+
+# Function to read the manifest of a dataset, None if it has none
+def read_manifest(path):
+    try:
+        with open(get_manifest_path(path)) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+# Function to get the manifest entries of the videos of the words as (word, video file, info), without duplicates
+def get_videos(manifest, words):
+    duplicates = set(name for group in manifest['duplicates'] for name in group[1:])
+    videos = []
+    for name, info in manifest['videos'].items():
+        word, video_file = name.split('/', 1)
+        if word in words and name not in duplicates:
+            videos.append((word, video_file, info))
+    return videos
+
+
+# Function to estimate how long (in seconds) extracting the landmarks of the words takes.
+# Videos whose landmarks are in the landmark cache take no time.
+def estimate_extraction_seconds(manifest, words, cache=None, workers=1, seconds_per_frame=SECONDS_PER_FRAME):
+    frames = sum(info['frames'] for _, _, info in get_videos(manifest, words)
+                 if cache is None or not cache.contains(info['hash']))
+    return frames * seconds_per_frame / max(1, workers)
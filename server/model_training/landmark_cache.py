@@ -0,0 +1,130 @@
+"""
+File: landmark_cache.py
+Description: Source code for an on-disk cache of the landmarks detected in videos.
+Entries are keyed by the content of the video, the detector model and the sampling fps,
+so a video only goes through the landmark detector again if one of them changes.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import landmark_detector as ld
+import numpy as np
+import hashlib
+import tempfile
+import os
+
+# Default location and size limit (in bytes) of the cache
+CACHE_DIR = os.getenv('LANDMARK_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'landmarks'))
+CACHE_MAX_SIZE = int(os.getenv('LANDMARK_CACHE_MAX_SIZE', str(5 * 1024 ** 3)))
+# A full cache is evicted down to this fraction of the size limit, so the next entries fit without another scan
+CACHE_LOW_WATER = 0.9
+
+# Function to get the content hash of a file
+def get_file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class LandmarkCache:
+    def __init__(self, detector_path, target_fps=None, video_mode=True, cache_dir=CACHE_DIR, max_size=CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.target_fps = target_fps
+        # Everything that changes the detected landmarks, except for the video itself
+        self.settings = f"{get_file_hash(detector_path)}:{target_fps or 'native'}:{'video' if video_mode else 'image'}"
+        self._size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _get_entry_path(self, video_hash):
+        key = hashlib.sha256(f"{video_hash}:{self.settings}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    # Get the cached (landmarks, hands, num_frames) of a video as returned by
+    # landmark_detector.get_landmark_array, or None if the video isn't cached yet
+    def get(self, video_hash):
+        entry_path = self._get_entry_path(video_hash)
+        try:
+            with np.load(entry_path) as entry:
+                landmarks = entry['landmarks']
+                hands = entry['hands']
+                num_frames = int(entry['num_frames'])
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            return None
+
+        # Mark the entry as recently used, so it is evicted last
+        os.utime(entry_path)
+        return landmarks, hands, num_frames
+
+    # Check if the landmarks of a video are cached, without reading them
+    def contains(self, video_hash):
+        return os.path.exists(self._get_entry_path(video_hash))
+
+    # Store the landmarks of a video in the cache
+    def put(self, video_hash, landmarks, hands, num_frames):
+        entry_path = self._get_entry_path(video_hash)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        # Write to a temporary file first, so readers never see a half-written entry
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(entry_path), suffix='.tmp', delete=False) as tmp_file:
+            np.savez(tmp_file, landmarks=landmarks, hands=hands, num_frames=num_frames)
+        os.replace(tmp_file.name, entry_path)
+
+        if self._size is not None:
+            self._size += os.path.getsize(entry_path)
+        self.evict()
+
+    # Get the landmark array of a video from the cache, or detect and cache it.
+    # With a known video_hash (e.g. from the dataset manifest), the video isn't read to hash it.
+    def get_landmark_array(self, video_path, detector, video_hash=None):
+        if not os.path.exists(video_path):
+            raise FileNotFoundError("The video file not found")
+
+        video_hash = video_hash or get_file_hash(video_path)
+        cached = self.get(video_hash)
+        if cached is not None:
+            return cached
+
+        landmarks, hands, num_frames = ld.get_landmark_array(video_path, detector, target_fps=self.target_fps)
+        self.put(video_hash, landmarks, hands, num_frames)
+        return landmarks, hands, num_frames
+
+    def _get_entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.npz'):
+                    stat = os.stat(os.path.join(root, file))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+        return entries
+
+    # Delete the least recently used entries once the cache is larger than max_size,
+    # until it is back at the low water mark. The cache directory is only scanned when the limit is exceeded.
+    def evict(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._get_entries())
+        if self._size <= self.max_size:
+            return
+
+        entries = sorted(self._get_entries())
+        self._size = sum(size for _, size, _ in entries)
+        low_water = self.max_size * CACHE_LOW_WATER
+        for _, size, path in entries:
+            if self._size <= low_water:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
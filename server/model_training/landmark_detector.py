@@ -8,7 +8,7 @@ Parisa Babaei
 Adam Faundez Laurokari
 
 Created: 2024-12-16
-Last Modified: 2025-01-02
+Last Modified: 2026-10-18
 
 Project: A Sign From Above
 URL: https://git.chalmers.se/courses/dit826/2024/group4
@@ -20,40 +20,269 @@ License: MIT License (see LICENSE file for details)
 # https://ai.google.dev/edge/mediapipe/solutions/vision/hand_landmarker/python#video
 
 
-import mediapipe as mp
-from mediapipe.framework.formats import landmark_pb2
+from contextlib import contextmanager
+from threading import Lock
+import queue
 import os
+import time
+import numpy as np
 import cv2 as cv
 
-def get_detector(model_path):
+# Landmark arrays have the shape (frames, MAX_HANDS, NUM_LANDMARKS, 3)
+MAX_HANDS = 2
+NUM_LANDMARKS = 21
+
+# Gap (in ms) between two videos that run through the same VIDEO mode detector
+VIDEO_GAP_MS = 1000
+
+# Detector which runs the HandLandmarker in VIDEO mode.
+# The landmarker tracks the hands from frame to frame, so the palm detection only runs
+# when the tracking is lost. MediaPipe requires the timestamps to increase over the whole
+# lifetime of the landmarker, so every video is shifted to start after the previous one.
+class VideoDetector:
+    def __init__(self, landmarker):
+        self.landmarker = landmarker
+        self._offset = 0
+        self._last_timestamp = -VIDEO_GAP_MS
+
+    # Start a new video, with its timestamps starting at 0
+    def start_video(self):
+        self._offset = self._last_timestamp + VIDEO_GAP_MS
+
+    def detect(self, mp_image, timestamp_ms):
+        timestamp = max(self._offset + int(timestamp_ms), self._last_timestamp + 1)
+        self._last_timestamp = timestamp
+        return self.landmarker.detect_for_video(mp_image, timestamp)
+
+    def close(self):
+        self.landmarker.close()
+
+# Function to wrap an RGB frame in a MediaPipe image
+def to_mp_image(frame):
+    import mediapipe as mp
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+
+def get_detector(model_path, video_mode=False):
+    # MediaPipe takes seconds to import, so it is only imported once a detector is needed
+    import mediapipe as mp
+
     # Check if the model exists
     if not os.path.exists(model_path):
         raise FileNotFoundError("The hand_landmarker Model not found")
 
     # Setup the HandLandmarker model configuration
     base_options = mp.tasks.BaseOptions(model_asset_path=model_path)
-    options = mp.tasks.vision.HandLandmarkerOptions(base_options=base_options, num_hands=2)
-    return mp.tasks.vision.HandLandmarker.create_from_options(options)
+    running_mode = mp.tasks.vision.RunningMode.VIDEO if video_mode else mp.tasks.vision.RunningMode.IMAGE
+    options = mp.tasks.vision.HandLandmarkerOptions(base_options=base_options, num_hands=2, running_mode=running_mode)
+    landmarker = mp.tasks.vision.HandLandmarker.create_from_options(options)
+    return VideoDetector(landmarker) if video_mode else landmarker
+
+# Bounded pool of detectors, so concurrent callers never share a detector.
+# Detectors are created lazily, and a caller waits up to `timeout` seconds
+# for a free detector once `size` detectors are in use.
+class DetectorPool:
+    def __init__(self, model_path, size, timeout=None, video_mode=False):
+        # Check if the model exists, so a bad path fails at startup instead of on first use
+        if not os.path.exists(model_path):
+            raise FileNotFoundError("The hand_landmarker Model not found")
+
+        self.model_path = model_path
+        self.video_mode = video_mode
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._available = queue.LifoQueue()
+        self._created = 0
+        self._lock = Lock()
 
-def get_landmarks(video_path, detector, show_landmarks=False):
+    # Check out a detector for the duration of the with block
+    @contextmanager
+    def detector(self):
+        detector = self._checkout()
+        try:
+            yield detector
+        finally:
+            self._available.put(detector)
 
+    def _checkout(self):
+        try:
+            return self._available.get_nowait()
+        except queue.Empty:
+            pass
+
+        # Create a new detector if the pool isn't full yet
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return get_detector(self.model_path, self.video_mode)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._available.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No hand detector became available within {self.timeout} seconds")
+
+# Function that reads a video and yields (timestamp in ms, frame) for every frame
+def read_frames(video_path):
     cap = cv.VideoCapture(video_path)
     if not cap.isOpened():
         raise FileNotFoundError("The video file not found")
-    
-    result = []
-    num_frames = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
 
-    # Loop through the video frames
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+    try:
+        first_timestamp = None
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            timestamp = cap.get(cv.CAP_PROP_POS_MSEC)
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            yield timestamp - first_timestamp, frame
+    finally:
+        cap.release()
+
+# Function that reads a video once and yields (timestamp in ms, frame) at the target frame rate.
+# Frames are dropped and duplicated the same way as ffmpeg's constant frame rate
+# conversion (-r), so the result matches re-encoding the video with ffmpeg.
+def sample_frames(video_path, target_fps=None):
+    if not target_fps:
+        yield from read_frames(video_path)
+        return
+
+    frames = read_frames(video_path)
+    current = next(frames, None)
+    previous_frame = None
+    next_slot = 0
+    duration = None
+
+    while current is not None:
+        following = next(frames, None)
+        timestamp, frame = current
+        if following is not None:
+            duration = following[0] - timestamp
+
+        # Position and duration of the frame measured in output frames.
+        # Rounding avoids float noise from the millisecond timestamps.
+        sync = round(timestamp / 1000 * target_fps, 6)
+        frame_duration = round((duration or 0) / 1000 * target_fps, 6)
+        delta0 = sync - next_slot
+        delta = delta0 + frame_duration
+
+        # A frame that started before the next output slot, but still covers it
+        if delta0 < 0 and delta > 0:
+            delta0 = 0
+
+        num_output = 1
+        num_previous = 0
+        if delta < -1.1:
+            num_output = 0
+        elif delta > 1.1:
+            num_output = round(round(delta, 6))
+            # Fill a gap before this frame with copies of the previous frame
+            if delta0 > 1.1:
+                num_previous = round(round(delta0 - 0.6, 6))
+
+        for i in range(num_output):
+            output_frame = previous_frame if i < num_previous and previous_frame is not None else frame
+            yield next_slot * 1000 / target_fps, output_frame
+            next_slot += 1
+            previous_frame = output_frame
+
+        current = following
+
+# Function that runs the detector over a video and yields (frame, hand landmarks) for every frame.
+# If target_fps is set, the video is sampled to that frame rate while it is decoded.
+# The detector can either be an IMAGE mode HandLandmarker or a VideoDetector.
+# If on_frame is set, it is called with the decode and detection time (in seconds) of every frame.
+def detect_frames(video_path, detector, target_fps=None, on_frame=None):
+    video_mode = isinstance(detector, VideoDetector)
+    if video_mode:
+        detector.start_video()
+
+    frames = sample_frames(video_path, target_fps)
+    while True:
+        start_time = time.perf_counter()
+        item = next(frames, None)
+        if item is None:
             break
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+        timestamp, frame = item
+        decoded_time = time.perf_counter()
+        mp_image = to_mp_image(frame)
 
         # Detect the hand landmarks
-        detection_result = detector.detect(mp_image)
-        hand_landmarks = detection_result.hand_landmarks
+        if video_mode:
+            detection_result = detector.detect(mp_image, timestamp)
+        else:
+            detection_result = detector.detect(mp_image)
+        if on_frame is not None:
+            on_frame(decoded_time - start_time, time.perf_counter() - decoded_time)
+        yield frame, detection_result.hand_landmarks
+
+# Function that copies the hand landmarks of one frame into a (MAX_HANDS, NUM_LANDMARKS, 3) array.
+# Returns the number of hands that were copied.
+def fill_landmark_frame(frame, hand_landmarks):
+    for i, hand in enumerate(hand_landmarks[:MAX_HANDS]):
+        frame[i] = np.fromiter(
+            (value for landmark in hand for value in (landmark.x, landmark.y, landmark.z)),
+            dtype=np.float32, count=NUM_LANDMARKS * 3
+        ).reshape(NUM_LANDMARKS, 3)
+    return min(len(hand_landmarks), MAX_HANDS)
+
+# Function that gets the landmarks of every frame with hands in a video as a float32 array
+# of shape (frames, MAX_HANDS, NUM_LANDMARKS, 3), without building Python lists per frame.
+# Also returns the number of hands in every frame, and the number of frames in the video.
+# Frames with only one hand have zeros for the second hand. With keep_empty=True the frames without hands
+# are kept as zeros with 0 hands, so the array has one entry for every frame of the video.
+def get_landmark_array(video_path, detector, target_fps=None, on_frame=None, keep_empty=False):
+    landmarks = np.zeros((64, MAX_HANDS, NUM_LANDMARKS, 3), dtype=np.float32)
+    hands = np.zeros(64, dtype=np.uint8)
+    count = 0
+    num_frames = 0
+
+    for _, hand_landmarks in detect_frames(video_path, detector, target_fps, on_frame):
+        num_frames += 1
+        if not hand_landmarks and not keep_empty:
+            continue
+
+        # Grow the buffers when they are full
+        if count == len(landmarks):
+            landmarks = np.concatenate([landmarks, np.zeros_like(landmarks)])
+            hands = np.concatenate([hands, np.zeros_like(hands)])
+
+        hands[count] = fill_landmark_frame(landmarks[count], hand_landmarks)
+        count += 1
+
+    return landmarks[:count], hands[:count], num_frames
+
+# Function that converts the landmark lists from get_landmarks into the arrays from get_landmark_array
+def landmarks_to_array(landmarks):
+    array = np.zeros((len(landmarks), MAX_HANDS, NUM_LANDMARKS, 3), dtype=np.float32)
+    hands = np.zeros(len(landmarks), dtype=np.uint8)
+    for i, frame in enumerate(landmarks):
+        frame = frame[:MAX_HANDS]
+        array[i, :len(frame)] = frame
+        hands[i] = len(frame)
+    return array, hands
+
+# Function that converts the arrays from get_landmark_array into the landmark lists from get_landmarks
+def array_to_landmarks(array, hands):
+    return [array[i, :hands[i]].tolist() for i in range(len(hands))]
+
+# Function that gets the landmarks of every frame in a video as nested lists.
+# If target_fps is set, the video is sampled to that frame rate while it is decoded.
+# The detector can either be an IMAGE mode HandLandmarker or a VideoDetector.
+def get_landmarks(video_path, detector, show_landmarks=False, target_fps=None):
+    result = []
+    num_frames = 0
+
+    # Loop through the video frames
+    for frame, hand_landmarks in detect_frames(video_path, detector, target_fps):
+        num_frames += 1
 
         # Append the landmarks to the result list
         if hand_landmarks:
@@ -61,6 +290,8 @@ def get_landmarks(video_path, detector, show_landmarks=False):
         
         # Show the landmarks if needed
         if show_landmarks:
+            import mediapipe as mp
+            from mediapipe.framework.formats import landmark_pb2
             if hand_landmarks:
                 for hand_landmark in hand_landmarks:
                     # Use the mediapipe drawing utilities to draw the landmarks
@@ -72,5 +303,4 @@ def get_landmarks(video_path, detector, show_landmarks=False):
                 cv.imshow('Hand Landmarks', frame)
             if cv.waitKey(50) & 0xFF == ord('q'):
                 break
-    cap.release()
     return result, num_frames
@@ -0,0 +1,158 @@
+"""
+File: landmark_shards.py
+Description: Source code for datasets of landmark shards, which can be trained on without the videos.
+A shard dataset is a directory with an index.json file and shard_<n>.npy files. Every shard holds the
+landmark frames of many samples as one (frames, features) float32 or float16 array, and the index
+holds the word, the shard, the offset and the length of every sample, and some metadata about it.
+The shards are memory mapped, so the frames are only read from disk when a batch needs them.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import numpy as np
+import tempfile
+import json
+import os
+
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+DTYPES = ('float32', 'float16')
+# Number of frames in a shard before a new one is started (about 32 MB of float32 frames with 126 features)
+SHARD_FRAMES = int(os.getenv('SHARD_FRAMES', '65536'))
+
+
+# Function to write a file through a temporary file, so readers never see a half-written file
+def _write_atomic(path, write):
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as tmp_file:
+        write(tmp_file)
+    os.replace(tmp_file.name, path)
+
+# Function to read the index of a shard dataset. Raises FileNotFoundError if the directory isn't one.
+def read_index(path):
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"{INDEX_FILE} not found in {path}")
+    with open(index_path) as file:
+        index = json.load(file)
+    if index.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported landmark shard version {index.get('version')}, expected {FORMAT_VERSION}")
+    return index
+
+
+# Writer of a shard dataset. Samples are copied into a preallocated buffer until a shard is full, the index is written by close().
+# With expected_frames (e.g. from the dataset manifest), the buffer isn't larger than the dataset.
+class ShardWriter:
+    def __init__(self, path, num_features=None, dtype='float32', shard_frames=SHARD_FRAMES, expected_frames=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"The dtype must be one of {DTYPES}, got {dtype}")
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise ValueError(f"{path} already contains a shard dataset")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.num_features = num_features
+        self.dtype = dtype
+        self.shard_frames = min(shard_frames, expected_frames) if expected_frames else shard_frames
+        self.samples = []
+        self.skipped = []
+        self.shards = []
+        self._buffer = None
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    # Add the landmarks of one sample, as (frames, features) or (frames, hands, landmarks, coordinates).
+    # The metadata (e.g. source and num_frames) is stored with the sample in the index.
+    def add(self, landmarks, word, **metadata):
+        features = np.asarray(landmarks, dtype=np.float32).reshape(len(landmarks), -1)
+        if len(features) == 0:
+            raise ValueError("A sample needs at least one frame")
+        if self.num_features is None:
+            self.num_features = features.shape[1]
+        if features.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} features per frame, got {features.shape[1]}")
+
+        # A sample is never split between shards, a sample longer than a shard gets a shard of its own
+        if self._buffered + len(features) > self.shard_frames:
+            self._flush()
+        if len(features) > self.shard_frames:
+            self.samples.append({'word': word, 'shard': len(self.shards), 'offset': 0, 'length': len(features), **metadata})
+            self._write_shard(features.astype(self.dtype))
+            return
+
+        if self._buffer is None:
+            self._buffer = np.empty((self.shard_frames, self.num_features), dtype=self.dtype)
+        self.samples.append({'word': word, 'shard': len(self.shards), 'offset': self._buffered, 'length': len(features), **metadata})
+        self._buffer[self._buffered:self._buffered + len(features)] = features
+        self._buffered += len(features)
+
+    # Record a sample that couldn't be added, e.g. because no hands were detected
+    def skip(self, word, source, reason):
+        self.skipped.append({'word': word, 'source': source, 'reason': reason})
+
+    def _write_shard(self, frames):
+        name = f'shard_{len(self.shards):05d}.npy'
+        _write_atomic(os.path.join(self.path, name), lambda file: np.save(file, frames))
+        self.shards.append(name)
+
+    def _flush(self):
+        if self._buffered == 0:
+            return
+        self._write_shard(self._buffer[:self._buffered])
+        self._buffered = 0
+
+    # Write the last shard and the index
+    def close(self):
+        self._flush()
+        index = {
+            'version': FORMAT_VERSION,
+            'dtype': self.dtype,
+            'num_features': self.num_features,
+            'words': sorted(set(sample['word'] for sample in self.samples)),
+            'shards': self.shards,
+            'samples': self.samples,
+            'skipped': self.skipped,
+        }
+        _write_atomic(os.path.join(self.path, INDEX_FILE), lambda file: file.write(json.dumps(index).encode()))
+        return index
+
+
+# Reader of a shard dataset. Indexing returns the (frames, features) array of a sample,
+# which is a view into the memory mapped shard, so nothing is read until it is used.
+class LandmarkShards:
+    def __init__(self, path):
+        self.path = path
+        index = read_index(path)
+        self.dtype = index['dtype']
+        self.num_features = index['num_features']
+        self.words = index['words']
+        self.samples = index['samples']
+        self.skipped = index.get('skipped', [])
+        self.lengths = np.array([sample['length'] for sample in self.samples], dtype=np.int64)
+        self._shard_files = index['shards']
+        self._shards = [None] * len(self._shard_files)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _get_shard(self, i):
+        if self._shards[i] is None:
+            self._shards[i] = np.load(os.path.join(self.path, self._shard_files[i]), mmap_mode='r')
+        return self._shards[i]
+
+    def __getitem__(self, i):
+        sample = self.samples[i]
+        return self._get_shard(sample['shard'])[sample['offset']:sample['offset'] + sample['length']]
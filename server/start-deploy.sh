@@ -0,0 +1,24 @@
+#!/bin/bash
+# Entry point of the deploy image (Dockerfile-deploy), which runs the web server and the training worker
+# in one container. docker-compose.yml runs them as separate services instead.
+# Set RUN_TRAINING_WORKER=False if the training worker runs somewhere else.
+
+cd "$(dirname "$0")"
+
+pids=()
+if [ "${RUN_TRAINING_WORKER:-True}" = "True" ]; then
+    /venv/bin/python3 manage.py run_training_worker &
+    pids+=($!)
+fi
+/venv/bin/uvicorn aslproject.asgi:application --host 0.0.0.0 --port 8000 &
+pids+=($!)
+
+# Stopping the container stops both, the worker puts its running jobs back into the queue
+trap 'kill -TERM "${pids[@]}" 2>/dev/null' TERM INT
+
+# If one of them exits, stop the other one as well, so the container is restarted
+wait -n
+status=$?
+kill -TERM "${pids[@]}" 2>/dev/null
+wait
+exit $status
@@ -15,8 +15,12 @@ License: MIT License (see LICENSE file for details)
 """
 
 import unittest
+from unittest.mock import patch
 import numpy as np
+import tempfile
+import time
 import sys
+import os
 sys.path.insert(1, 'model_training/')
 import data_prep as prep
 
@@ -53,6 +57,27 @@ class TestDataPrep(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             prep.get_data(words, path, detector_path)
 
+    # Test if get_data with output_dir gives the same data as memory mapped views
+    def test_get_data_output_dir(self):
+        def process_video(video_path, detector=None, cache=None, video_hash=None, target_fps=None):
+            if video_path.endswith('3e10848fd5.mp4'):
+                return (np.zeros((0, 2, 21, 3), dtype=np.float32), None, 10), None
+            rng = np.random.default_rng(len(video_path))
+            return (rng.random((15, 2, 21, 3), dtype=np.float32), None, 20), None
+
+        words = ['no', 'teacher']
+        with patch.object(prep.ld, 'get_detector'), patch.object(prep, '_process_video', process_video):
+            X, y, num_videos, highest_frame, bad_videos = prep.get_data(words, 'tests/test_dataset/', None, use_cache=False)
+            with tempfile.TemporaryDirectory() as output_dir:
+                results = prep.get_data(words, 'tests/test_dataset/', None, use_cache=False, output_dir=os.path.join(output_dir, 'landmarks'))
+                mapped_X, mapped_y, mapped_num_videos, mapped_highest_frame, mapped_bad_videos = results
+
+                self.assertEqual((mapped_y, mapped_num_videos, mapped_highest_frame, mapped_bad_videos), (y, num_videos, highest_frame, bad_videos))
+                self.assertEqual(bad_videos, 1)
+                for video, mapped_video in zip(X, mapped_X):
+                    self.assertIsInstance(mapped_video, np.memmap)
+                    self.assertTrue(np.array_equal(video, mapped_video))
+
     # Test if the function padX returns the correct output (not None)
     def test_padX(self):
         X = [[[1, 2, 3], [4, 5, 6]], [[7, 8, 9], [10], [13, 14, 15]]]
@@ -67,6 +92,37 @@ class TestDataPrep(unittest.TestCase):
         self.assertEqual(mask.shape, (2, 3, 3))
         self.assertTrue(np.array_equal(padded_X, expected_padded_X))
 
+    # Test if padX builds the same mask as before, and skips it when it isn't requested
+    def test_padX_mask(self):
+        X = [[[1, 2, 3], [4, 5, 6]], [[7, 8, 9], [10], [13, 14, 15]]]
+        expected_mask = [[[1, 1, 1], [1, 1, 1], [0, 0, 0]], [[1, 1, 1], [1, 0, 0], [1, 1, 1]]]
+        padded_X, mask = prep.padX(X, 2, 3, 3)
+        self.assertEqual(padded_X.dtype, np.float32)
+        self.assertTrue(np.array_equal(mask, expected_mask))
+        padded_X, mask = prep.padX(X, 2, 3, 3, mask=False)
+        self.assertIsNone(mask)
+
+    # Benchmark padX against padding every frame with np.pad
+    def test_padX_benchmark(self):
+        rng = np.random.default_rng(42)
+        num_videos, highest_frame, num_features = 1000, 230, 126
+        X = [rng.random((rng.integers(1, highest_frame + 1), num_features), dtype=np.float32) for _ in range(num_videos)]
+
+        start_time = time.time()
+        expected = np.zeros((num_videos, highest_frame, num_features))
+        for i in range(num_videos):
+            for j in range(len(X[i])):
+                expected[i, j, :] = np.pad(X[i][j], (0, num_features - len(X[i][j])), 'constant')
+        loop_duration = time.time() - start_time
+
+        start_time = time.time()
+        padded_X, _ = prep.padX(X, num_videos, highest_frame, num_features, mask=False)
+        duration = time.time() - start_time
+
+        print(f"padX: {duration:.3f} seconds, {padded_X.nbytes / 1024 ** 2:.0f} MB")
+        print(f"Per frame np.pad: {loop_duration:.3f} seconds, {expected.nbytes * 2 / 1024 ** 2:.0f} MB with mask")
+        self.assertTrue(np.array_equal(padded_X, expected))
+
     # Test if get_word_accuracy returns the correct output with no data
     def test_get_word_accuracy_no_data(self):
         accuracy = prep.get_word_accuracy(["no"], None, np.array([]), np.array([]))
@@ -75,4 +131,118 @@ class TestDataPrep(unittest.TestCase):
     # Test if get_word_accuracy returns an exception when the model is None
     def test_get_word_accuracy_no_model(self):
         with self.assertRaises(AttributeError):
-            prep.get_word_accuracy(["no"], None, np.array([[[1]]]), np.array([0]))
\ No newline at end of file
+            prep.get_word_accuracy(["no"], None, np.array([[[1]]]), np.array([0]))
+    # Test if evaluate matches a per-sample evaluation of the model
+    def test_evaluate(self):
+        class FakeModel:
+            def __init__(self):
+                self.calls = 0
+
+            def predict(self, X, batch_size=None, verbose=0):
+                self.calls += 1
+                return X[:, 0, :3]
+
+        X_test = np.zeros((4, 2, 3), dtype=np.float32)
+        X_test[0, 0] = [0.7, 0.2, 0.1]  # word 0, correct
+        X_test[1, 0] = [0.5, 0.3, 0.2]  # word 1, second guess
+        X_test[2, 0] = [0.2, 0.1, 0.7]  # word 1, third guess
+        X_test[3, 0] = [0.2, 0.1, 0.7]  # word 2, correct
+        y_test = np.array([0, 1, 1, 2])
+        model = FakeModel()
+
+        evaluation = prep.evaluate(model, X_test, y_test, ["eat", "no", "yes"])
+
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(evaluation['accuracy'], 0.5)
+        self.assertEqual(evaluation['word_accuracy'], {"eat": [1, 1], "no": [0, 2], "yes": [1, 1]})
+        self.assertEqual(evaluation['confusion_matrix'], [[1, 0, 0], [1, 0, 1], [0, 0, 1]])
+        self.assertEqual(evaluation['top_k_accuracy'], {"1": 0.5, "2": 0.75, "3": 1.0})
+        self.assertEqual(prep.get_word_accuracy(["eat", "no", "yes"], model, X_test, y_test), evaluation['word_accuracy'])
+
+    # Test if evaluate_dataset gives the same evaluation as evaluate on the padded test set
+    def test_evaluate_dataset(self):
+        class FakeModel:
+            def predict(self, X, batch_size=None, verbose=0):
+                return X[:, 0, :3]
+
+            def predict_on_batch(self, X):
+                return X.numpy()[:, 0, :3]
+
+        rng = np.random.default_rng(0)
+        lengths = rng.integers(5, 60, 50)
+        X = [rng.random((length, 126), dtype=np.float32) for length in lengths]
+        y = rng.integers(0, 3, 50)
+        words = ["eat", "no", "yes"]
+
+        padded_X, _ = prep.padX(X, len(X), int(lengths.max()), 126, mask=False)
+        expected = prep.evaluate(FakeModel(), padded_X, y, words)
+        evaluation = prep.evaluate_dataset(FakeModel(), prep.make_dataset(X, y, 126, batch_size=8, shuffle=False), words)
+        self.assertEqual(evaluation, expected)
+
+    # Test if make_dataset streams every video once per epoch in batches of similar length
+    def test_make_dataset(self):
+        rng = np.random.default_rng(0)
+        lengths = rng.integers(5, 230, 100)
+        X = [np.full((length, 126), i + 1, dtype=np.float32) for i, length in enumerate(lengths)]
+        y = rng.integers(0, 4, 100)
+        boundaries = prep.get_bucket_boundaries(lengths)
+        dataset = prep.make_dataset(X, y, 126, batch_size=16)
+
+        seen = []
+        for videos, labels in dataset:
+            videos = videos.numpy()
+            # Every batch is padded to a bucket boundary
+            self.assertIn(videos.shape[1] + 1, boundaries)
+            for video, label in zip(videos, labels.numpy()):
+                i = int(video[0, 0]) - 1
+                self.assertEqual(label, y[i])
+                self.assertTrue(np.all(video[:lengths[i]] == i + 1))
+                self.assertTrue(np.all(video[lengths[i]:] == 0))
+                seen.append(i)
+        self.assertEqual(sorted(seen), list(range(100)))
+        self.assertEqual(len(seen), 100)
+
+    # Test if the length agnostic model predicts the same as the model on padded input
+    def test_make_length_agnostic(self):
+        import keras
+        model = keras.models.load_model('./models/draft_model.keras')
+        length_agnostic = prep.make_length_agnostic(model)
+        self.assertIsNone(length_agnostic.input_shape[1])
+
+        X = np.zeros((2, model.input_shape[1], 126), dtype=np.float32)
+        X[:, :40] = np.random.rand(2, 40, 126)
+        self.assertTrue(np.allclose(model.predict(X, verbose=0), length_agnostic.predict(X[:, :40], verbose=0), atol=1e-5))
+
+    # Benchmark an epoch on bucketed batches against an epoch on data padded to the highest frame
+    def test_make_dataset_benchmark(self):
+        import keras
+
+        class EpochTimer(keras.callbacks.Callback):
+            def on_epoch_begin(self, epoch, logs=None):
+                self.start_time = time.time()
+
+            def on_epoch_end(self, epoch, logs=None):
+                self.duration = time.time() - self.start_time
+
+        rng = np.random.default_rng(0)
+        lengths = np.clip(rng.gamma(3, 20, 400).astype(int), 5, 230)
+        X = [rng.random((length, 126), dtype=np.float32) for length in lengths]
+        y = rng.integers(0, 4, 400)
+
+        # The first epoch traces the model for every bucket, so the last epoch is compared
+        model = prep.make_length_agnostic(keras.models.load_model('./models/draft_model.keras'))
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy')
+        bucketed_timer = EpochTimer()
+        model.fit(prep.make_dataset(X, y, 126), epochs=3, verbose=0, callbacks=[bucketed_timer])
+
+        padded_X, _ = prep.padX(X, len(X), 230, 126, mask=False)
+        model = keras.models.load_model('./models/draft_model.keras')
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy')
+        padded_timer = EpochTimer()
+        model.fit(padded_X, y, epochs=3, verbose=0, callbacks=[padded_timer])
+
+        print(f"Bucketed epoch: {bucketed_timer.duration:.3f} seconds, padded epoch: {padded_timer.duration:.3f} seconds")
+        # The timings depend on the machine, so only the number of padded frames the model runs on is compared
+        bucketed_frames = sum(videos.shape[0] * videos.shape[1] for videos, _ in prep.make_dataset(X, y, 126))
+        self.assertGreaterEqual(bucketed_frames, int(lengths.sum()))
+        self.assertLess(bucketed_frames, padded_X.shape[0] * padded_X.shape[1])
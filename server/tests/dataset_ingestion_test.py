@@ -0,0 +1,196 @@
+"""
+File: dataset_ingestion_test.py
+Description: Unit tests for the dataset_ingestion.py and dataset_archive.py files.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+from django.test import override_settings
+from django.utils import timezone
+from datetime import timedelta
+from app.models import Dataset
+from app import dataset_ingestion
+from app.training_queue import TrainingWorker
+import numpy as np
+import tempfile
+import zipfile
+import shutil
+import sys
+import os
+
+sys.path.insert(1, 'model_training/')
+import data_prep as prep
+import dataset_archive
+import dataset_manifest
+from landmark_shards import ShardWriter, LandmarkShards
+
+DATASET_PATH = './tests/test_dataset'
+
+
+class DatasetIngestionTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, 'datasets'))
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        Dataset.objects.filter(name__startswith='ingestion_test').delete()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    # Create a dataset with a ZIP file of the given (name in the ZIP file, path on disk) files
+    def create_dataset(self, name, files, kind='videos'):
+        zip_name = os.path.join('datasets', f'{name}.zip')
+        with zipfile.ZipFile(os.path.join(self.media_root, zip_name), 'w') as zip_ref:
+            for arcname, file_path in files:
+                zip_ref.write(file_path, arcname)
+        return Dataset.objects.create(name=name, kind=kind, data_file=zip_name, status='PENDING')
+
+    def get_video_files(self, root):
+        files = []
+        for word in os.listdir(DATASET_PATH):
+            for video_file in os.listdir(os.path.join(DATASET_PATH, word)):
+                files.append((f'{root}/{word}/{video_file}', os.path.join(DATASET_PATH, word, video_file)))
+        return files
+
+    def test_ingest_videos(self):
+        dataset = self.create_dataset('ingestion_test_videos', self.get_video_files('words'))
+        self.assertTrue(dataset_ingestion.ingest_dataset(dataset.id))
+
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.status, 'READY')
+        self.assertEqual(dataset.root_directory, os.path.join(dataset.data_file.path, 'words'))
+        # The ZIP file isn't extracted
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'datasets', 'ingestion_test_videos')))
+
+        words = sorted(set(arcname.split('/')[1] for arcname, _ in self.get_video_files('words')))
+        self.assertEqual(dataset_archive.listdir(dataset.root_directory), words)
+        videos = prep.list_videos(words, dataset.root_directory)
+        self.assertEqual(len(videos), len(self.get_video_files('words')))
+        word, video_file, video_path = videos[0]
+        with dataset_archive.local_file(video_path) as local_path:
+            with open(local_path, 'rb') as extracted, open(os.path.join(DATASET_PATH, word, video_file), 'rb') as original:
+                self.assertEqual(extracted.read(), original.read())
+        self.assertFalse(os.path.exists(local_path))
+
+        with self.assertRaises(FileNotFoundError):
+            prep.list_videos(['invalid'], dataset.root_directory)
+
+    # Replaced ZIP files and the least recently used ones are closed, so their file handles aren't leaked
+    def test_open_archives_are_closed(self):
+        video_file = self.get_video_files('words')[0][1]
+        zip_paths = []
+        for i in range(dataset_archive.MAX_OPEN_ARCHIVES + 1):
+            zip_paths.append(os.path.join(self.media_root, f'archive_{i}.zip'))
+            with zipfile.ZipFile(zip_paths[-1], 'w') as zip_ref:
+                zip_ref.write(video_file, 'words/no/1.mp4')
+        archives = [dataset_archive._get_archive(zip_path) for zip_path in zip_paths]
+        self.assertIsNone(archives[0].fp)
+        self.assertIsNotNone(archives[-1].fp)
+        self.assertIs(dataset_archive._get_archive(zip_paths[-1]), archives[-1])
+
+        os.utime(zip_paths[-1], (0, 0))
+        self.assertEqual(dataset_archive.listdir(os.path.join(zip_paths[-1], 'words')), ['no'])
+        self.assertIsNone(archives[-1].fp)
+        self.assertLessEqual(len(dataset_archive._archives), dataset_archive.MAX_OPEN_ARCHIVES)
+
+    def test_dataset_manifest(self):
+        files = self.get_video_files('words')
+        # The same video a second time, under another word
+        duplicate_word = 'eat' if files[0][0].split('/')[1] != 'eat' else 'no'
+        files.append((f'words/{duplicate_word}/copy.mp4', files[0][1]))
+        dataset = self.create_dataset('ingestion_test_manifest', files)
+        self.assertTrue(dataset_ingestion.ingest_dataset(dataset.id))
+
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.num_videos, len(files))
+        self.assertEqual(dataset.duplicate_videos, 1)
+        manifest = dataset_manifest.read_manifest(dataset.root_directory)
+        self.assertTrue(os.path.exists(f'{dataset.data_file.path}.manifest.json'))
+        # The first video in the manifest is kept, the other one is the duplicate
+        kept, duplicate = sorted([files[0][0][len('words/'):], f'{duplicate_word}/copy.mp4'])
+        self.assertEqual(manifest['duplicates'], [[kept, duplicate]])
+        info = manifest['videos'][kept]
+        self.assertEqual(info['size'], os.path.getsize(files[0][1]))
+        self.assertGreater(info['frames'], 0)
+        self.assertGreater(info['width'], 0)
+        self.assertAlmostEqual(info['duration'], info['frames'] / info['fps'])
+
+        # get_data skips the duplicate and gets the hashes from the manifest
+        processed = {}
+        def process_video(video_path, detector=None, cache=None, video_hash=None, target_fps=None):
+            processed[video_path] = video_hash
+            return (np.random.rand(5, 2, 21, 3).astype(np.float32), None, 5), None
+
+        words = sorted(set(name.split('/')[0] for name in manifest['videos']))
+        with patch.object(prep.ld, 'get_detector'), patch.object(prep, '_process_video', process_video):
+            X, y, num_videos, _, _ = prep.get_data(words, dataset.root_directory, None, use_cache=False, manifest=manifest)
+        self.assertEqual(num_videos, len(files) - 1)
+        self.assertNotIn(os.path.join(dataset.root_directory, duplicate), processed)
+        self.assertEqual(processed[os.path.join(dataset.root_directory, kept)], info['hash'])
+        # The frames of all videos are stored in one preallocated array
+        self.assertIs(X[0].base, X[-1].base)
+
+        frames = sum(video['frames'] for video in manifest['videos'].values()) - info['frames']
+        self.assertAlmostEqual(dataset_manifest.estimate_extraction_seconds(manifest, words, workers=2, seconds_per_frame=0.01), frames * 0.005)
+
+    # A dataset whose worker stopped, e.g. because the server was restarted, is ingested again
+    def test_requeue_stale_ingestion(self):
+        dataset = self.create_dataset('ingestion_test_stale', self.get_video_files('words')[:1])
+        self.assertEqual(dataset_ingestion.claim_next_dataset('old-worker'), dataset.id)
+        self.assertIsNone(dataset_ingestion.claim_next_dataset('other-worker'))
+
+        Dataset.objects.filter(id=dataset.id).update(heartbeat_at=timezone.now() - timedelta(seconds=600))
+        dataset_ingestion.requeue_stale_datasets(heartbeat_timeout=120)
+        dataset.refresh_from_db()
+        self.assertEqual((dataset.status, dataset.claimed_by), ('PENDING', ''))
+        self.assertEqual(dataset_ingestion.claim_next_dataset('new-worker'), dataset.id)
+
+    def test_ingest_invalid_zip(self):
+        video_file = self.get_video_files('words')[0][1]
+        traversal = self.create_dataset('ingestion_test_traversal', [('../evil.mp4', video_file)])
+        two_roots = self.create_dataset('ingestion_test_roots', [('a/no/1.mp4', video_file), ('b/no/1.mp4', video_file)])
+
+        self.assertFalse(dataset_ingestion.ingest_dataset(traversal.id))
+        self.assertFalse(dataset_ingestion.ingest_dataset(two_roots.id))
+
+        traversal.refresh_from_db()
+        two_roots.refresh_from_db()
+        self.assertEqual(traversal.status, 'ERROR')
+        self.assertIn('Path Traversal', traversal.error_message)
+        self.assertIn('single root directory', two_roots.error_message)
+
+    def test_ingest_shards_in_background(self):
+        shards_dir = os.path.join(self.media_root, 'shards')
+        features = np.random.rand(10, 126).astype(np.float32)
+        with ShardWriter(shards_dir) as writer:
+            writer.add(features, 'no')
+        files = [(f'shards/{name}', os.path.join(shards_dir, name)) for name in os.listdir(shards_dir)]
+        dataset = self.create_dataset('ingestion_test_shards', files, kind='shards')
+
+        # The training worker claims the dataset and ingests it in a thread
+        worker = TrainingWorker(poll_interval=0.1)
+        self.assertEqual(worker.poll_ingestion(), 1)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.claimed_by, worker.worker_id)
+        worker.ingesting[dataset.id].join(30)
+
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.status, 'READY')
+        self.assertEqual(dataset.ingest_progress, 100)
+        self.assertEqual(dataset.claimed_by, '')
+        # Shards are extracted, as they are memory mapped
+        self.assertTrue(np.array_equal(LandmarkShards(dataset.root_directory)[0], features))
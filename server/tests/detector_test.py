@@ -15,8 +15,14 @@ License: MIT License (see LICENSE file for details)
 """
 
 import unittest
+import subprocess
+import tempfile
+import shutil
+import glob
 import os
 import sys
+import time
+import numpy as np
 
 sys.path.insert(1, 'model_training/')
 import landmark_detector as ld
@@ -50,4 +56,113 @@ class TestLandmarkDetector(unittest.TestCase):
         detector = ld.get_detector(model_path)
         video_path = '../invalid/0000.mp4'
         with self.assertRaises(FileNotFoundError):
-            ld.get_landmarks(video_path, detector)
\ No newline at end of file
+            ld.get_landmarks(video_path, detector)
+
+    # Test if sample_frames picks the same frames as re-encoding with ffmpeg -r
+    @unittest.skipIf(shutil.which('ffmpeg') is None, "ffmpeg is not installed")
+    def test_sample_frames_matches_ffmpeg(self):
+        for video_path in glob.glob('tests/test_dataset/*/*.mp4'):
+            source_frames = [frame for _, frame in ld.read_frames(video_path)]
+            for fps in [5, 12, 20]:
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    output_path = os.path.join(temp_dir, 'reencoded.mp4')
+                    subprocess.run(
+                        ["ffmpeg", "-i", video_path, "-c:v", "mjpeg", "-q:v", "5", "-r", str(fps), output_path],
+                        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                    )
+                    ffmpeg_frames = [frame for _, frame in ld.read_frames(output_path)]
+                sampled_frames = [frame for _, frame in ld.sample_frames(video_path, fps)]
+
+                self.assertEqual(len(sampled_frames), len(ffmpeg_frames))
+                # The re-encoded frames are lossy, so match them to the closest source frame
+                closest = lambda frame: int(np.argmin([np.abs(frame.astype(int) - source.astype(int)).mean() for source in source_frames]))
+                self.assertEqual([closest(frame) for frame in sampled_frames], [closest(frame) for frame in ffmpeg_frames])
+
+    # Test if get_landmarks counts the sampled frames
+    def test_get_landmarks_target_fps(self):
+        model_path = os.path.abspath('./models/hand_landmarker.task')
+        detector = ld.get_detector(model_path)
+        video_path = 'tests/test_dataset/teacher/3e10848fd5.mp4'
+        _, frames = ld.get_landmarks(video_path, detector, target_fps=5)
+        self.assertEqual(frames, len(list(ld.sample_frames(video_path, 5))))
+
+    # Test if the detector pool reuses detectors and times out when all are in use
+    def test_detector_pool(self):
+        model_path = os.path.abspath('./models/hand_landmarker.task')
+        pool = ld.DetectorPool(model_path, size=1, timeout=0.1)
+        with pool.detector() as first:
+            self.assertIsNotNone(first)
+            with self.assertRaises(TimeoutError):
+                with pool.detector():
+                    pass
+        with pool.detector() as second:
+            self.assertIs(first, second)
+
+    # Test if the detector pool raises an exception when the model path is invalid
+    def test_detector_pool_bad_modelpath(self):
+        model_path = os.path.abspath('./models/non-existent.task')
+        with self.assertRaises(FileNotFoundError):
+            ld.DetectorPool(model_path, size=1)
+
+    # Test if get_landmarks works with a VIDEO mode detector that is reused for several videos
+    def test_get_landmarks_video_mode(self):
+        model_path = os.path.abspath('./models/hand_landmarker.task')
+        detector = ld.get_detector(model_path, video_mode=True)
+        for video_path in glob.glob('tests/test_dataset/*/*.mp4'):
+            landmarks, frames = ld.get_landmarks(video_path, detector)
+            self.assertGreater(frames, 0)
+            self.assertGreater(len(landmarks), 0)
+
+    # Benchmark VIDEO mode against IMAGE mode: time per frame and drift of the landmarks
+    def test_video_mode_benchmark(self):
+        model_path = os.path.abspath('./models/hand_landmarker.task')
+        image_detector = ld.get_detector(model_path)
+        video_detector = ld.get_detector(model_path, video_mode=True)
+        durations = {'image': 0.0, 'video': 0.0}
+        total_frames = 0
+        drifts = []
+
+        for video_path in glob.glob('tests/test_dataset/*/*.mp4'):
+            # Both arrays have an entry for every frame, so the same frames are compared even if a mode misses a hand
+            start_time = time.time()
+            image_landmarks, image_hands, frames = ld.get_landmark_array(video_path, image_detector, keep_empty=True)
+            durations['image'] += time.time() - start_time
+
+            start_time = time.time()
+            video_landmarks, video_hands, _ = ld.get_landmark_array(video_path, video_detector, keep_empty=True)
+            durations['video'] += time.time() - start_time
+            total_frames += frames
+            self.assertEqual(len(image_landmarks), len(video_landmarks))
+
+            # Compare frames where both modes found the same number of hands, sorted by wrist position
+            both = (image_hands > 0) & (image_hands == video_hands)
+            for image_frame, video_frame, count in zip(image_landmarks[both], video_landmarks[both], image_hands[both]):
+                image_frame = image_frame[np.argsort(image_frame[:count, 0, 0])]
+                video_frame = video_frame[np.argsort(video_frame[:count, 0, 0])]
+                drifts.append(np.abs(image_frame - video_frame).mean())
+
+        print(f"IMAGE mode: {durations['image'] / total_frames * 1000:.2f} ms per frame")
+        print(f"VIDEO mode: {durations['video'] / total_frames * 1000:.2f} ms per frame")
+        print(f"Speed-up: {durations['image'] / durations['video']:.2f}x")
+        print(f"Mean landmark drift: {np.mean(drifts):.4f}")
+        self.assertGreater(len(drifts), 0)
+        self.assertLess(np.mean(drifts), 0.05)
+
+    # Test if get_landmark_array returns the same landmarks as get_landmarks
+    def test_get_landmark_array(self):
+        model_path = os.path.abspath('./models/hand_landmarker.task')
+        detector = ld.get_detector(model_path)
+        video_path = 'tests/test_dataset/teacher/3e10848fd5.mp4'
+        landmarks, frames = ld.get_landmarks(video_path, detector)
+        landmark_array, hands, array_frames = ld.get_landmark_array(video_path, detector)
+        self.assertEqual(landmark_array.dtype, np.float32)
+        self.assertEqual(landmark_array.shape, (len(landmarks), 2, 21, 3))
+        self.assertEqual(array_frames, frames)
+        self.assertEqual(hands.tolist(), [len(frame) for frame in landmarks])
+        self.assertEqual(ld.array_to_landmarks(landmark_array, hands), landmarks)
+
+        # With keep_empty=True there is an entry for every frame, the frames without hands are zeros
+        all_frames, all_hands, _ = ld.get_landmark_array(video_path, detector, keep_empty=True)
+        self.assertEqual(len(all_frames), frames)
+        np.testing.assert_array_equal(all_frames[all_hands > 0], landmark_array)
+        self.assertFalse(all_frames[all_hands == 0].any())
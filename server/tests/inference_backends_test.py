@@ -0,0 +1,96 @@
+"""
+File: inference_backends_test.py
+Description: Unit tests for the inference_backends.py file.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from django.core.exceptions import ValidationError
+from app import inference_backends
+from app import model_registry
+from app.model_registry import registry
+from app.models import TrainedModel
+import numpy as np
+import tempfile
+import time
+import os
+
+
+class InferenceBackendsTest(TestCase):
+
+    def setUp(self):
+        self.active_model = registry.get()
+        self.lengths = self.active_model.buckets
+
+    def test_tf_function_backend_parity(self):
+        backend = inference_backends.create_backend('tf_function', self.active_model.model, self.active_model.num_features)
+        difference = inference_backends.check_parity(self.active_model.model, backend, self.active_model.num_features, self.lengths)
+        self.assertLess(difference, inference_backends.PARITY_TOLERANCE)
+
+    def test_tflite_backend_parity(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = inference_backends.export_tflite(self.active_model.model, os.path.join(directory, 'model.tflite'))
+            backend = inference_backends.create_backend('tflite', self.active_model.model, self.active_model.num_features, path)
+            difference = inference_backends.check_parity(self.active_model.model, backend, self.active_model.num_features, self.lengths)
+        self.assertLess(difference, inference_backends.PARITY_TOLERANCE)
+
+    def test_parity_check_rejects_different_outputs(self):
+        class ZeroBackend:
+            name = 'zero'
+
+            def predict(self, batch):
+                return np.zeros((len(batch), len(registry.get().words)), dtype=np.float32)
+
+        with self.assertRaises(inference_backends.BackendParityError):
+            inference_backends.check_parity(self.active_model.model, ZeroBackend(), self.active_model.num_features, [32])
+
+    def test_create_backend_invalid(self):
+        with self.assertRaises(ValueError):
+            inference_backends.create_backend('unknown', self.active_model.model, self.active_model.num_features)
+        with self.assertRaises(ValueError):
+            inference_backends.create_backend('tflite', self.active_model.model, self.active_model.num_features, None)
+
+    def test_tflite_backend_needs_export(self):
+        trained_model = TrainedModel(name='tflite_test_model', model_file='models/draft_model.keras', is_active=True, backend='tflite')
+        with self.assertRaises(ValidationError):
+            trained_model.clean()
+
+    # A deleted TFLite export doesn't break loading the model, it falls back to Keras
+    def test_missing_tflite_file_falls_back_to_keras(self):
+        active_row = TrainedModel.objects.get(is_active=True)
+        trained_model = TrainedModel(name='tflite_test_model', model_file=active_row.model_file.name, backend='tflite',
+                                     tflite_file='models/tflite_test_missing.tflite')
+        self.assertTrue(model_registry.get_model_key(trained_model).endswith(':missing'))
+        backend = registry._load_backend(trained_model, self.active_model.model, self.active_model.num_features, self.lengths)
+        self.assertIsInstance(backend, inference_backends.KerasBackend)
+
+    def test_backend_latency(self):
+        features = np.random.rand(1, self.active_model.max_frames, self.active_model.num_features).astype(np.float32)
+        backends = [
+            inference_backends.KerasBackend(self.active_model.model),
+            inference_backends.TFFunctionBackend(self.active_model.model, self.active_model.num_features),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = inference_backends.export_tflite(self.active_model.model, os.path.join(directory, 'model.tflite'))
+            backends.append(inference_backends.TFLiteBackend(path))
+
+            latencies = {}
+            for backend in backends:
+                backend.predict(features)
+                start_time = time.perf_counter()
+                for _ in range(10):
+                    backend.predict(features)
+                latencies[backend.name] = (time.perf_counter() - start_time) / 10
+                print(f"{backend.name}: {latencies[backend.name] * 1000:.2f} ms")
+
+        self.assertLess(latencies['tflite'], latencies['keras'])
@@ -0,0 +1,93 @@
+"""
+File: landmark_cache_test.py
+Description: Unit tests for the landmark_cache.py file.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+import sys
+import numpy as np
+
+sys.path.insert(1, 'model_training/')
+import landmark_detector as ld
+from landmark_cache import LandmarkCache, get_file_hash
+
+DETECTOR_PATH = './models/hand_landmarker.task'
+VIDEO_PATH = 'tests/test_dataset/teacher/3e10848fd5.mp4'
+
+# Test cases for landmark_cache.py
+class TestLandmarkCache(unittest.TestCase):
+    # Test if landmarks are returned unchanged from the cache
+    def test_put_get(self):
+        landmarks, hands = ld.landmarks_to_array([[[[0.5, 0.25, 0.125]] * 21], [[[0.1, 0.2, 0.3]] * 21, [[0.4, 0.5, 0.75]] * 21]])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = LandmarkCache(DETECTOR_PATH, cache_dir=cache_dir)
+            self.assertIsNone(cache.get('missing'))
+            cache.put('video', landmarks, hands, 10)
+            cached_landmarks, cached_hands, num_frames = cache.get('video')
+        self.assertEqual(num_frames, 10)
+        self.assertTrue(np.array_equal(cached_landmarks, landmarks))
+        self.assertEqual(cached_hands.tolist(), [1, 2])
+
+    # Test if the cache returns the same landmarks as the detector
+    def test_get_landmark_array(self):
+        detector = ld.get_detector(DETECTOR_PATH)
+        expected = ld.get_landmark_array(VIDEO_PATH, detector)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = LandmarkCache(DETECTOR_PATH, video_mode=False, cache_dir=cache_dir)
+            first = cache.get_landmark_array(VIDEO_PATH, detector)
+            self.assertIsNotNone(cache.get(get_file_hash(VIDEO_PATH)))
+            second = cache.get_landmark_array(VIDEO_PATH, None)
+        for result in (first, second):
+            self.assertTrue(np.array_equal(result[0], expected[0]))
+            self.assertTrue(np.array_equal(result[1], expected[1]))
+            self.assertEqual(result[2], expected[2])
+
+    # Test if entries for a different fps are stored separately
+    def test_settings_in_key(self):
+        landmarks, hands = ld.landmarks_to_array([])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            LandmarkCache(DETECTOR_PATH, target_fps=20, cache_dir=cache_dir).put('video', landmarks, hands, 0)
+            self.assertIsNone(LandmarkCache(DETECTOR_PATH, target_fps=5, cache_dir=cache_dir).get('video'))
+
+    # Test if the least recently used entries are evicted when the cache is full
+    def test_evict(self):
+        landmarks, hands = ld.landmarks_to_array([[[[0.5, 0.5, 0.5]] * 21]] * 50)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = LandmarkCache(DETECTOR_PATH, cache_dir=cache_dir)
+            cache.put('first', landmarks, hands, 50)
+            entry_size = os.path.getsize(cache._get_entry_path('first'))
+            cache.max_size = entry_size * 2
+            os.utime(cache._get_entry_path('first'), (0, 0))
+            cache.put('second', landmarks, hands, 50)
+            cache.put('third', landmarks, hands, 50)
+            self.assertIsNone(cache.get('first'))
+            self.assertIsNotNone(cache.get('third'))
+
+    # Test if a full cache is evicted down to the low water mark, so the next puts don't scan the cache again
+    def test_evict_to_low_water(self):
+        landmarks, hands = ld.landmarks_to_array([[[[0.5, 0.5, 0.5]] * 21]] * 50)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = LandmarkCache(DETECTOR_PATH, cache_dir=cache_dir)
+            cache.put('video_0', landmarks, hands, 50)
+            cache.max_size = os.path.getsize(cache._get_entry_path('video_0')) * 10
+            for i in range(1, 11):
+                cache.put(f'video_{i}', landmarks, hands, 50)
+            self.assertEqual(sum(cache.contains(f'video_{i}') for i in range(11)), 9)
+
+            with patch.object(cache, '_get_entries', wraps=cache._get_entries) as get_entries:
+                cache.put('video_11', landmarks, hands, 50)
+                get_entries.assert_not_called()
@@ -0,0 +1,151 @@
+"""
+File: landmark_shards_test.py
+Description: Unit tests for the landmark_shards.py file and the convert_to_shards command.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from app.models import Dataset, TrainedModel
+import numpy as np
+import tempfile
+import shutil
+import json
+import sys
+import os
+
+sys.path.insert(1, 'model_training/')
+import data_prep as prep
+from landmark_shards import ShardWriter, LandmarkShards, INDEX_FILE
+
+VIDEO_PATH = './tests/test_dataset/teacher/3e10848fd5.mp4'
+NUM_FEATURES = 126
+
+
+class LandmarkShardsTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Write samples of random lengths to a shard dataset
+    def write_samples(self, path, words, dtype='float32', shard_frames=50):
+        samples = []
+        with ShardWriter(path, dtype=dtype, shard_frames=shard_frames) as writer:
+            for i in range(10):
+                features = self.rng.random((int(self.rng.integers(5, 30)), NUM_FEATURES), dtype=np.float32)
+                word = words[i % len(words)]
+                writer.add(features, word, source=f'{word}/{i}.mp4', num_frames=len(features) + 2)
+                samples.append((features, word))
+            writer.skip(words[0], f'{words[0]}/bad.mp4', "No landmarks detected")
+        return samples
+
+    def test_write_and_read(self):
+        path = os.path.join(self.directory, 'shards')
+        samples = self.write_samples(path, ['eat', 'no'])
+
+        shards = LandmarkShards(path)
+        self.assertEqual(len(shards), len(samples))
+        self.assertEqual(shards.words, ['eat', 'no'])
+        self.assertGreater(len(os.listdir(path)), 2)
+        for i, (features, word) in enumerate(samples):
+            self.assertEqual(shards.samples[i]['word'], word)
+            self.assertIsInstance(shards[i], np.memmap)
+            np.testing.assert_array_equal(shards[i], features)
+        self.assertEqual(shards.skipped[0]['source'], 'eat/bad.mp4')
+
+        # The directory can't be written twice
+        with self.assertRaises(ValueError):
+            ShardWriter(path)
+        with self.assertRaises(ValueError):
+            ShardWriter(os.path.join(self.directory, 'other'), dtype='int8')
+
+    def test_get_shard_data(self):
+        path = os.path.join(self.directory, 'shards')
+        samples = self.write_samples(path, ['eat', 'no', 'teacher'], dtype='float16')
+
+        X, y, num_videos, highest_frame, bad_videos = prep.get_shard_data(['no', 'eat'], path)
+        expected = [(features, word) for features, word in samples if word != 'teacher']
+        self.assertEqual(num_videos, len(expected))
+        self.assertEqual(y, [['no', 'eat'].index(word) for _, word in expected])
+        self.assertEqual(highest_frame, max(len(features) for features, _ in expected) + 2)
+        self.assertEqual(bad_videos, 1)
+        for video, (features, _) in zip(X, expected):
+            np.testing.assert_allclose(video, features, atol=1e-3)
+
+        # The float16 frames are streamed as float32 batches
+        dataset = prep.make_dataset(X, y, NUM_FEATURES, batch_size=4, shuffle=False)
+        batches = list(dataset)
+        self.assertEqual(sum(len(labels) for _, labels in batches), num_videos)
+        self.assertEqual(batches[0][0].dtype.name, 'float32')
+
+        padded_X, _ = prep.padX(X, num_videos, highest_frame, NUM_FEATURES, mask=False)
+        np.testing.assert_allclose(padded_X[0, :len(expected[0][0])], expected[0][0], atol=1e-3)
+
+    def test_convert_recordings(self):
+        recordings_dir = os.path.join(self.directory, 'recordings')
+        os.makedirs(os.path.join(recordings_dir, 'teacher'))
+        landmarks = []
+        for name in ['a1', 'b2']:
+            shutil.copy(VIDEO_PATH, os.path.join(recordings_dir, 'teacher', f'{name}.mp4'))
+            landmarks.append(self.rng.random((12, 2, 21, 3), dtype=np.float32))
+            np.save(os.path.join(recordings_dir, 'teacher', f'{name}.npy'), landmarks[-1])
+        # Landmarks that were detected by the client are saved without a video
+        landmarks.append(self.rng.random((8, NUM_FEATURES), dtype=np.float32))
+        np.save(os.path.join(recordings_dir, 'teacher', 'c3.npy'), landmarks[-1])
+
+        output = os.path.join(self.directory, 'shards')
+        out = StringIO()
+        call_command('convert_to_shards', output, '--recordings', recordings_dir, '--dtype', 'float16',
+                     '--register', 'test_recording_shards', stdout=out)
+        self.assertIn('Wrote 3 samples', out.getvalue())
+
+        dataset = Dataset.objects.get(name='test_recording_shards')
+        try:
+            self.assertEqual(dataset.kind, 'shards')
+            shards = LandmarkShards(dataset.root_directory)
+            self.assertEqual([sample['source'] for sample in shards.samples], ['teacher/a1.mp4', 'teacher/b2.mp4', 'teacher/c3.npy'])
+            with open(os.path.join(output, INDEX_FILE)) as file:
+                self.assertEqual(json.load(file)['dtype'], 'float16')
+            np.testing.assert_allclose(shards[1], landmarks[1].reshape(12, -1), atol=1e-3)
+            np.testing.assert_allclose(shards[2], landmarks[2], atol=1e-3)
+
+            # The output directory already holds shards
+            with self.assertRaises(CommandError):
+                call_command('convert_to_shards', output, '--recordings', recordings_dir, stdout=StringIO())
+        finally:
+            dataset.delete()
+
+    # Recordings without saved landmarks are detected at the fps of the active model, like the saved ones
+    def test_convert_recordings_fps(self):
+        recordings_dir = os.path.join(self.directory, 'recordings')
+        os.makedirs(os.path.join(recordings_dir, 'teacher'))
+        shutil.copy(VIDEO_PATH, os.path.join(recordings_dir, 'teacher', 'c3.webm'))
+        landmarks = self.rng.random((12, 2, 21, 3), dtype=np.float32)
+
+        def iter_landmarks(videos, detector_path, **kwargs):
+            return [((landmarks, None, 18), None) for _ in videos]
+
+        active_model = TrainedModel.objects.get(is_active=True)
+        for args, expected_fps in [([], active_model.fps), (['--fps', '15'], 15.0)]:
+            output = os.path.join(self.directory, f'shards_{expected_fps}')
+            with patch.object(prep, 'iter_landmarks', side_effect=iter_landmarks) as detect:
+                call_command('convert_to_shards', output, '--recordings', recordings_dir, *args, stdout=StringIO())
+            self.assertEqual(detect.call_args.kwargs['target_fps'], expected_fps)
+            self.assertEqual(LandmarkShards(output).samples[0]['fps'], expected_fps)
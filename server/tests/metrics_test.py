@@ -0,0 +1,102 @@
+"""
+File: metrics_test.py
+Description: Unit tests for the metrics.py file and the /metrics endpoint.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from app import metrics, prediction, views
+import numpy as np
+
+
+class MetricsTest(TestCase):
+
+    def test_render_metrics(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.register(metrics.Counter('test_total', 'A counter', ['outcome']))
+        gauge = registry.register(metrics.Gauge('test_in_flight', 'A gauge'))
+        histogram = registry.register(metrics.Histogram('test_seconds', 'A histogram', buckets=(0.1, 1.0)))
+
+        counter.inc(outcome='correct')
+        counter.inc(2, outcome='wrong')
+        gauge.inc()
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_total counter', lines)
+        self.assertIn('test_total{outcome="correct"} 1', lines)
+        self.assertIn('test_total{outcome="wrong"} 2', lines)
+        self.assertIn('test_in_flight 1', lines)
+        # The buckets are cumulative
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count 3', lines)
+        self.assertIn('test_seconds_sum 5.55', lines)
+
+    def test_invalid_labels(self):
+        counter = metrics.Counter('test_labels_total', 'A counter', ['outcome'])
+        with self.assertRaises(ValueError):
+            counter.inc()
+        with self.assertRaises(ValueError):
+            counter.inc(outcome='correct', word='eat')
+        with self.assertRaises(ValueError):
+            metrics.metrics_registry.register(metrics.Counter('asl_predictions_total', 'Registered twice'))
+
+    def test_gauge_function(self):
+        gauge = metrics.Gauge('test_queue_depth', 'A gauge')
+        gauge.set_function(lambda: 7)
+        self.assertIn('test_queue_depth 7', gauge.collect())
+
+    def test_stage_timings(self):
+        count, _ = metrics.stage_duration.get(stage='test')
+        timings = metrics.start_request_timings()
+        with metrics.stage('test'):
+            pass
+        metrics.observe_stage('test', 0.25)
+
+        self.assertEqual(metrics.stage_duration.get(stage='test')[0], count + 2)
+        self.assertGreaterEqual(timings['test'], 0.25)
+        self.assertEqual(metrics.format_server_timing({'inference': 0.0123}), 'inference;dur=12.3')
+
+    def test_prediction_metrics(self):
+        active_model = prediction.registry.get()
+        features = np.random.rand(30, active_model.num_features).astype(np.float32)
+        payload = prediction.build_landmark_payload(features, active_model.fps, active_model.version)
+        request = RequestFactory().post('/upload-landmarks/', {
+            'word': active_model.words[0],
+            'landmarks': SimpleUploadedFile('landmarks.bin', payload),
+        })
+
+        outcomes = sum(metrics.predictions.get(outcome=outcome) for outcome in ['no_hands', 'low_confidence', 'correct', 'wrong'])
+        inference_count, _ = metrics.stage_duration.get(stage='inference')
+        with patch.object(metrics, 'SERVER_TIMING', True):
+            response = async_to_sync(views.upload_landmarks)(request)
+
+        self.assertIn('inference;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertEqual(sum(metrics.predictions.get(outcome=outcome) for outcome in ['no_hands', 'low_confidence', 'correct', 'wrong']), outcomes + 1)
+        self.assertEqual(metrics.stage_duration.get(stage='inference')[0], inference_count + 1)
+        self.assertEqual(metrics.requests_in_flight.get(), 0)
+
+        body = views.metrics_view(RequestFactory().get('/metrics')).content.decode()
+        self.assertIn('asl_prediction_stage_seconds_bucket{stage="inference",le="+Inf"}', body)
+        self.assertIn('asl_upload_size_bytes_count{kind="landmarks"}', body)
+        self.assertIn('asl_inference_queue_depth 0', body)
+        self.assertIn('asl_inference_wait_seconds_count', body)
@@ -1,6 +1,12 @@
 from unittest import TestCase
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync
 from app import prediction
+import numpy as np
 import time
+import asyncio
+import threading
 import os
 
 class PredictionTest(TestCase):
@@ -35,4 +41,158 @@ class PredictionTest(TestCase):
         print("Average latency: ", sum(latencies)/len(latencies))
         self.assertLessEqual(sum(latencies)/len(latencies), 5)
 
+    def test_scheduler_batches_concurrent_predictions(self):
+        active_model = prediction.registry.get()
+        scheduler = prediction.InferenceScheduler(max_batch_size=8, max_wait_ms=50)
+        inputs = [np.random.rand(active_model.max_frames, active_model.num_features).astype(np.float32) for _ in range(8)]
 
+        forward_passes, requests = prediction.metrics.inference_batch_size.get()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            outputs = list(executor.map(lambda x: scheduler.predict(active_model, x), inputs))
+
+        expected = active_model.model.predict(np.stack(inputs), verbose=0)
+        self.assertTrue(np.allclose(np.stack(outputs), expected, atol=1e-5))
+        # The batch sizes are recorded in the metrics registry
+        count, total = prediction.metrics.inference_batch_size.get()
+        self.assertEqual(total - requests, 8)
+        self.assertLess(count - forward_passes, 8)
+
+    def test_parse_landmark_payload(self):
+        active_model = prediction.registry.get()
+        features = np.random.rand(30, active_model.num_features).astype(np.float32)
+        payload = prediction.build_landmark_payload(features, active_model.fps, active_model.version)
+
+        parsed = prediction.parse_landmark_payload(payload, active_model)
+        self.assertEqual(parsed.dtype, np.float32)
+        self.assertTrue(np.allclose(parsed, features, atol=1e-3))
+        # float16 halves the upload size compared to float32
+        self.assertEqual(len(payload), prediction.LANDMARK_PAYLOAD_HEADER.size + features.size * 2)
+
+    def test_parse_landmark_payload_invalid(self):
+        active_model = prediction.registry.get()
+        features = np.random.rand(30, active_model.num_features)
+        payload = prediction.build_landmark_payload(features, active_model.fps)
+
+        with self.assertRaises(ValueError):
+            prediction.parse_landmark_payload(b'not a payload' * 5, active_model)
+        with self.assertRaises(ValueError):
+            prediction.parse_landmark_payload(payload[:-2], active_model)
+        with self.assertRaises(ValueError):
+            prediction.parse_landmark_payload(prediction.build_landmark_payload(features[:, :10], active_model.fps), active_model)
+        with self.assertRaises(prediction.ModelVersionMismatch):
+            prediction.parse_landmark_payload(prediction.build_landmark_payload(features, active_model.fps, '0' * 16), active_model)
+        features[0, 0] = np.nan
+        with self.assertRaises(ValueError):
+            prediction.parse_landmark_payload(prediction.build_landmark_payload(features, active_model.fps), active_model)
+
+    def test_predict_payload(self):
+        full_path = os.path.abspath('./tests/test_dataset/teacher/3e10848fd5.mp4')
+        active_model = prediction.registry.get()
+        with prediction.detector_pool.detector() as detector:
+            landmarks, _, _ = prediction.ld.get_landmark_array(full_path, detector, target_fps=active_model.fps)
+        payload = prediction.build_landmark_payload(landmarks.reshape(len(landmarks), -1), active_model.fps, active_model.version)
+
+        output = prediction.predict_payload(payload, 'teacher')
+        expected = prediction.predict_landmarks(active_model, landmarks.reshape(len(landmarks), -1), 'teacher')
+        self.assertEqual(output[0], expected[0])
+        self.assertAlmostEqual(output[1], expected[1], places=2)
+
+    def test_prediction_executor_rejects_when_full(self):
+        executor = prediction.PredictionExecutor(workers=1, max_pending=1)
+        release = threading.Event()
+
+        async def run():
+            first = asyncio.ensure_future(executor.run(release.wait, 10))
+            await asyncio.sleep(0.1)
+            with self.assertRaises(TimeoutError):
+                await executor.run(time.sleep, 0)
+            release.set()
+            await first
+            # The slot is free again once the first prediction is done
+            return await executor.run(sum, [1, 2])
+
+        self.assertEqual(async_to_sync(run)(), 3)
+
+    def test_bucketed_prediction_matches_padded(self):
+        active_model = prediction.registry.get()
+        for length in [5, active_model.buckets[0], active_model.buckets[0] + 1, active_model.max_frames]:
+            features = np.random.rand(length, active_model.num_features).astype(np.float32)
+            padded = np.zeros((1, active_model.max_frames, active_model.num_features), dtype=np.float32)
+            padded[0, :length] = features
+
+            output = prediction.get_probabilities(active_model, features)
+            expected = active_model.model.predict(padded, verbose=0)[0]
+            self.assertTrue(np.allclose(output, expected, atol=1e-5))
+
+    def test_get_bucket_length(self):
+        active_model = prediction.registry.get()
+        self.assertEqual(active_model.buckets[-1], active_model.max_frames)
+        self.assertEqual(active_model.get_bucket_length(1), active_model.buckets[0])
+        self.assertEqual(active_model.get_bucket_length(active_model.buckets[0] + 1), active_model.buckets[1])
+        self.assertEqual(active_model.get_bucket_length(active_model.max_frames + 50), active_model.max_frames)
+
+    def test_overlong_clip(self):
+        active_model = prediction.registry.get()
+        max_frames = active_model.max_frames
+        features = np.random.rand(2 * max_frames + 7, active_model.num_features).astype(np.float32)
+
+        windows = prediction.get_windows(features, max_frames, 'window', 0.5)
+        self.assertTrue(all(len(window) == max_frames for window in windows))
+        self.assertTrue(np.array_equal(windows[0], features[:max_frames]))
+        self.assertTrue(np.array_equal(windows[-1], features[-max_frames:]))
+
+        truncated = prediction.get_windows(features, max_frames, 'truncate')
+        self.assertEqual(len(truncated), 1)
+        self.assertTrue(np.array_equal(truncated[0], features[:max_frames]))
+
+        with self.assertRaises(ValueError):
+            prediction.get_windows(features, max_frames, 'unknown')
+
+        # The windows of the default policy are averaged
+        probabilities = prediction.get_probabilities(active_model, features)
+        expected = active_model.model.predict(np.stack(prediction.get_windows(features, max_frames)), verbose=0).mean(axis=0)
+        self.assertEqual(probabilities.shape, (len(active_model.words),))
+        self.assertTrue(np.allclose(probabilities, expected, atol=1e-5))
+
+    def test_predict_latency_by_length(self):
+        active_model = prediction.registry.get()
+        runs = 10
+
+        for length in sorted(set([20, 60, 120, active_model.max_frames])):
+            features = np.random.rand(length, active_model.num_features).astype(np.float32)
+            padded = np.zeros((active_model.max_frames, active_model.num_features), dtype=np.float32)
+            padded[:length] = features
+            prediction.get_probabilities(active_model, features)
+
+            start_time = time.perf_counter()
+            for _ in range(runs):
+                prediction.scheduler.predict(active_model, padded)
+            padded_latency = (time.perf_counter() - start_time) / runs
+
+            start_time = time.perf_counter()
+            for _ in range(runs):
+                prediction.get_probabilities(active_model, features)
+            bucketed_latency = (time.perf_counter() - start_time) / runs
+
+            print(f"{length} frames: padded {padded_latency * 1000:.1f} ms, bucketed {bucketed_latency * 1000:.1f} ms")
+
+    # Test if every window of a clip is padded to the smallest bucket that fits it, not to max_frames
+    def test_bucket_and_window_selection(self):
+        active_model = prediction.registry.get()
+        max_frames = active_model.max_frames
+        submit = prediction.scheduler.submit
+
+        for length in sorted(set([1, 20, active_model.buckets[0], active_model.buckets[0] + 1, max_frames, 2 * max_frames + 7])):
+            features = np.random.rand(length, active_model.num_features).astype(np.float32)
+            with patch.object(prediction.scheduler, 'submit', side_effect=submit) as submitted:
+                prediction.get_probabilities(active_model, features)
+
+            inputs = [call.args[1] for call in submitted.call_args_list]
+            windows = prediction.get_windows(features, max_frames)
+            self.assertEqual(len(inputs), len(windows))
+            for prediction_X, window in zip(inputs, windows):
+                self.assertEqual(prediction_X.shape, (active_model.get_bucket_length(len(window)), active_model.num_features))
+                self.assertTrue(np.array_equal(prediction_X[:len(window)], window))
+                self.assertFalse(np.any(prediction_X[len(window):]))
+            if length < active_model.buckets[0]:
+                self.assertEqual(inputs[0].shape[0], active_model.buckets[0])
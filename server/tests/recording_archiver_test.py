@@ -0,0 +1,139 @@
+"""
+File: recording_archiver_test.py
+Description: Unit tests for the recording_archiver.py file.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+from threading import Event
+from app import recording_archiver, prediction
+from app.recording_archiver import RecordingArchiver
+import numpy as np
+import tempfile
+import shutil
+import time
+import os
+
+VIDEO_PATH = './tests/test_dataset/teacher/3e10848fd5.mp4'
+
+
+class RecordingArchiverTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.recordings_dir = os.path.join(self.directory, 'recordings')
+        self.staging_dir = os.path.join(self.directory, 'staging')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Copy the test video to a temporary file, like an upload
+    def make_upload(self):
+        upload_path = os.path.join(self.directory, f'upload_{recording_archiver.generate_random_hash()}.mp4')
+        shutil.copy(VIDEO_PATH, upload_path)
+        return upload_path
+
+    def test_archive_recording(self):
+        archiver = RecordingArchiver(self.recordings_dir, 4, self.staging_dir)
+        landmarks = np.random.rand(12, 2, 21, 3).astype(np.float32)
+
+        upload_path = self.make_upload()
+        self.assertTrue(archiver.submit(upload_path, 'teacher', landmarks))
+        # The request deletes its temporary file right away
+        os.remove(upload_path)
+        archiver.flush()
+
+        files = sorted(os.listdir(os.path.join(self.recordings_dir, 'teacher')))
+        self.assertEqual(len(files), 2)
+        video_file, landmarks_file = sorted(files, key=lambda name: name.endswith('.npy'))
+        with open(VIDEO_PATH, 'rb') as original, open(os.path.join(self.recordings_dir, 'teacher', video_file), 'rb') as saved:
+            self.assertEqual(original.read(), saved.read())
+        self.assertTrue(np.array_equal(np.load(os.path.join(self.recordings_dir, 'teacher', landmarks_file)), landmarks))
+        # No intermediate files are left behind
+        self.assertEqual(os.listdir(archiver.staging_dir), [])
+
+    # The word comes from the request, so it must not write outside of the recordings directory
+    def test_reject_invalid_word(self):
+        for word in ['../../evil', '..', '', 'a/b']:
+            with self.assertRaises(ValueError):
+                recording_archiver.save_recording(VIDEO_PATH, word, recordings_dir=self.recordings_dir)
+        self.assertFalse(os.path.exists(self.recordings_dir))
+
+        # Only recordings of words the model knows are queued
+        active_model = prediction.registry.get()
+        landmarks = np.random.rand(12, 2, 21, 3).astype(np.float32)
+        with patch.dict(os.environ, {'SAVE_RECORDINGS': 'True'}), \
+                patch.object(prediction.ld, 'get_landmark_array', return_value=(landmarks, None, 12)), \
+                patch.object(prediction.recording_archiver, 'submit') as submit:
+            prediction.predict(VIDEO_PATH, '../../evil')
+            submit.assert_not_called()
+            prediction.predict(VIDEO_PATH, active_model.words[0])
+            submit.assert_called_once()
+            video_path, word, saved_landmarks = submit.call_args.args
+            self.assertEqual((video_path, word), (VIDEO_PATH, active_model.words[0]))
+            self.assertTrue(np.array_equal(saved_landmarks, landmarks.reshape(12, -1)))
+
+    # Landmarks detected by the client are archived without a video
+    def test_archive_payload(self):
+        active_model = prediction.registry.get()
+        features = np.random.rand(12, active_model.num_features).astype(np.float16)
+        payload = prediction.build_landmark_payload(features, active_model.fps, active_model.version)
+        archiver = RecordingArchiver(self.recordings_dir, 4, self.staging_dir)
+
+        with patch.dict(os.environ, {'SAVE_RECORDINGS': 'True'}), patch.object(prediction, 'recording_archiver', archiver):
+            prediction.predict_payload(payload, 'teacher')
+            archiver.flush()
+
+        files = os.listdir(os.path.join(self.recordings_dir, 'teacher'))
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.npy'))
+        self.assertTrue(np.array_equal(np.load(os.path.join(self.recordings_dir, 'teacher', files[0])), features.astype(np.float32)))
+
+    def test_queue_full_drops_recordings(self):
+        archiver = RecordingArchiver(self.recordings_dir, 1, self.staging_dir)
+        release = Event()
+        save_recording = recording_archiver.save_recording
+
+        def blocked_save(*args, **kwargs):
+            release.wait(10)
+            return save_recording(*args, **kwargs)
+
+        dropped = recording_archiver.recordings_saved.get(result='dropped')
+        with patch.object(recording_archiver, 'save_recording', blocked_save):
+            # The first recording is taken by the writer, the second waits in the queue
+            self.assertTrue(archiver.submit(self.make_upload(), 'teacher'))
+            while archiver._queue.qsize() > 0:
+                time.sleep(0.01)
+            self.assertTrue(archiver.submit(self.make_upload(), 'teacher'))
+            self.assertFalse(archiver.submit(self.make_upload(), 'teacher'))
+            release.set()
+            archiver.flush()
+
+        self.assertEqual(recording_archiver.recordings_saved.get(result='dropped'), dropped + 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.recordings_dir, 'teacher'))), 2)
+        self.assertEqual(os.listdir(archiver.staging_dir), [])
+
+    def test_clean_staging(self):
+        # A process id that can't be running
+        stale_dir = os.path.join(self.staging_dir, '999999999')
+        other_dir = os.path.join(self.staging_dir, 'other')
+        os.makedirs(stale_dir)
+        os.makedirs(other_dir)
+
+        archiver = RecordingArchiver(self.recordings_dir, 1, self.staging_dir)
+        archiver._clean_staging()
+
+        self.assertFalse(os.path.exists(stale_dir))
+        self.assertTrue(os.path.exists(other_dir))
+        self.assertTrue(os.path.isdir(archiver.staging_dir))
@@ -15,10 +15,19 @@ License: MIT License (see LICENSE file for details)
 """
 
 from unittest import TestCase
+from unittest.mock import patch
+from app import retrain as retrain_module
 from app.retrain import retrain
 from app.models import TrainingJob, TrainedModel, Dataset
+import numpy as np
+import tempfile
+import shutil
+import sys
 import os
 
+sys.path.insert(1, 'model_training/')
+from landmark_shards import ShardWriter
+
 class RetrainTest(TestCase):
     def test_retrain(self):
 
@@ -61,4 +70,49 @@ class RetrainTest(TestCase):
         trained_model.delete()
         os.remove("models/test_model.keras")
         os.remove("models/test_model.env")
-        
\ No newline at end of file
+        
+
+    def test_retrain_shards(self):
+        base_model = TrainedModel.objects.get(name='draft_model')
+        words = base_model.words.split(',')
+        shards_dir = tempfile.mkdtemp()
+
+        # Create a landmark shard dataset, no videos are decoded
+        rng = np.random.default_rng(0)
+        with ShardWriter(shards_dir, dtype='float16') as writer:
+            for i in range(8):
+                writer.add(rng.random((20 + i, base_model.num_features), dtype=np.float32), words[i % len(words)])
+        dataset = Dataset.objects.create(name='test_shards', kind='shards', root_directory=shards_dir)
+        job = TrainingJob.objects.create(name='test_shards_model', dataset=dataset, base_model=base_model)
+
+        try:
+            trained_model = retrain(job.id)
+            self.assertEqual(trained_model.max_frames, 27)
+            self.assertEqual(trained_model.words, base_model.words)
+            trained_model.delete()
+        finally:
+            dataset.delete()
+            shutil.rmtree(shards_dir, ignore_errors=True)
+            for path in ["models/test_shards_model.keras", "models/test_shards_model.env"]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # The landmarks extracted by a job that fails are deleted as well
+    def test_retrain_failure_cleans_up(self):
+        base_model = TrainedModel.objects.get(name='draft_model')
+        data_dir = tempfile.mkdtemp()
+        dataset = Dataset.objects.create(name='test_cleanup_dataset', root_directory='./tests/test_dataset')
+        job = TrainingJob.objects.create(name='test_cleanup_model', dataset=dataset, base_model=base_model)
+
+        def get_data(*args, output_dir=None, **kwargs):
+            os.makedirs(output_dir)
+            raise RuntimeError("Extraction failed")
+
+        try:
+            with patch.object(retrain_module, 'TRAINING_DATA_DIR', data_dir), patch.object(retrain_module.prep, 'get_data', get_data):
+                with self.assertRaises(RuntimeError):
+                    retrain(job.id)
+            self.assertEqual(os.listdir(data_dir), [])
+        finally:
+            dataset.delete()
+            shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,162 @@
+from unittest import TestCase
+from unittest.mock import patch
+from contextlib import contextmanager
+from threading import BoundedSemaphore
+from types import SimpleNamespace
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from aslproject.asgi import application
+from app import prediction, streaming
+from app.streaming import FRAME_HEADER
+from app.views import prediction_result
+from app.recording_archiver import RecordingArchiver
+import numpy as np
+import cv2 as cv
+import tempfile
+import shutil
+import json
+import os
+
+class StreamingTest(TestCase):
+
+    # Send the messages over the WebSocket and return everything the server sent back
+    @async_to_sync
+    async def stream(self, messages, path='/ws/recognize/', query_string=b'word=teacher'):
+        communicator = ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': path,
+            'query_string': query_string,
+            'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        output = [await communicator.receive_output(timeout=60)]
+        if output[0]['type'] == 'websocket.close':
+            return output
+
+        for message in messages:
+            await communicator.send_input({'type': 'websocket.receive', **message})
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'stop'})})
+
+        while output[-1]['type'] != 'websocket.close':
+            output.append(await communicator.receive_output(timeout=60))
+        await communicator.wait(timeout=10)
+        return output
+
+    def get_results(self, output):
+        return [json.loads(message['text']) for message in output if message['type'] == 'websocket.send']
+
+    def test_stream_landmarks(self):
+        active_model = prediction.registry.get()
+        features = np.random.rand(40, active_model.num_features).astype(np.float32)
+        messages = [
+            {'bytes': prediction.build_landmark_payload(features[i:i + 5], active_model.fps, active_model.version)}
+            for i in range(0, len(features), 5)
+        ]
+
+        output = self.stream(messages)
+        self.assertEqual(output[0]['type'], 'websocket.accept')
+        results = self.get_results(output)
+        self.assertGreater(len(results), 1)
+        self.assertTrue(all(result['type'] == 'provisional' for result in results[:-1]))
+        self.assertEqual(results[-1]['type'], 'final')
+
+        # The final prediction uses every streamed frame
+        expected = prediction.predict_landmarks(active_model, features.astype(np.float16).astype(np.float32), 'teacher')
+        self.assertEqual(results[-1], {'type': 'final', **prediction_result(expected, 'teacher')[0]})
+
+    # Encode frames of a solid color as stream messages at the model fps
+    def make_frame_messages(self, num_frames):
+        active_model = prediction.registry.get()
+        messages = []
+        for i in range(num_frames):
+            _, image = cv.imencode('.png', np.full((48, 64, 3), i * 8, dtype=np.uint8))
+            messages.append({'bytes': FRAME_HEADER.pack(i * 1000 / active_model.fps) + image.tobytes()})
+        return messages
+
+    @patch.object(streaming, 'stream_detector_slots', BoundedSemaphore(1))
+    def test_stream_video(self):
+        active_model = prediction.registry.get()
+        messages = []
+        for timestamp, frame in prediction.ld.sample_frames('./tests/test_dataset/teacher/3e10848fd5.mp4', active_model.fps):
+            _, image = cv.imencode('.png', frame)
+            messages.append({'bytes': FRAME_HEADER.pack(timestamp) + image.tobytes()})
+
+        output = self.stream(messages)
+        results = self.get_results(output)
+        self.assertEqual(results[-1]['type'], 'final')
+        self.assertIn('result', results[-1])
+        self.assertTrue(any(result['type'] == 'provisional' for result in results))
+
+    def test_stream_invalid_message(self):
+        output = self.stream([{'bytes': b'\x00' * 8 + b'not an image'}])
+        results = self.get_results(output)
+        self.assertIn('error', results[-1])
+        self.assertEqual(output[-1]['type'], 'websocket.close')
+
+    def test_stream_invalid_text(self):
+        for text in ['not json', '[]', json.dumps({'type': 'unknown'})]:
+            output = self.stream([{'text': text}])
+            self.assertIn('error', self.get_results(output)[-1])
+            self.assertEqual(output[-1], {'type': 'websocket.close', 'code': 1008})
+
+    # An idle stream is closed, so its detector goes back to the pool
+    @patch.object(streaming, 'STREAM_IDLE_TIMEOUT', 0.5)
+    @async_to_sync
+    async def test_stream_idle_timeout(self):
+        communicator = ApplicationCommunicator(application, {'type': 'websocket', 'path': '/ws/recognize/', 'query_string': b'', 'headers': []})
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(timeout=60))['type'], 'websocket.accept')
+
+        result = json.loads((await communicator.receive_output(timeout=10))['text'])
+        self.assertIn('No message received', result['error'])
+        self.assertEqual(await communicator.receive_output(timeout=10), {'type': 'websocket.close', 'code': 1008})
+        await communicator.wait(timeout=10)
+
+    def test_unknown_route(self):
+        output = self.stream([], path='/ws/unknown/')
+        self.assertEqual(output, [{'type': 'websocket.close', 'code': 1000}])
+
+    # Streams can't take the detectors of the uploads, the client is told to upload the video instead
+    @patch.object(streaming, 'stream_detector_slots', BoundedSemaphore(0))
+    def test_stream_detector_limit(self):
+        output = self.stream(self.make_frame_messages(1))
+        self.assertEqual(self.get_results(output), [])
+        self.assertEqual(output[-1]['type'], 'websocket.close')
+        self.assertEqual(output[-1]['code'], 1013)
+
+    # The frames and landmarks of a stream are archived like an upload
+    @patch.object(streaming, 'stream_detector_slots', BoundedSemaphore(1))
+    def test_stream_archive(self):
+        active_model = prediction.registry.get()
+        hand = [SimpleNamespace(x=0.5, y=0.25, z=0.0)] * 21
+
+        class FakeDetector:
+            def detect(self, mp_image):
+                return SimpleNamespace(hand_landmarks=[hand])
+
+        @contextmanager
+        def detector():
+            yield FakeDetector()
+
+        directory = tempfile.mkdtemp()
+        archiver = RecordingArchiver(os.path.join(directory, 'recordings'), 4, os.path.join(directory, 'staging'))
+        try:
+            with patch.dict(os.environ, {'SAVE_RECORDINGS': 'True'}), \
+                    patch.object(prediction, 'recording_archiver', archiver), \
+                    patch.object(streaming.detector_pool, 'detector', detector), \
+                    patch.object(streaming.ld, 'to_mp_image', lambda frame: frame):
+                output = self.stream(self.make_frame_messages(12))
+                archiver.flush()
+
+            self.assertIn('result', self.get_results(output)[-1])
+            word_dir = os.path.join(directory, 'recordings', 'teacher')
+            files = sorted(os.listdir(word_dir), key=lambda name: name.endswith('.npy'))
+            self.assertEqual(len(files), 2)
+            video_file, landmarks_file = files
+            self.assertTrue(video_file.endswith('.mp4'))
+            self.assertEqual(np.load(os.path.join(word_dir, landmarks_file)).shape, (12, active_model.num_features))
+            capture = cv.VideoCapture(os.path.join(word_dir, video_file))
+            self.assertEqual(int(capture.get(cv.CAP_PROP_FRAME_COUNT)), 12)
+            capture.release()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,76 @@
+"""
+File: training_checkpoint_test.py
+Description: Unit tests for the training_checkpoint.py file.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from app import training_checkpoint
+from app.training_checkpoint import JobCheckpoint, ResumableEarlyStopping
+import numpy as np
+import keras
+import tempfile
+
+class TrainingCheckpointTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fingerprint = {'dataset': 1, 'words': ['eat', 'no']}
+        rng = np.random.default_rng(0)
+        self.X = rng.random((32, 4), dtype=np.float32)
+        self.y = rng.integers(0, 2, 32)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_model(self):
+        model = keras.Sequential([keras.Input((4,)), keras.layers.Dense(2, activation='softmax')])
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy')
+        return model
+
+    def get_checkpoint(self, early_stopping=None, should_stop=None, fingerprint=None):
+        return JobCheckpoint(1, fingerprint or self.fingerprint, early_stopping, should_stop, checkpoint_dir=self.tmp_dir.name)
+
+    def test_resume(self):
+        model = self.get_model()
+        early_stopping = ResumableEarlyStopping(monitor='loss', patience=3, restore_best_weights=True)
+        saved_epochs = []
+        checkpoint = JobCheckpoint(1, self.fingerprint, early_stopping, on_save=saved_epochs.append, checkpoint_dir=self.tmp_dir.name)
+        model.fit(self.X, self.y, epochs=2, batch_size=8, callbacks=[early_stopping, checkpoint], verbose=0)
+        self.assertEqual(saved_epochs, [1, 2])
+
+        # The resumed model has the weights and optimizer state of the last epoch
+        resumed_early_stopping = ResumableEarlyStopping(monitor='loss', patience=3, restore_best_weights=True)
+        resumed_model, initial_epoch = self.get_checkpoint(resumed_early_stopping).load()
+        self.assertEqual(initial_epoch, 2)
+        self.assertEqual(int(resumed_model.optimizer.iterations), int(model.optimizer.iterations))
+        self.assertEqual(resumed_early_stopping.resume_state, early_stopping.get_state())
+        self.assertIsNotNone(resumed_early_stopping.resume_best_weights)
+
+        # A checkpoint of different training data isn't used
+        self.assertIsNone(self.get_checkpoint(fingerprint={'dataset': 2}).load())
+
+        checkpoint.clear()
+        self.assertIsNone(self.get_checkpoint().load())
+
+    def test_stop_between_batches(self):
+        self.addCleanup(setattr, training_checkpoint, 'CANCEL_CHECK_INTERVAL', training_checkpoint.CANCEL_CHECK_INTERVAL)
+        training_checkpoint.CANCEL_CHECK_INTERVAL = 0
+        model = self.get_model()
+        checkpoint = self.get_checkpoint(should_stop=lambda: True)
+        model.fit(self.X, self.y, epochs=5, batch_size=8, callbacks=[checkpoint], verbose=0)
+
+        self.assertTrue(checkpoint.cancelled)
+        # Only one batch was trained, and the unfinished epoch wasn't saved
+        self.assertEqual(int(model.optimizer.iterations), 1)
+        self.assertIsNone(self.get_checkpoint().load())
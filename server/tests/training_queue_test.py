@@ -0,0 +1,134 @@
+"""
+File: training_queue_test.py
+Description: Unit tests for the training_queue.py file.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from datetime import timedelta
+from django.utils import timezone
+from app import training_queue
+from app.shared_state import request_stop, is_stop_requested
+from app.models import TrainingJob, TrainedModel, Dataset
+import numpy as np
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.insert(1, 'model_training/')
+from landmark_shards import ShardWriter
+
+class TrainingQueueTest(TestCase):
+
+    def setUp(self):
+        self.dataset = Dataset.objects.create(name='queue_test_dataset', data_file='queue_test_dataset.zip', root_directory='./tests/test_dataset')
+        self.job = TrainingJob.objects.create(name='queue_test_model', dataset=self.dataset)
+
+    def tearDown(self):
+        self.dataset.delete()
+
+    def get_job(self):
+        return TrainingJob.objects.get(id=self.job.id)
+
+    def test_claim_next_job(self):
+        self.assertIsNone(training_queue.claim_next_job('worker-1'))
+        self.assertTrue(training_queue.queue_job(self.job.id))
+        self.assertFalse(training_queue.queue_job(self.job.id))
+
+        self.assertEqual(training_queue.claim_next_job('worker-1'), self.job.id)
+        # A job can only be claimed once
+        self.assertIsNone(training_queue.claim_next_job('worker-2'))
+
+        job = self.get_job()
+        self.assertEqual(job.status, 'IN_PROGRESS')
+        self.assertEqual(job.claimed_by, 'worker-1')
+        self.assertEqual(job.attempts, 1)
+
+    def test_requeue_stale_jobs(self):
+        training_queue.queue_job(self.job.id)
+        training_queue.claim_next_job('worker-1')
+        TrainingJob.objects.filter(id=self.job.id).update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+
+        training_queue.requeue_stale_jobs(heartbeat_timeout=60, max_attempts=2)
+        self.assertEqual(self.get_job().status, 'QUEUED')
+
+        # The second crash uses up the attempts
+        training_queue.claim_next_job('worker-2')
+        TrainingJob.objects.filter(id=self.job.id).update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+        training_queue.requeue_stale_jobs(heartbeat_timeout=60, max_attempts=2)
+        job = self.get_job()
+        self.assertEqual(job.status, 'ERROR')
+        self.assertIn('worker-2', job.error_message)
+
+    def test_stop_job(self):
+        # A queued job is taken out of the queue right away
+        training_queue.queue_job(self.job.id)
+        self.assertFalse(request_stop(self.job.id))
+        self.assertTrue(training_queue.unqueue_job(self.job.id))
+        self.assertEqual(self.get_job().status, 'PENDING')
+
+        # A running job is stopped by its worker
+        training_queue.queue_job(self.job.id)
+        training_queue.claim_next_job('worker-1')
+        self.assertTrue(request_stop(self.job.id))
+        self.assertTrue(is_stop_requested(self.job.id))
+        training_queue.release_job(self.job.id, 'worker-1')
+        job = self.get_job()
+        self.assertEqual(job.status, 'PENDING')
+        self.assertFalse(job.cancel_requested)
+
+    def test_worker_records_failed_job(self):
+        # The job has no base model, so the training fails in the job process
+        training_queue.queue_job(self.job.id)
+        worker = training_queue.TrainingWorker(poll_interval=0.1, niceness=0)
+        worker.run(once=True)
+
+        job = self.get_job()
+        self.assertEqual(job.status, 'ERROR')
+        self.assertEqual(job.claimed_by, '')
+        self.assertIn('Traceback', job.error_message)
+        # The peak memory of the job process is recorded
+        self.assertGreater(job.peak_memory, 0)
+
+    def test_worker_completes_job(self):
+        # A landmark shard dataset, so the job process trains without detecting hands in videos
+        base_model = TrainedModel.objects.get(name='draft_model')
+        words = base_model.words.split(',')
+        shards_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        with ShardWriter(shards_dir, dtype='float16') as writer:
+            for i in range(8):
+                writer.add(rng.random((20 + i, base_model.num_features), dtype=np.float32), words[i % len(words)])
+        dataset = Dataset.objects.create(name='queue_test_shards', kind='shards', root_directory=shards_dir)
+        job = TrainingJob.objects.create(name='queue_test_shards_model', dataset=dataset, base_model=base_model)
+
+        try:
+            # The job is claimed and run in a job process, which only has the settings of the database
+            training_queue.queue_job(job.id)
+            worker = training_queue.TrainingWorker(poll_interval=0.1, niceness=0)
+            worker.run(once=True)
+
+            job = TrainingJob.objects.get(id=job.id)
+            self.assertEqual(job.status, 'COMPLETED', job.error_message)
+            self.assertEqual(job.claimed_by, '')
+            self.assertEqual(job.output_model.words, base_model.words)
+            self.assertEqual(job.output_model.num_features, base_model.num_features)
+            self.assertEqual(job.output_model.fps, base_model.fps)
+            job.output_model.delete()
+        finally:
+            dataset.delete()
+            shutil.rmtree(shards_dir, ignore_errors=True)
+            for path in ["models/queue_test_shards_model.keras", "models/queue_test_shards_model.env"]:
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,84 @@
+"""
+File: warmup_test.py
+Description: Unit tests for the warmup.py file and the readiness endpoint.
+
+Contributors:
+Michael Koenig
+
+Created: 2026-10-18
+Last Modified: 2026-10-18
+
+Project: A Sign From Above
+URL: https://git.chalmers.se/courses/dit826/2024/group4
+
+License: MIT License (see LICENSE file for details)
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.test import RequestFactory
+from aslproject import asgi
+from app import warmup, views
+import json
+
+
+class WarmUpTest(TestCase):
+
+    def test_warm_model_and_inference(self):
+        active_model = warmup.warm_model()
+        self.assertIsNotNone(active_model)
+        warmup.warm_inference(active_model)
+
+    def test_warm_up_steps(self):
+        warm_up = warmup.WarmUp()
+        with patch.object(warmup, 'warm_detectors'):
+            durations = warm_up.run()
+
+        self.assertEqual(list(durations), ['model', 'detector', 'inference'])
+        self.assertTrue(warm_up.ready)
+        self.assertEqual(warm_up.get_status()['status'], 'ready')
+
+    def test_warm_up_failure(self):
+        warm_up = warmup.WarmUp()
+        with patch.object(warmup, 'warm_detectors', side_effect=FileNotFoundError("The hand_landmarker Model not found")):
+            with self.assertRaises(FileNotFoundError):
+                warm_up.run()
+
+        self.assertFalse(warm_up.ready)
+        self.assertEqual(warm_up.get_status()['status'], 'error')
+
+    def test_ready_endpoint(self):
+        request = RequestFactory().get('/ready/')
+
+        warm_up = warmup.WarmUp()
+        warm_up.started = True
+        with patch.object(views, 'warm_up', warm_up):
+            response = views.ready(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.content)['status'], 'warming up')
+
+        warm_up.ready = True
+        with patch.object(views, 'warm_up', warm_up):
+            response = views.ready(request)
+        self.assertEqual(response.status_code, 200)
+
+    def test_lifespan_startup(self):
+        async def run():
+            communicator = ApplicationCommunicator(asgi.application, {'type': 'lifespan'})
+            await communicator.send_input({'type': 'lifespan.startup'})
+            startup = await communicator.receive_output(5)
+            await communicator.send_input({'type': 'lifespan.shutdown'})
+            shutdown = await communicator.receive_output(5)
+            await communicator.wait(5)
+            return startup, shutdown
+
+        warm_up = warmup.WarmUp()
+        with patch.object(asgi, 'warm_up', warm_up):
+            startup, shutdown = async_to_sync(run)()
+
+        self.assertEqual(startup['type'], 'lifespan.startup.complete')
+        self.assertEqual(shutdown['type'], 'lifespan.shutdown.complete')
+        # The warm-up runs in the background, the server doesn't wait for it
+        self.assertTrue(warm_up.started)